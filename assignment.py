@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+assignment.py
+
+Assignment state used by the labeling backend to balance foundation sets across participants.
+
+`SetCounts` keeps how many participants have been assigned each foundation set (pairs, by
+default) in process memory, so choosing the least-used set on /register never scans the
+participants table. The counts are seeded from the database once per study, bumped on every
+successful insert, and periodically reconciled with the database (which also picks up
+registrations made by other worker processes).
+
+`AssignmentEngine` picks the least-used set of k foundations out of F in O(log C) (C = F choose k)
+from a priority queue, so studies can assign 3 or 4 foundations out of 9+ without enumerating
+every combination on each registration. `SetCounts.pick` keeps one engine in sync with the counts.
+
+`ExposureCounts` counts how often each sample of one pool version has been assigned, so studies
+with exposure balancing draw rarely-seen samples more often (see sample_pool.sample_weighted).
+
+`RatingTargets` tracks ratings per foundation set and per sample against a study's targets, so
+registrations steer away from saturated sets and samples and stop once every target is met.
+"""
+
+import heapq
+import random
+import threading
+import time
+from collections import Counter
+from itertools import combinations
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+FoundationSet = Tuple[str, ...]
+# A sample of one pool version: (pool version, sample id)
+ItemKey = Tuple[str, int]
+
+
+def set_key(foundations: Iterable[str]) -> FoundationSet:
+    """Canonical (sorted) key of a foundation set, as stored in `SetCounts`."""
+    return tuple(sorted(foundations))
+
+
+class AssignmentEngine:
+    """Priority queue of the k-of-F foundation sets keyed by assignment count.
+
+    Heap entries are (count, random tie-break, set); equal counts pop in random order. A count
+    changed from outside (`adjust`) pushes a new entry and leaves the old one in the heap, where
+    it is skipped when popped (lazy deletion); the heap is rebuilt when stale entries pile up.
+    Building is O(C); `pick` and `adjust` are O(log C) amortized. Sets in `exclude` are never picked
+    (unless that would leave none).
+    """
+
+    def __init__(self, foundations: Sequence[str], set_size: int, counts: Optional[Dict[FoundationSet, int]] = None,
+                 rng: Optional[random.Random] = None, exclude: FrozenSet[FoundationSet] = frozenset()):
+        if not 1 <= set_size <= len(foundations):
+            raise ValueError(f"cannot assign {set_size} of {len(foundations)} foundations")
+        self.foundations = tuple(sorted(foundations))
+        self.set_size = set_size
+        self.exclude = exclude
+        self._rng = rng or random.Random()
+        counts = counts or {}
+        sets = [s for s in combinations(self.foundations, set_size) if s not in exclude]
+        self._counts: Dict[FoundationSet, int] = {s: counts.get(s, 0)
+                                                 for s in sets or combinations(self.foundations, set_size)}
+        self._rebuild()
+
+    def _rebuild(self):
+        self._heap: List[Tuple[int, float, FoundationSet]] = [(n, self._rng.random(), s) for s, n in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def count(self, foundation_set: FoundationSet) -> int:
+        return self._counts.get(foundation_set, 0)
+
+    def peek(self) -> FoundationSet:
+        """The least-used set (without assigning it)."""
+        heap = self._heap
+        while heap[0][0] != self._counts[heap[0][2]]:
+            heapq.heappop(heap)
+        return heap[0][2]
+
+    def pick(self) -> FoundationSet:
+        """Assign the least-used set (ties broken at random) and return it."""
+        chosen = self.peek()
+        n = self._counts[chosen] + 1
+        self._counts[chosen] = n
+        heapq.heapreplace(self._heap, (n, self._rng.random(), chosen))
+        return chosen
+
+    def adjust(self, foundation_set: FoundationSet, delta: int):
+        """Change a set's count by `delta` (an assignment recorded or released elsewhere)."""
+        if foundation_set not in self._counts or not delta:
+            return
+        n = self._counts[foundation_set] + delta
+        self._counts[foundation_set] = n
+        heapq.heappush(self._heap, (n, self._rng.random(), foundation_set))
+        if len(self._heap) > 2 * len(self._counts) + 64:
+            self._rebuild()
+
+
+class SetCounts:
+    """Thread-safe in-memory counts of assigned foundation sets.
+
+    `seed` / `reconcile` replace the counts with a fresh database read. Assignments recorded
+    while that read is running are re-applied on top of it, so a reconcile never loses a
+    concurrent registration (one that committed just before the read started may be counted
+    twice until the next reconcile).
+    """
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._pending: Optional[Counter] = None  # assignments recorded during a reconcile read
+        self.seeded = False
+        self.reconciled_at = 0.0
+        self.drift = 0  # total absolute difference found by the last reconcile
+        self._engine: Optional[AssignmentEngine] = None
+
+    def record(self, foundations: Iterable[str], n: int = 1):
+        key = set_key(foundations)
+        with self._lock:
+            self._add(key, n)
+            if self._engine is not None:
+                self._engine.adjust(key, n)
+
+    def _add(self, key: FoundationSet, n: int):
+        self._counts[key] += n
+        if self._pending is not None:
+            self._pending[key] += n
+
+    def pick(self, foundations: Sequence[str], set_size: int,
+             exclude: FrozenSet[FoundationSet] = frozenset()) -> FoundationSet:
+        """Choose the least-used set of `set_size` of `foundations` (other than those in `exclude`) and count it
+        as assigned.
+
+        Give the assignment back with `release` if it is not used (e.g. the insert failed).
+        """
+        with self._lock:
+            engine = self._engine
+            if engine is None or engine.set_size != set_size or engine.foundations != tuple(sorted(foundations)) \
+                    or engine.exclude != exclude:
+                engine = self._engine = AssignmentEngine(foundations, set_size, self._counts, exclude=exclude)
+            chosen = engine.pick()
+            self._add(chosen, 1)
+        return chosen
+
+    def release(self, foundations: Iterable[str]):
+        self.record(foundations, -1)
+
+    def get(self, foundations: Iterable[str]) -> int:
+        return self._counts.get(set_key(foundations), 0)
+
+    def counts(self) -> Dict[FoundationSet, int]:
+        """A copy of the current counts."""
+        with self._lock:
+            return dict(self._counts)
+
+    def reconcile(self, read_counts) -> int:
+        """Replace the counts with `read_counts()` (a database read returning {set: count}).
+
+        Returns the drift: the summed absolute difference between the in-memory counts and the
+        database (0 when they agreed).
+        """
+        with self._lock:
+            self._pending = Counter()
+        try:
+            fresh = Counter({set_key(k): v for k, v in read_counts().items()})
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            fresh.update(self._pending)
+            self._pending = None
+            keys = set(fresh) | set(self._counts)
+            # the first read is a seed, not a correction
+            drift = sum(abs(fresh.get(k, 0) - self._counts.get(k, 0)) for k in keys) if self.seeded else 0
+            self._counts = fresh
+            self._engine = None  # rebuilt from the fresh counts on the next pick
+            self.seeded = True
+            self.reconciled_at = time.monotonic()
+            self.drift = drift
+        return drift
+
+    def seed(self, read_counts):
+        """Load the counts from the database unless already done."""
+        if not self.seeded:
+            self.reconcile(read_counts)
+
+
+class ExposureCounts:
+    """Thread-safe per-sample assignment counts for one pool version (sample ids are only stable within one).
+
+    `weight` turns the counts into sampling weights: a sample assigned n times is drawn with weight
+    (1 + n) ** -power, so unseen samples are strongly preferred and the spread of exposures stays small.
+    `seed` / `reconcile` replace the counts with a fresh database read, like SetCounts.
+    """
+
+    def __init__(self, version: Optional[str] = None):
+        self.version = version
+        self._counts: Counter = Counter()
+        self._levels: Counter = Counter()  # exposure n > 0 -> number of samples assigned n times
+        self._lock = threading.Lock()
+        self._pending: Optional[Counter] = None  # assignments recorded during a reconcile read
+        self.seeded = False
+        self.drift = 0  # total absolute difference found by the last reconcile
+
+    def record(self, sample_ids: Iterable[int], n: int = 1):
+        with self._lock:
+            for i in sample_ids:
+                old = self._counts[i]
+                self._counts[i] = old + n
+                self._move_level(old, old + n)
+                if self._pending is not None:
+                    self._pending[i] += n
+
+    def _move_level(self, old: int, new: int):
+        if old > 0:
+            self._levels[old] -= 1
+            if not self._levels[old]:
+                del self._levels[old]
+        if new > 0:
+            self._levels[new] += 1
+
+    def release(self, sample_ids: Iterable[int]):
+        self.record(sample_ids, -1)
+
+    def get(self, sample_id: int) -> int:
+        return self._counts.get(sample_id, 0)
+
+    def weight(self, power: float):
+        """A sample id -> weight function for sample_pool.sample_for_foundations."""
+        counts = self._counts
+        return lambda i: (1 + max(counts.get(i, 0), 0)) ** -power
+
+    def max_weight(self, power: float, total: int) -> float:
+        """The largest `weight(power)` of any sample in a pool of `total` samples (the bound for
+        sample_pool.sample_weighted): 1 while some sample is unassigned, else that of the least exposed."""
+        with self._lock:
+            if sum(self._levels.values()) < total:
+                return 1.0
+            return (1 + min(self._levels)) ** -power
+
+    def reconcile(self, read_counts) -> int:
+        """Replace the counts with `read_counts()` (a read returning {sample id: assignments}); assignments
+        recorded meanwhile are re-applied on top. Returns the drift (0 when they agreed, and on the first read)."""
+        with self._lock:
+            self._pending = Counter()
+        try:
+            fresh = Counter(read_counts())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            fresh.update(self._pending)
+            self._pending = None
+            keys = set(fresh) | set(self._counts)
+            drift = sum(abs(fresh.get(k, 0) - self._counts.get(k, 0)) for k in keys) if self.seeded else 0
+            self._counts = fresh
+            self._levels = Counter(n for n in fresh.values() if n > 0)
+            self.seeded = True
+            self.drift = drift
+        return drift
+
+    def seed(self, read_counts):
+        """Load the counts unless already done."""
+        if not self.seeded:
+            self.reconcile(read_counts)
+
+    def coverage(self, total: int) -> Dict:
+        """Summary over a pool of `total` samples: how many were assigned at least once, min/max exposure."""
+        with self._lock:
+            values = [n for n in self._counts.values() if n > 0]
+        return {"samples_assigned": len(values), "samples_total": total,
+                "min_exposure": min(values) if len(values) >= total and values else 0,
+                "max_exposure": max(values, default=0)}
+
+
+# Sampling weight of a sample that already has its target number of ratings (drawn only when nothing else is left)
+SATURATED_WEIGHT = 1e-9
+
+
+class RatingTargets:
+    """Thread-safe ratings per foundation set and per sample of one study, against its targets (0 = no target).
+
+    Samples are counted per (pool version, sample id), since ids are only stable within one version.
+    A version that replaced another carries its unchanged samples over (`carry`): their ratings in
+    either version count towards one key, that of the oldest version they appear in, so a reload
+    does not reopen a study whose samples already have their ratings.
+    Counts come from the rating_counts table (seeded once, reconciled periodically) plus the ratings
+    this process stored since; a set or sample is saturated once it has its target number of ratings.
+    The saturated sets and samples are kept up to date on every rating, so checking them is O(1).
+    """
+
+    def __init__(self, set_target: int = 0, item_target: int = 0):
+        self.set_target = set_target
+        self.item_target = item_target
+        self._sets: Counter = Counter()
+        self._items: Counter = Counter()
+        self._lock = threading.Lock()
+        self._pending: Optional[List[Tuple[FoundationSet, ItemKey]]] = None  # ratings recorded during a reconcile read
+        self.saturated_sets: FrozenSet[FoundationSet] = frozenset()
+        self.saturated_items: Dict[str, Set[int]] = {}  # pool version -> saturated sample ids
+        # pool version -> (the version it replaced, old id of each of its ids, its id of each old id; -1 = none)
+        self._carried: Dict[str, Tuple[str, Sequence[int], Sequence[int]]] = {}
+        self.seeded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.set_target > 0 or self.item_target > 0
+
+    def record(self, foundations: Iterable[str], version: Optional[str], sample_id: int):
+        """Count one rating of `sample_id` of pool version `version` by a participant assigned `foundations`."""
+        key = set_key(foundations)
+        item = (version or "", sample_id)
+        with self._lock:
+            self._add(key, item)
+            if self._pending is not None:
+                self._pending.append((key, item))
+
+    def carry(self, version: str, previous: str, to_previous: Sequence[int], from_previous: Sequence[int]):
+        """Count the samples of pool version `version` that are unchanged from `previous` (see
+        sample_pool.match_samples) together with theirs. Ignored for a version already known."""
+        with self._lock:
+            chain = previous
+            while chain != version and chain in self._carried:
+                chain = self._carried[chain][0]
+            if version in self._carried or chain == version:
+                return
+            self._carried[version] = (previous, to_previous, from_previous)
+            saturated = self.saturated_items.setdefault(version, set())
+            for j in self.saturated_items.get(previous, ()):
+                if 0 <= j < len(from_previous) and from_previous[j] >= 0:
+                    saturated.add(from_previous[j])
+
+    def _canonical(self, item: ItemKey) -> ItemKey:
+        """The key `item`'s ratings are counted under: the same sample in the oldest version it was carried from."""
+        version, sample_id = item
+        while version in self._carried:
+            previous, to_previous, _ = self._carried[version]
+            j = to_previous[sample_id] if 0 <= sample_id < len(to_previous) else -1
+            if j < 0:
+                break
+            version, sample_id = previous, j
+        return version, sample_id
+
+    def _aliases(self, item: ItemKey) -> Iterator[ItemKey]:
+        """`item` (a canonical key) and the same sample in every version carried from its version."""
+        yield item
+        version, sample_id = item
+        for later, (previous, _, from_previous) in list(self._carried.items()):
+            if previous == version and 0 <= sample_id < len(from_previous) and from_previous[sample_id] >= 0:
+                yield from self._aliases((later, from_previous[sample_id]))
+
+    def _add(self, key: FoundationSet, item: ItemKey):
+        item = self._canonical(item)
+        self._sets[key] += 1
+        self._items[item] += 1
+        if self.set_target and self._sets[key] == self.set_target:
+            self.saturated_sets = self.saturated_sets | {key}
+        if self.item_target and self._items[item] == self.item_target:
+            for version, sample_id in self._aliases(item):
+                self.saturated_items.setdefault(version, set()).add(sample_id)
+
+    def reconcile(self, read_counts):
+        """Replace the counts with `read_counts()` (a read returning ({set: ratings}, {(pool version, sample id):
+        ratings}))."""
+        with self._lock:
+            self._pending = []
+        try:
+            sets, items = read_counts()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._sets = Counter({set_key(k): v for k, v in sets.items()})
+            self._items = Counter()
+            for item, v in items.items():
+                self._items[self._canonical(item)] += v
+            self.saturated_sets = frozenset(k for k, v in self._sets.items() if self.set_target and v >= self.set_target)
+            saturated_items = {}
+            for item, v in self._items.items():
+                if self.item_target and v >= self.item_target:
+                    for version, sample_id in self._aliases(item):
+                        saturated_items.setdefault(version, set()).add(sample_id)
+            self.saturated_items = saturated_items
+            for key, item in self._pending:
+                self._add(key, item)
+            self._pending = None
+            self.seeded = True
+
+    def seed(self, read_counts):
+        """Load the counts unless already done."""
+        if not self.seeded:
+            self.reconcile(read_counts)
+
+    def item_weight(self, version: str, base: Optional[Callable[[int], float]] = None) -> Callable[[int], float]:
+        """A sample id -> weight function for pool version `version` that all but rules out saturated samples
+        (`base` weighs the others)."""
+        saturated = self.saturated_items.get(version, frozenset())
+        if base is None:
+            return lambda i: SATURATED_WEIGHT if i in saturated else 1.0
+        return lambda i: SATURATED_WEIGHT if i in saturated else base(i)
+
+    def full(self, foundation_sets: Sequence[FoundationSet], version: str, n_items: int) -> bool:
+        """Whether every target is met: each of `foundation_sets` has set_target ratings and each of the
+        `n_items` samples (ids 0..n_items-1) of pool version `version` has item_target ratings. Never true
+        without targets.
+
+        Runs on every registration, so while any set or sample is still open this returns False after
+        comparing sizes only; the sets and samples themselves are scanned only near the end.
+        """
+        if not self.enabled:
+            return False
+        if self.item_target:
+            items = self.saturated_items.get(version, ())
+            # counting only ids in range (ratings of ids outside the pool are stored too) is needed only near the end
+            if len(items) < n_items or sum(1 for i in items if 0 <= i < n_items) < n_items:
+                return False
+        if not self.set_target:
+            return True
+        saturated = self.saturated_sets
+        return len(saturated) >= len(foundation_sets) and all(s in saturated for s in foundation_sets)
+
+    def status(self, version: Optional[str] = None) -> Dict:
+        """Targets and how many sets, and samples of pool version `version`, met them."""
+        return {"pair_target": self.set_target, "item_target": self.item_target,
+                "sets_saturated": len(self.saturated_sets),
+                "items_saturated": len(self.saturated_items.get(version or "", ()))}
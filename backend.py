@@ -7,16 +7,31 @@ FastAPI backend for a simple labeling app.
 Behavior / endpoints summary:
 - GET  /register -> create a participant, assign two foundations (balanced across participants), select 10 'original' + 20 'generated' samples for that participant, return participant_id and the shuffled sample list
 - GET  /participant/{pid}/samples -> return the assigned samples (id + text + metadata)
-- POST /submit -> submit a single rating (participant_id, sample_id, rating 0-4, optional note)
+- POST /submit -> submit a single rating (participant_id, sample_id, rating 1-5, optional note)
+- POST /submit/batch -> submit all of a participant's ratings in one call (participant_id, ratings: [{sample_id, rating}])
 - GET  /admin/assignments -> view foundation assignment counts (admin check)
 - GET  /admin/responses -> view responses summary (admin)
-
-Storage: Postgres via the `DATABASE_URL` environment variable (required). The backend loads the CSV `MFV130Gen.csv` at startup to build the sample pool.
+- GET  /admin/db/pool -> database connection pool metrics (in use, waiting, wait time; see DB_POOL_* and db_pool.py)
+- GET  /admin/db/coalescer -> group commit metrics of /submit (ratings per flush; see SUBMIT_COALESCE_MS)
+- GET  /admin/db/spool -> submission spool metrics (ratings spooled while the database was unavailable, replayed, pending; see SUBMIT_SPOOL_DIR)
+- GET  /admin/pool/memory -> memory footprint of the sample pool (of a synthetic pool: others/bench_pool_memory.py)
+- POST /admin/reload-pool -> re-read the CSV in the background and atomically swap in the new pool version
+  (the CSV is also polled for changes every POOL_WATCH_INTERVAL seconds)
+- POST /studies/{study}/register, GET /studies/{study}/healthz -> the same for one of the studies declared in STUDIES_CONFIG
+  (the admin routes take ?study=...; the unscoped routes serve the default study)
+
+Storage: Postgres via the `DATABASE_URL` environment variable (required). The backend loads the CSV `MFV130Gen.csv` at startup to build the sample pool
+(from its compiled snapshot `MFV130Gen.csv.pool` when that is up to date; see sample_pool.py). The snapshot is memory-mapped
+read-only, so several worker processes (`uvicorn --workers N`, gunicorn) share one copy of the pool.
+
+Studies: one process can serve several studies, each with its own pool source, quotas and assignment balance
+(see studies.py). A study's pool is loaded on first use and evicted after STUDY_IDLE_SECONDS without requests.
 
 Assumptions & notes:
-- A "sample" is a row from the CSV; we assign an internal numeric sample_id (row index) when loading the CSV.
-- Chosen two foundations are assigned to each participant by choosing the pair that helps balance counts across participants.
-- If not enough originals/generated in the chosen foundations to meet the 10/20 quota, the server will pull from other foundations as fallback.
+- A "sample" is a row from the CSV (or a scenario of the JSON source); we assign an internal numeric sample_id (row index) when loading it.
+- Chosen two foundations (ASSIGNMENT_SET_SIZE, or a study's set_size) are assigned to each participant by choosing the pair that helps balance counts across participants.
+- If not enough originals/generated in the chosen foundations to meet the 10/20 quota, the server will pull from other foundations as fallback
+  (ASSIGNMENT_SKIP_INFEASIBLE, or a study's skip_infeasible, stops assigning such foundation sets instead).
 
 Run (development):
     pip install -r requirements.txt
@@ -24,24 +39,99 @@ Run (development):
 
 """
 
-import csv
+import asyncio
 import json
 import os
 import random
+import threading
+import time
 import uuid
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse
+from itertools import combinations
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import assignment
+import db_async
+import db_pool
+import sample_pool
+import spool
+import studies
+import write_coalescer
+from sample_pool import SamplePool
 
 DATA_DIR = Path(__file__).parent
-CSV_PATH = DATA_DIR / "MFV130Gen.csv"
+# Pool source: the sample CSV by default. POOL_SOURCE may point at another CSV, at the source JSON it is
+# exported from (an object with a `scenarios` list, e.g. MFV130Gen.json) or at a JSON Lines file of scenarios.
+CSV_PATH = Path(os.environ.get("POOL_SOURCE") or DATA_DIR / "MFV130Gen.csv")
+# Load the pool from the compiled snapshot next to the CSV (rebuilt when the CSV changes). Set POOL_SNAPSHOT=0 to always parse the CSV.
+USE_POOL_SNAPSHOT = os.environ.get("POOL_SNAPSHOT", "1") != "0"
+# POOL_MODE=lazy keeps only ids/foundations/labels and a byte-offset index in memory and reads sample text from the
+# (CSV or JSON Lines) source on demand, caching the POOL_TEXT_CACHE most recently served samples. For very large pools.
+POOL_LAZY = os.environ.get("POOL_MODE", "memory") == "lazy"
+POOL_TEXT_CACHE = int(os.environ.get("POOL_TEXT_CACHE", "4096"))
+# Seconds between checks of the CSV for changes (hot reload); 0 disables the file watcher.
+POOL_WATCH_INTERVAL = float(os.environ.get("POOL_WATCH_INTERVAL", "5"))
+# Number of pool versions kept in memory so participants assigned before a reload still resolve their samples
+POOL_HISTORY_SIZE = 4
+# Where every pool version is archived as a snapshot (default: next to its source) so seeded assignments still resolve
+# after a restart, on other workers or after more than POOL_HISTORY_SIZE reloads; put it on persistent storage.
+POOL_ARCHIVE_DIR = os.environ.get("POOL_ARCHIVE_DIR") or None
 SAMPLE_ORIGINAL_COUNT = 10
 SAMPLE_GENERATED_COUNT = 20
 TOTAL_PER_PARTICIPANT = SAMPLE_ORIGINAL_COUNT + SAMPLE_GENERATED_COUNT
+# Name of the study served by the unscoped routes; existing participants are migrated to it.
+DEFAULT_STUDY = os.environ.get("DEFAULT_STUDY", "default")
+# Optional JSON file declaring more studies (see studies.py), served under /studies/{study}/...
+STUDIES_CONFIG = os.environ.get("STUDIES_CONFIG")
+# How /register picks a foundation pair: "db" (default) chooses and reserves the least-used pair in the pair_counts
+# table in the registration's transaction, which keeps assignments balanced across worker processes and nodes;
+# "memory" uses this process's in-memory counts only (cheaper, but concurrent workers can pick the same pair).
+ASSIGNMENT_MODE = os.environ.get("ASSIGNMENT_MODE", "db")
+# Foundations assigned to each participant of the default study (2 = a pair); other studies set "set_size" in STUDIES_CONFIG.
+ASSIGNMENT_SET_SIZE = int(os.environ.get("ASSIGNMENT_SET_SIZE", "2"))
+# Assignments the background producer keeps ready for the default study's /register (0 = off); other studies set
+# "queue_size" in STUDIES_CONFIG. The queue is refilled when it drops to half; POST /admin/prefill-assignments fills it
+# ahead of a session. With ASSIGNMENT_MODE=db the queue is the pending_assignments table, shared by all workers.
+ASSIGNMENT_QUEUE_SIZE = int(os.environ.get("ASSIGNMENT_QUEUE_SIZE", "0"))
+# Exposure balancing for the default study (other studies set "exposure" in STUDIES_CONFIG): draw each participant's
+# samples weighted by (1 + times assigned) ** -EXPOSURE_POWER instead of uniformly, so every sample gets rated early on.
+EXPOSURE_BALANCING = os.environ.get("EXPOSURE_BALANCING", "0").lower() in ("1", "true", "yes")
+EXPOSURE_POWER = float(os.environ.get("EXPOSURE_POWER", "4"))
+# Never assign the default study's foundation sets that need the cross-foundation fallback (a foundation with fewer
+# originals/generated than its share of the quota); other studies set "skip_infeasible" in STUDIES_CONFIG.
+ASSIGNMENT_SKIP_INFEASIBLE = os.environ.get("ASSIGNMENT_SKIP_INFEASIBLE", "0").lower() in ("1", "true", "yes")
+# Rating targets of the default study (other studies set "pair_target" / "item_target" in STUDIES_CONFIG): ratings
+# wanted per foundation set and per sample (0 = no target). Registrations avoid saturated sets/samples, and /register
+# answers 409 {"study_full": true} once every target is met.
+RATING_TARGET_PAIR = int(os.environ.get("RATING_TARGET_PAIR", "0"))
+RATING_TARGET_ITEM = int(os.environ.get("RATING_TARGET_ITEM", "0"))
+# Number of seeded assignments whose regenerated sample ids are kept in memory
+ASSIGNMENT_CACHE_SIZE = int(os.environ.get("ASSIGNMENT_CACHE_SIZE", "10000"))
+# Seconds between reconciliations of the in-memory foundation pair counts with the participants table; 0 disables.
+PAIR_COUNTS_RECONCILE_SECONDS = float(os.environ.get("PAIR_COUNTS_RECONCILE_SECONDS", "60"))
+# Database connection pool: DB_POOL_MIN connections are opened at startup and up to DB_POOL_MAX on demand; each request
+# checks one out and waits up to DB_POOL_TIMEOUT seconds for one when all are in use (then 503). A connection idle for
+# DB_POOL_CHECK_IDLE seconds is pinged before it is handed out. With several workers, each has its own pool.
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_CHECK_IDLE = float(os.environ.get("DB_POOL_CHECK_IDLE", "30"))
+# asyncio database layer (db_async.py, needs asyncpg) for /register, /submit and /participant/{pid}/samples: their
+# queries await the database on the event loop instead of holding a threadpool thread. DB_ASYNC=auto (default) uses it
+# when asyncpg is installed, 0 runs those endpoints on the pool above (in the threadpool). DB_ASYNC_POOL_MIN/MAX size
+# its own connection pool (per worker); checkouts wait up to DB_POOL_TIMEOUT seconds.
+DB_ASYNC = os.environ.get("DB_ASYNC", "auto")
+DB_ASYNC_POOL_MIN = int(os.environ.get("DB_ASYNC_POOL_MIN", "1"))
+DB_ASYNC_POOL_MAX = int(os.environ.get("DB_ASYNC_POOL_MAX", "20"))
+# Seconds a study's pool stays loaded without requests before it is evicted (the default study is never evicted); 0 keeps pools loaded.
+STUDY_IDLE_SECONDS = float(os.environ.get("STUDY_IDLE_SECONDS", "1800"))
 
 app = FastAPI(title="LabelingApp Backend")
 
@@ -59,39 +149,55 @@ def serve_index():
         return FileResponse(str(index_file))
     return {"message": "Index not found. Place static files in ./static"}
 
-# In-memory sample pool loaded from CSV
-SAMPLES: List[Dict] = []  # each sample: {"id": int, "foundation": str, "label": 'original'|'generated', ...}
-FOUNDATIONS: List[str] = []
+# Studies served by this process (see studies.py). Each study has its own pool source, quotas and
+# loaded pool versions; a pool is an immutable SamplePool replaced as a whole on reload, and request
+# handlers fetch it once and use that pool for the whole request, so a concurrent reload never mixes versions.
+# The default study (pool source CSV_PATH, quotas above) is served by the unscoped routes (/register, ...).
+STUDIES = studies.StudyRegistry([studies.Study(
+    DEFAULT_STUDY, CSV_PATH, SAMPLE_ORIGINAL_COUNT, SAMPLE_GENERATED_COUNT, use_snapshot=USE_POOL_SNAPSHOT,
+    lazy=POOL_LAZY, cache_size=POOL_TEXT_CACHE, history_size=POOL_HISTORY_SIZE, archive_dir=POOL_ARCHIVE_DIR, pinned=True,
+    set_size=ASSIGNMENT_SET_SIZE, queue_size=ASSIGNMENT_QUEUE_SIZE, exposure_balanced=EXPOSURE_BALANCING,
+    skip_infeasible=ASSIGNMENT_SKIP_INFEASIBLE, pair_target=RATING_TARGET_PAIR, item_target=RATING_TARGET_ITEM)])
+if STUDIES_CONFIG:
+    for _study in studies.load_config(Path(STUDIES_CONFIG), use_snapshot=USE_POOL_SNAPSHOT, lazy=POOL_LAZY,
+                                      cache_size=POOL_TEXT_CACHE, history_size=POOL_HISTORY_SIZE,
+                                      archive_dir=POOL_ARCHIVE_DIR):
+        STUDIES.add(_study)
+_POOL_WATCH_STOP = threading.Event()
+_PRODUCER_WAKE = threading.Event()
+
+
+def get_study(name: str) -> studies.Study:
+    study = STUDIES.get(name)
+    if study is None:
+        raise HTTPException(status_code=404, detail=f"unknown study {name!r}")
+    return study
 
 
 def load_samples():
-    global SAMPLES, FOUNDATIONS
-    SAMPLES = []
-    if not CSV_PATH.exists():
-        raise FileNotFoundError(f"CSV not found at {CSV_PATH}")
-    with open(CSV_PATH, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for idx, row in enumerate(reader):
-            # Normalize foundation and label
-            foundation = (row.get("foundation") or "").strip()
-            if foundation == "":
-                foundation = "<missing>"
-            label = (row.get("label") or "generated").strip().lower()
-            if label not in ("original", "generated"):
-                label = "generated"
-            sample = {
-                "id": idx,
-                "foundation": foundation,
-                "label": label,
-                # include useful text fields for the frontend
-                "title": row.get("title", ""),
-                "description": row.get("description", ""),
-                "scenario": row.get("scenario", ""),
-                # keep other fields in case needed
-                "meta": {k: v for k, v in row.items() if k not in ("title", "description", "scenario", "foundation", "label")},
-            }
-            SAMPLES.append(sample)
-    FOUNDATIONS = sorted(list({s["foundation"] for s in SAMPLES}))
+    STUDIES.get(DEFAULT_STUDY).pool()
+
+
+def reload_pool(study: str = DEFAULT_STUDY) -> bool:
+    """Parse the study's pool source into a new pool and swap it in. Returns True if the pool version changed.
+
+    Parsing happens in the calling thread (a background task or the file watcher), never on a
+    participant request. A source that fails to load leaves the current pool in place.
+    """
+    return STUDIES.get(study).reload()
+
+
+def watch_pool_file():
+    """Every POOL_WATCH_INTERVAL seconds, reload studies whose pool source changed and evict idle studies;
+    every PAIR_COUNTS_RECONCILE_SECONDS, reconcile the pair, rating and exposure counts with the database."""
+    last_reconcile = time.monotonic()
+    while not _POOL_WATCH_STOP.wait(POOL_WATCH_INTERVAL):
+        STUDIES.sweep(STUDY_IDLE_SECONDS)
+        if PAIR_COUNTS_RECONCILE_SECONDS > 0 and time.monotonic() - last_reconcile >= PAIR_COUNTS_RECONCILE_SECONDS:
+            last_reconcile = time.monotonic()
+            reconcile_pair_counts()
+            reconcile_rating_counts()
+            reconcile_exposure()
 
 
 # Database helper: Postgres only. A DATABASE_URL environment variable (Postgres connection string) is required.
@@ -118,14 +224,27 @@ def get_conn():
     return conn
 
 
-def init_db():
-    """Initialize DB connection and ensure tables exist. Returns a DB connection object.
+# Advisory lock key held while creating/migrating the schema
+SCHEMA_LOCK_ID = 461300
+
+
+def init_db() -> db_pool.ConnectionPool:
+    """Open the connection pool and ensure tables exist. Returns the pool.
 
     This initialization requires a Postgres `DATABASE_URL`. The function will create
     Postgres-compatible tables if they do not already exist.
     """
-    conn = get_conn()
+    pool = db_pool.ConnectionPool(get_conn, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_CHECK_IDLE)
+    with pool.connection() as conn:
+        create_schema(conn)
+    return pool
+
+
+def create_schema(conn):
+    """Create/migrate the tables on `conn` (committed)."""
     cur = conn.cursor()
+    # worker processes start together; serialize their schema setup (CREATE TABLE IF NOT EXISTS races otherwise)
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
     # Postgres DDL
     cur.execute(
         """
@@ -138,6 +257,15 @@ def init_db():
         )
         """
     )
+    # sample pool version the participant's samples were drawn from (added after the initial schema)
+    cur.execute("ALTER TABLE participants ADD COLUMN IF NOT EXISTS pool_version TEXT")
+    # seeded assignments store a sample spec (sampler:seed:original:generated) instead of the sample ids, which are
+    # regenerated from it and the pool version; rows from before have samples_json and no spec
+    cur.execute("ALTER TABLE participants ADD COLUMN IF NOT EXISTS sample_spec TEXT")
+    # study the participant belongs to; rows from before studies existed belong to the default study
+    cur.execute("ALTER TABLE participants ADD COLUMN IF NOT EXISTS study TEXT")
+    cur.execute("UPDATE participants SET study = %s WHERE study IS NULL", (DEFAULT_STUDY,))
+    cur.execute("CREATE INDEX IF NOT EXISTS participants_study_idx ON participants (study)")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS responses (
@@ -149,17 +277,158 @@ def init_db():
         )
         """
     )
+    # spooled ratings are replayed only if the participant has no response for the sample yet (see replay_spooled)
+    cur.execute("CREATE INDEX IF NOT EXISTS responses_participant_sample_idx ON responses (participant_id, sample_id)")
+    # Assignments generated ahead of registrations by the producer (see produce_assignments); their foundation
+    # sets are already counted in pair_counts.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pending_assignments (
+            id SERIAL PRIMARY KEY,
+            study TEXT NOT NULL,
+            foundations TEXT NOT NULL,
+            samples_json TEXT,
+            pool_version TEXT,
+            created_at TEXT,
+            sample_spec TEXT
+        )
+        """
+    )
+    cur.execute("ALTER TABLE pending_assignments ADD COLUMN IF NOT EXISTS sample_spec TEXT")
+    cur.execute("ALTER TABLE pending_assignments ALTER COLUMN samples_json DROP NOT NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS pending_assignments_study_idx ON pending_assignments (study, pool_version, id)")
+    # Assignments per (study, foundation pair), updated in the same transaction as the participant insert
+    # (see reserve_balanced_pair). `foundations` is the JSON list stored in participants.assigned_foundations.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pair_counts (
+            study TEXT NOT NULL,
+            foundations TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (study, foundations)
+        )
+        """
+    )
+    # backfill from participants registered before the table existed (existing rows are left alone)
+    cur.execute(
+        """
+        INSERT INTO pair_counts (study, foundations, n)
+        SELECT study, assigned_foundations, COUNT(*) FROM participants
+        WHERE study IS NOT NULL AND assigned_foundations IS NOT NULL
+        GROUP BY study, assigned_foundations
+        ON CONFLICT DO NOTHING
+        """
+    )
+    # Ratings per (study, foundation set) and per (study, sample), updated in the same transaction as each response
+    # (see /submit) so rating targets are checked without scanning responses; kind is 'set' (key: the participant's
+    # assigned_foundations) or 'item' (key: "<pool version>:<sample id>", see rating_item_key). Backfilled from
+    # responses only when first created.
+    cur.execute("SELECT to_regclass('rating_counts')")
+    backfill_ratings = cur.fetchone()[0] is None
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rating_counts (
+            study TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (study, kind, key)
+        )
+        """
+    )
+    if backfill_ratings:
+        cur.execute(
+            """
+            INSERT INTO rating_counts (study, kind, key, n)
+            SELECT p.study, 'set', p.assigned_foundations, COUNT(*) FROM responses r
+            JOIN participants p ON p.id = r.participant_id
+            WHERE p.study IS NOT NULL AND p.assigned_foundations IS NOT NULL
+            GROUP BY p.study, p.assigned_foundations
+            UNION ALL
+            SELECT p.study, 'item', COALESCE(p.pool_version, '') || ':' || r.sample_id, COUNT(*) FROM responses r
+            JOIN participants p ON p.id = r.participant_id
+            WHERE p.study IS NOT NULL AND r.sample_id IS NOT NULL
+            GROUP BY p.study, p.pool_version, r.sample_id
+            ON CONFLICT DO NOTHING
+            """
+        )
+    else:
+        # item rows used to be keyed by the bare sample id, which mixes up samples of different pool versions:
+        # recount them from responses under the versioned key
+        cur.execute("SELECT 1 FROM rating_counts WHERE kind = 'item' AND strpos(key, ':') = 0 LIMIT 1")
+        if cur.fetchone():
+            cur.execute("DELETE FROM rating_counts WHERE kind = 'item'")
+            cur.execute(
+                """
+                INSERT INTO rating_counts (study, kind, key, n)
+                SELECT p.study, 'item', COALESCE(p.pool_version, '') || ':' || r.sample_id, COUNT(*) FROM responses r
+                JOIN participants p ON p.id = r.participant_id
+                WHERE p.study IS NOT NULL AND r.sample_id IS NOT NULL
+                GROUP BY p.study, p.pool_version, r.sample_id
+                """
+            )
     conn.commit()
-    return conn
 
 
 try:
-    DB = init_db()
+    DB_POOL = init_db()
 except Exception as e:
     # If DB initialization fails (bad/missing DATABASE_URL or network/DNS issue),
     # keep the app running in read-only mode so frontend and sample serving work.
     print("WARNING: Database initialization failed:", e)
-    DB = None
+    DB_POOL = None
+
+
+def _checkin(conn, exc: Optional[BaseException]):
+    DB_POOL.put(conn, broken=exc is not None and db_pool.is_connection_error(exc))
+
+
+@contextmanager
+def db_connection():
+    """Check out a pooled connection for one request (503 if the database is unavailable or every connection
+    stays busy for DB_POOL_TIMEOUT seconds); it is rolled back and returned afterwards."""
+    if DB_POOL is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
+    try:
+        conn = DB_POOL.get()
+    except db_pool.PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database busy: {e}")
+    except Exception as e:
+        if not db_pool.is_connection_error(e):
+            raise
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    try:
+        yield conn
+    except BaseException as e:
+        _checkin(conn, e)
+        raise
+    _checkin(conn, None)
+
+
+def with_connection(fn, *args):
+    """fn(conn, *args) on a pooled connection; async handlers run it with run_in_threadpool."""
+    with db_connection() as conn:
+        return fn(conn, *args)
+
+
+# asyncio database layer (db_async.AsyncDatabase), opened at startup unless DB_ASYNC=0 or asyncpg is missing;
+# None means the async endpoints use the threaded pool
+ADB: Optional[db_async.AsyncDatabase] = None
+
+
+@asynccontextmanager
+async def async_connection(transaction: bool = False):
+    """Check out an asyncpg connection (in a transaction if `transaction`); 503 if every connection stays busy
+    for DB_POOL_TIMEOUT seconds or the connection to the database is lost."""
+    try:
+        async with (ADB.transaction() if transaction else ADB.connection()) as conn:
+            yield conn
+    except db_pool.PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database busy: {e}")
+    except Exception as e:
+        if not db_pool.is_connection_error(e):
+            raise
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
 
 
 # Helper to execute parameterized queries across sqlite ("?" params) and psycopg2 ("%s" params)
@@ -177,252 +446,1308 @@ def db_execute(conn, sql, params=None):
 @app.on_event("startup")
 def startup():
     load_samples()
+    _POOL_WATCH_STOP.clear()
+    if POOL_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_pool_file, name="pool-watcher", daemon=True).start()
+    if DB_POOL is not None:
+        threading.Thread(target=run_assignment_producer, name="assignment-producer", daemon=True).start()
+    if SPOOL is not None:
+        threading.Thread(target=run_spool_replayer, name="spool-replayer", daemon=True).start()
+
 
+# the server's event loop (set at startup), for opening the asyncio database layer from the spool replayer
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
 
-# Helper: get assignment counts per foundation-pair to balance assignments
-def get_foundation_pair_counts(conn) -> Dict[Tuple[str, str], int]:
-    cur = db_execute(conn, "SELECT assigned_foundations FROM participants")
+
+@app.on_event("startup")
+async def open_async_db():
+    global ADB, _LOOP
+    _LOOP = asyncio.get_running_loop()
+    if DB_POOL is None or DB_ASYNC == "0" or (DB_ASYNC == "auto" and not db_async.available()):
+        return
+    try:
+        ADB = await db_async.AsyncDatabase.connect(os.environ["DATABASE_URL"], DB_ASYNC_POOL_MIN, DB_ASYNC_POOL_MAX,
+                                                   DB_POOL_TIMEOUT)
+    except Exception as e:
+        print("WARNING: asyncio database layer unavailable, using the threaded pool:", e)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    _POOL_WATCH_STOP.set()
+    _PRODUCER_WAKE.set()
+
+
+@app.on_event("shutdown")
+async def close_databases():
+    """Write the submissions waiting for group commit, then close both connection pools."""
+    global ADB
+    if SUBMIT_COALESCER is not None:
+        await SUBMIT_COALESCER.close()
+    if ADB is not None:
+        await ADB.close()
+        ADB = None
+    if DB_POOL is not None:
+        DB_POOL.close()
+
+
+# Helper: get assignment counts per foundation-pair from the database (seeds/reconciles the in-memory counts)
+def get_foundation_pair_counts(conn, study: str = DEFAULT_STUDY) -> Dict[Tuple[str, ...], int]:
+    # aggregate in the database: one row per distinct pair rather than one per participant
+    cur = db_execute(conn, "SELECT assigned_foundations, COUNT(*) FROM participants WHERE study = ? GROUP BY assigned_foundations",
+                     (study,))
     rows = cur.fetchall()
     cnt = Counter()
-    for (af,) in rows:
+    for (af, n) in rows:
         if not af:
             continue
         try:
-            pair = tuple(json.loads(af))
-            if len(pair) == 2:
-                cnt[tuple(pair)] += 1
+            cnt[assignment.set_key(json.loads(af))] += n
         except Exception:
             continue
     return cnt
 
 
-def choose_balanced_pair(conn) -> Tuple[str, str]:
+def assigned_set_counts(conn, study: studies.Study) -> Dict[Tuple[str, ...], int]:
+    """What `study.counts` holds: participants per foundation set, plus (ASSIGNMENT_MODE=memory) the assignments
+    queued in `study.prepared`, which are counted when produced. With ASSIGNMENT_MODE=db queued assignments are
+    counted in pair_counts only, and in `study.counts` once taken."""
+    # the queue is read first: an assignment taken meanwhile is then counted twice (until the next reconcile), not lost
+    queued = [prepared[0] for prepared in list(study.prepared)] if ASSIGNMENT_MODE == "memory" else []
+    cnt = Counter(get_foundation_pair_counts(conn, study.name))
+    for pair in queued:
+        cnt[assignment.set_key(pair)] += 1
+    return cnt
+
+
+def reconcile_pair_counts():
+    """Replace every seeded study's in-memory pair counts with a fresh read of the participants table (and its
+    assignment queue, see assigned_set_counts)."""
+    if DB_POOL is None:
+        return
+    for study in STUDIES:
+        if not study.counts.seeded:
+            continue
+        try:
+            with DB_POOL.connection() as conn:
+                drift = study.counts.reconcile(lambda: assigned_set_counts(conn, study))
+        except Exception as e:
+            print(f"WARNING: study {study.name}: pair count reconciliation failed:", e)
+            continue
+        if drift:
+            print(f"Study {study.name}: pair counts reconciled (drift {drift})")
+
+
+def rating_item_key(pool_version: Optional[str], sample_id: int) -> str:
+    """The rating_counts key of a sample: "<pool version>:<sample id>" (sample ids are only stable within a version)."""
+    return f"{pool_version or ''}:{sample_id}"
+
+
+def get_rating_counts(conn, study: str) -> Tuple[Dict[Tuple[str, ...], int], Dict[assignment.ItemKey, int]]:
+    """Ratings per foundation set and per (pool version, sample id) of `study`, from rating_counts (one row per set
+    and sample)."""
+    cur = db_execute(conn, "SELECT kind, key, n FROM rating_counts WHERE study = ?", (study,))
+    sets = Counter()
+    items = {}
+    for kind, key, n in cur.fetchall():
+        try:
+            if kind == "set":
+                sets[assignment.set_key(json.loads(key))] += n
+            elif kind == "item":
+                version, sample_id = key.rsplit(":", 1)
+                items[version, int(sample_id)] = n
+        except Exception:
+            continue
+    return sets, items
+
+
+def reconcile_rating_counts():
+    """Refresh every study's rating target counts (ratings stored by other processes) from rating_counts."""
+    if DB_POOL is None:
+        return
+    for study in STUDIES:
+        if not (study.targets.enabled and study.targets.seeded):
+            continue
+        try:
+            with DB_POOL.connection() as conn:
+                study.targets.reconcile(lambda: get_rating_counts(conn, study.name))
+        except Exception as e:
+            print(f"WARNING: study {study.name}: rating count reconciliation failed:", e)
+
+
+def check_study_full(conn, study: studies.Study, pool: SamplePool):
+    """Raise 409 {"study_full": true, ...} once every rating target of `study` is met (no-op without targets)."""
+    if not study.targets.enabled:
+        return
+    study.targets.seed(lambda: get_rating_counts(conn, study.name))
+    if study.full(pool):
+        raise HTTPException(status_code=409, detail={
+            "study_full": True, "study": study.name,
+            "message": "This study has all the ratings it needs and is not accepting new participants. Thank you!"})
+
+
+def unwanted_sets(study: studies.Study, pool: SamplePool) -> frozenset:
+    """Foundation sets registrations should not get: study.excluded_sets plus those that met their rating target."""
+    return study.excluded_sets(pool) | study.targets.saturated_sets
+
+
+def foundation_sets(pool: SamplePool, set_size: int = 2) -> List[Tuple[str, ...]]:
+    """All sets of `set_size` of the pool's foundations (pairs by default), each in sorted order."""
+    return list(combinations(pool.foundations, set_size))
+
+
+def choose_balanced_pair(conn, pool: SamplePool, study: studies.Study) -> Tuple[str, ...]:
     """
-    Choose a pair of distinct foundations (a, b) such that pair counts are as balanced as possible.
-    We'll consider all unordered pairs and pick the one with minimal count; tie-break randomly.
+    Choose a pair (or, for studies with a larger set size, a set of study.set_size) of distinct foundations whose
+    assignment count (within the study) is lowest; ties are broken randomly. The choice is counted right away, so
+    give it back with study.counts.release() if it is not used.
+    Counts come from the study's in-memory counters (seeded from the database on first use) and the least-used set
+    is popped from a priority queue (assignment.AssignmentEngine) in O(log C), so this does not touch the database
+    once seeded and does not enumerate the sets. Used with ASSIGNMENT_MODE=memory; see reserve_balanced_pair for
+    the default.
     """
-    pairs = []
-    for i in range(len(FOUNDATIONS)):
-        for j in range(i + 1, len(FOUNDATIONS)):
-            pairs.append((FOUNDATIONS[i], FOUNDATIONS[j]))
-    pair_counts = get_foundation_pair_counts(conn)
-    min_count = None
-    candidates = []
-    for p in pairs:
-        c = pair_counts.get(p, 0)
-        if min_count is None or c < min_count:
-            min_count = c
-            candidates = [p]
-        elif c == min_count:
-            candidates.append(p)
-    return random.choice(candidates)
-
-
-def sample_for_pair(pair: Tuple[str, str], desired_original: int, desired_generated: int) -> List[int]:
-    # New behavior: randomize only within each foundation block. Do not globally shuffle across foundations.
-    fa, fb = pair[0], pair[1]
-
-    # allocate originals/generated evenly across the two foundations
-    orig_a = desired_original // 2
-    orig_b = desired_original - orig_a
-    gen_a = desired_generated // 2
-    gen_b = desired_generated - gen_a
-
-    chosen_samples: List[Dict] = []
-    already_chosen = set()
-
-    for foundation, need_orig, need_gen in [(fa, orig_a, gen_a), (fb, orig_b, gen_b)]:
-        pool_f = [s for s in SAMPLES if s["foundation"] == foundation]
-        originals_f = [s for s in pool_f if s["label"] == "original" and s["id"] not in already_chosen]
-        generated_f = [s for s in pool_f if s["label"] == "generated" and s["id"] not in already_chosen]
-
-        chosen_orig_f: List[Dict] = []
-        if len(originals_f) >= need_orig:
-            chosen_orig_f = random.sample(originals_f, need_orig)
-        else:
-            chosen_orig_f = originals_f.copy()
-            needed = need_orig - len(chosen_orig_f)
-            # fallback: sample other originals not yet chosen
-            others = [s for s in SAMPLES if s["label"] == "original" and s["id"] not in already_chosen and s not in chosen_orig_f]
-            if len(others) >= needed:
-                chosen_orig_f.extend(random.sample(others, needed))
-            else:
-                chosen_orig_f.extend(others)
+    study.counts.seed(lambda: assigned_set_counts(conn, study))
+    return study.counts.pick(pool.foundations, study.set_size, unwanted_sets(study, pool))
+
+
+def pair_keys_key(study: studies.Study, pool: SamplePool) -> Tuple[str, int, bool]:
+    return pool.version, study.set_size, study.skip_infeasible
+
+
+def ensure_pair_rows(conn, study: studies.Study, pool: SamplePool) -> List[str]:
+    """Create the pair_counts rows (n = 0) of every foundation set of the study for this pool, once per pool version,
+    and commit them; returns foundation_set_keys. Called before a registration's transaction starts, so that
+    transaction is never committed half-way."""
+    keys = study.pair_keys.get(pair_keys_key(study, pool))
+    if keys is None:
+        sets = foundation_sets(pool, study.set_size)
+        db_execute(conn, "INSERT INTO pair_counts (study, foundations, n) SELECT ?, unnest(?), 0 ON CONFLICT DO NOTHING",
+                   (study.name, [json.dumps(list(s)) for s in sets]))
+        conn.commit()
+        excluded = study.excluded_sets(pool)
+        keys = [json.dumps(list(s)) for s in sets if s not in excluded] or [json.dumps(list(s)) for s in sets]
+        study.pair_keys[pair_keys_key(study, pool)] = keys
+    return keys
+
+
+def foundation_set_keys(conn, study: studies.Study, pool: SamplePool) -> List[str]:
+    """The pair_counts keys of the study's assignable foundation sets for this pool (without study.excluded_sets,
+    unless that excludes all of them). Their rows are normally created by ensure_pair_rows before the caller's
+    transaction; if they were not (the pool version's keys were dropped meanwhile), they are created on another
+    connection rather than by committing the caller's."""
+    keys = study.pair_keys.get(pair_keys_key(study, pool))
+    if keys is None:
+        keys = with_connection(ensure_pair_rows, study, pool)
+    return keys
+
+
+# Reserve the least-used of the candidate sets: skip rows locked by concurrent registrations, or, if every
+# candidate is locked, wait for one
+RESERVE_PAIR_SQL = tuple("UPDATE pair_counts SET n = n + 1 WHERE study = ? AND foundations = ("
+                         "SELECT foundations FROM pair_counts WHERE study = ? AND foundations = ANY(?) "
+                         f"ORDER BY n, random() LIMIT 1 {lock}) RETURNING foundations"
+                         for lock in ("FOR UPDATE SKIP LOCKED", "FOR UPDATE"))
+
+
+def reservable_set_keys(conn, study: studies.Study, pool: SamplePool) -> List[str]:
+    """foundation_set_keys without the sets that met their rating target (while any other is left)."""
+    keys = foundation_set_keys(conn, study, pool)
+    saturated = study.targets.saturated_sets
+    if saturated:
+        saturated_keys = {json.dumps(list(s)) for s in saturated}
+        keys = [k for k in keys if k not in saturated_keys] or keys
+    return keys
+
+
+def reserve_balanced_pair(conn, pool: SamplePool, study: studies.Study) -> Tuple[str, ...]:
+    """Choose the least-assigned pair (foundation set) of the study and reserve it, in the caller's open transaction.
+
+    One UPDATE ... RETURNING picks the pair_counts row with the lowest count (ties broken randomly),
+    locks it and increments it. Rows locked by concurrent registrations are skipped, so concurrent
+    registrations (in any worker or node) pick different pairs instead of all taking the same minimum.
+    The caller commits the reservation together with the participant insert (or rolls both back).
+    """
+    keys = reservable_set_keys(conn, study, pool)
+    # if every candidate row is locked, wait for one instead of skipping
+    for sql in RESERVE_PAIR_SQL:
+        cur = db_execute(conn, sql, (study.name, study.name, keys))
+        row = cur.fetchone()
+        if row:
+            return tuple(json.loads(row[0]))
+    raise HTTPException(status_code=500, detail="no foundation pair available for this study")
+
+
+async def reserve_balanced_pair_async(conn, pool: SamplePool, study: studies.Study) -> Tuple[str, ...]:
+    """reserve_balanced_pair on an asyncpg connection (the study's pair_counts rows must exist, see seed_study_state)."""
+    keys = reservable_set_keys(None, study, pool)
+    for sql in RESERVE_PAIR_SQL:
+        row = await db_async.fetchrow(conn, sql, (study.name, study.name, keys))
+        if row:
+            return tuple(json.loads(row[0]))
+    raise HTTPException(status_code=500, detail="no foundation pair available for this study")
+
+
+def reserve_balanced_sets(conn, pool: SamplePool, study: studies.Study, count: int) -> List[Tuple[str, ...]]:
+    """Choose and reserve `count` foundation sets balanced across the whole batch, in the caller's open transaction.
+
+    Locks the study's pair_counts rows, takes `count` picks from an AssignmentEngine over their counts (so the batch
+    spreads over the least-used sets exactly as `count` single registrations would) and adds them back in one
+    UPDATE: two statements whatever the batch size. Used by /register/batch.
+    """
+    keys = foundation_set_keys(conn, study, pool)
+    cur = db_execute(conn, "SELECT foundations, n FROM pair_counts WHERE study = ? AND foundations = ANY(?) "
+                           "ORDER BY foundations FOR UPDATE", (study.name, keys))
+    counts = {tuple(json.loads(f)): n for f, n in cur.fetchall()}
+    if not counts:
+        raise HTTPException(status_code=500, detail="no foundation pair available for this study")
+    engine = assignment.AssignmentEngine(pool.foundations, study.set_size, counts, exclude=unwanted_sets(study, pool))
+    pairs = [engine.pick() for _ in range(count)]
+    added = Counter(json.dumps(list(pair)) for pair in pairs)
+    db_execute(conn, "UPDATE pair_counts AS p SET n = p.n + d.k FROM unnest(?::text[], ?::int[]) AS d(foundations, k) "
+                     "WHERE p.study = ? AND p.foundations = d.foundations",
+               (list(added), list(added.values()), study.name))
+    return pairs
+
+
+def sample_for_pair(pool: SamplePool, pair: Tuple[str, ...], desired_original: int, desired_generated: int) -> List[int]:
+    # Randomize only within each foundation block. Do not globally shuffle across foundations.
+    return sample_pool.sample_for_foundations(pool, pair, desired_original, desired_generated)
+
+
+def new_sample_spec(study: studies.Study) -> str:
+    """A fresh seeded sample spec for an assignment in `study` (see sample_pool.make_sample_spec)."""
+    return sample_pool.make_sample_spec(random.getrandbits(63), study.desired_original, study.desired_generated)
+
+
+# Regenerated sample ids of recent seeded assignments: (study, pool version, foundations, spec) -> ids
+_ASSIGNMENT_CACHE: "OrderedDict[Tuple, List[int]]" = OrderedDict()
+_ASSIGNMENT_CACHE_LOCK = threading.Lock()
+
+
+def assigned_sample_ids(study: studies.Study, pool: SamplePool, foundations: Sequence[str], spec: str) -> List[int]:
+    """The sample ids of a seeded assignment, regenerated from its spec (cached, most recent ASSIGNMENT_CACHE_SIZE)."""
+    key = (study.name, pool.version, tuple(foundations), spec)
+    with _ASSIGNMENT_CACHE_LOCK:
+        sample_ids = _ASSIGNMENT_CACHE.get(key)
+        if sample_ids is not None:
+            _ASSIGNMENT_CACHE.move_to_end(key)
+            return sample_ids
+    sample_ids = sample_pool.sample_from_spec(pool, foundations, spec)
+    with _ASSIGNMENT_CACHE_LOCK:
+        _ASSIGNMENT_CACHE[key] = sample_ids
+        while len(_ASSIGNMENT_CACHE) > ASSIGNMENT_CACHE_SIZE:
+            _ASSIGNMENT_CACHE.popitem(last=False)
+    return sample_ids
+
+
+def get_sample_exposure(conn, study: studies.Study, pool: SamplePool) -> Counter:
+    """Assignments per sample id among the study's participants and queued assignments (the pending_assignments
+    table, or `study.prepared` with ASSIGNMENT_MODE=memory) drawn from `pool`'s version."""
+    # the queue is read first, as in assigned_set_counts
+    rows = [(json.dumps(pair), samples_json, spec) for pair, spec, samples_json, version in list(study.prepared)
+            if version == pool.version] if ASSIGNMENT_MODE == "memory" else []
+    for table, column in (("participants", "assigned_foundations"), ("pending_assignments", "foundations")):
+        cur = db_execute(conn, f"SELECT {column}, samples_json, sample_spec FROM {table} WHERE study = ? AND pool_version = ?",
+                         (study.name, pool.version))
+        rows.extend(cur.fetchall())
+    cnt = Counter()
+    for foundations, samples_json, spec in rows:
+        try:
+            cnt.update(json.loads(samples_json) if samples_json else
+                       sample_pool.sample_from_spec(pool, json.loads(foundations), spec))
+        except Exception:
+            continue
+    return cnt
 
-        chosen_gen_f: List[Dict] = []
-        if len(generated_f) >= need_gen:
-            chosen_gen_f = random.sample(generated_f, need_gen)
-        else:
-            chosen_gen_f = generated_f.copy()
-            needed = need_gen - len(chosen_gen_f)
-            others = [s for s in SAMPLES if s["label"] == "generated" and s["id"] not in already_chosen and s not in chosen_gen_f]
-            if len(others) >= needed:
-                chosen_gen_f.extend(random.sample(others, needed))
+
+def reconcile_exposure():
+    """Replace every exposure-balanced study's per-sample exposure with a fresh read (assignments made by other
+    processes since it was seeded), for each pool version still in memory."""
+    if DB_POOL is None:
+        return
+    for study in STUDIES:
+        if not study.exposure_balanced:
+            continue
+        for pool, exposure in study.exposures():
+            try:
+                with DB_POOL.connection() as conn:
+                    drift = exposure.reconcile(lambda: get_sample_exposure(conn, study, pool))
+            except Exception as e:
+                print(f"WARNING: study {study.name}: exposure reconciliation failed:", e)
+                continue
+            if drift:
+                print(f"Study {study.name}: sample exposure of pool {pool.version} reconciled (drift {drift})")
+
+
+def seeded_exposure(conn, study: studies.Study, pool: SamplePool):
+    """study.exposure(pool), seeded from the database if needed. Without a connection (the async path, where
+    seed_study_state seeded it unless the version's counts were dropped since) it reads on a pooled one."""
+    exposure = study.exposure(pool)
+    if not exposure.seeded:
+        if conn is None:
+            return with_connection(seeded_exposure, study, pool)
+        exposure.seed(lambda: get_sample_exposure(conn, study, pool))
+    return exposure
+
+
+def draw_samples(conn, study: studies.Study, pool: SamplePool,
+                 pair: Tuple[str, ...]) -> Tuple[Optional[str], Optional[str], List[int]]:
+    """Draw the samples of a new assignment; returns (sample_spec, samples_json, sample ids) to store.
+
+    Uniform draws are seeded and stored as a spec only. Exposure-balanced draws, and draws that avoid samples
+    which met the study's item_target, depend on what was assigned or rated before, so they are not reproducible
+    from a seed and their ids go to samples_json. So do draws from a lazy pool: lazy pool versions are not
+    archived, so a spec could not be resolved once the source changed (see Study.loaded_version).
+    Exposure-balanced draws are counted in the study's exposure right away (give them back with
+    study.exposure(pool).release() if the assignment is dropped).
+    """
+    steer = bool(study.targets.item_target and study.targets.saturated_items.get(pool.version))
+    if not study.exposure_balanced and not steer:
+        spec = new_sample_spec(study)
+        sample_ids = assigned_sample_ids(study, pool, pair, spec)
+        if study.lazy:
+            return None, json.dumps(sample_ids), sample_ids
+        return spec, None, sample_ids
+    weight, bound = None, 1.0
+    if study.exposure_balanced:
+        exposure = seeded_exposure(conn, study, pool)
+        weight = exposure.weight(EXPOSURE_POWER)
+        bound = exposure.max_weight(EXPOSURE_POWER, len(pool))
+    if steer:
+        weight = study.targets.item_weight(pool.version, weight)
+    sample_ids = sample_pool.sample_for_foundations(pool, pair, study.desired_original, study.desired_generated,
+                                                    weight=weight, weight_bound=bound)
+    if study.exposure_balanced:
+        exposure.record(sample_ids)
+    return None, json.dumps(sample_ids), sample_ids
+
+
+def participant_sample_ids(study: studies.Study, pool_version: Optional[str], assigned_foundations: str,
+                           samples_json: Optional[str], sample_spec: Optional[str]) -> Tuple[SamplePool, List[int]]:
+    """Return (pool, sample ids) of a participant row.
+
+    Rows from before seeded assignments keep their ids in samples_json; seeded rows are regenerated from
+    their spec, which needs the exact pool version they were drawn from (in memory or archived).
+    """
+    if samples_json:
+        return study.pool_for_version(pool_version), json.loads(samples_json)
+    pool = study.loaded_version(pool_version)
+    if pool is None:
+        raise HTTPException(status_code=409, detail=f"sample pool version {pool_version} of this participant is no longer available")
+    return pool, assigned_sample_ids(study, pool, json.loads(assigned_foundations), sample_spec)
+
+
+class RawJSONResponse(Response):
+    """Response whose body is already-encoded JSON bytes (skips FastAPI's encoder)."""
+    media_type = "application/json"
+
+
+def participant_response(pool: SamplePool, pid: str, sample_ids: List[int], name: Optional[str]) -> RawJSONResponse:
+    """Build {"participant_id", "samples", "name"} from the pool's pre-encoded sample fragments.
+
+    Samples keep the order of `sample_ids`; fragments already have the foundation stripped
+    (hidden from participants).
+    """
+    return RawJSONResponse(content=sample_pool.encode_participant(pool, pid, sample_ids, name))
+
+
+def insert_values_sql(table_and_columns: str, n_rows: int, n_columns: int) -> str:
+    """`INSERT INTO <table_and_columns> VALUES (?, ...), ...` for n_rows rows (one statement, one round trip)."""
+    row = "(" + ", ".join(["?"] * n_columns) + ")"
+    return f"INSERT INTO {table_and_columns} VALUES " + ", ".join([row] * n_rows)
+
+
+def produce_assignments(conn, study: studies.Study, pool: SamplePool, count: int) -> int:
+    """Generate `count` balanced assignments (foundation set + samples) for `study` ahead of registrations.
+
+    With ASSIGNMENT_MODE=db the foundation sets are reserved in pair_counts and the assignments are
+    stored in pending_assignments in one transaction, so every worker can hand them out and they
+    survive restarts (`study.counts` counts them once taken, see taken_assignment); with
+    ASSIGNMENT_MODE=memory they are counted in memory and queued in `study.prepared`. Returns the
+    number generated.
+    """
+    if count <= 0:
+        return 0
+    if ASSIGNMENT_MODE == "memory":
+        for _ in range(count):
+            pair = choose_balanced_pair(conn, pool, study)
+            spec, samples_json, _ = draw_samples(conn, study, pool, pair)
+            study.prepared.append((pair, spec, samples_json, pool.version))
+        return count
+    ensure_pair_rows(conn, study, pool)
+    try:
+        now = datetime.utcnow().isoformat()
+        params = []
+        pairs = []
+        drawn = []
+        for _ in range(count):
+            pair = reserve_balanced_pair(conn, pool, study)
+            # drawn now, so this worker's cache is warm when a seeded assignment is taken
+            spec, samples_json, sample_ids = draw_samples(conn, study, pool, pair)
+            pairs.append(pair)
+            drawn.append(sample_ids)
+            params.extend((study.name, json.dumps(list(pair)), spec, samples_json, pool.version, now))
+        db_execute(conn, insert_values_sql("pending_assignments(study, foundations, sample_spec, samples_json, pool_version, created_at)",
+                                           count, 6), params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if study.exposure_balanced:
+            for sample_ids in drawn:
+                study.exposure(pool).release(sample_ids)
+        raise
+    return count
+
+
+def drop_stale_assignments(conn, study: studies.Study, pool: SamplePool) -> int:
+    """Drop queued assignments drawn from another pool version (e.g. before a reload) and give back their
+    pair_counts reservations. Returns the number dropped."""
+    if ASSIGNMENT_MODE == "memory":
+        queued = list(study.prepared)
+        fresh = [a for a in queued if a[3] == pool.version]
+        dropped = len(queued) - len(fresh)
+        if dropped:
+            study.prepared.clear()
+            study.prepared.extend(fresh)
+            for prepared in queued:
+                if prepared[3] != pool.version:
+                    study.counts.release(prepared[0])
+        return dropped
+    try:
+        cur = db_execute(conn, "WITH d AS (DELETE FROM pending_assignments WHERE study = ? AND pool_version IS DISTINCT FROM ? "
+                               "RETURNING foundations) "
+                               "UPDATE pair_counts pc SET n = pc.n - x.c FROM (SELECT foundations, COUNT(*) AS c FROM d GROUP BY foundations) x "
+                               "WHERE pc.study = ? AND pc.foundations = x.foundations RETURNING x.c",
+                         (study.name, pool.version, study.name))
+        dropped = sum(c for (c,) in cur.fetchall())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return dropped
+
+
+def queued_assignments(conn, study: studies.Study, pool: SamplePool) -> int:
+    """Number of assignments ready for `study` with the current pool version."""
+    if ASSIGNMENT_MODE == "memory":
+        return len(study.prepared)
+    cur = db_execute(conn, "SELECT COUNT(*) FROM pending_assignments WHERE study = ? AND pool_version = ?",
+                     (study.name, pool.version))
+    n = cur.fetchone()[0]
+    conn.commit()
+    return n
+
+
+INSERT_PARTICIPANT_SQL = ("INSERT INTO participants(id, assigned_foundations, sample_spec, samples_json, created_at, name, "
+                          "pool_version, study) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+# Take the oldest queued assignment of the study's pool version and insert the participant with it, in one statement
+TAKE_PREPARED_SQL = ("WITH a AS (DELETE FROM pending_assignments WHERE id = ("
+                     "SELECT id FROM pending_assignments WHERE study = ? AND pool_version = ? "
+                     "ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING foundations, samples_json, sample_spec, pool_version) "
+                     "INSERT INTO participants(id, assigned_foundations, samples_json, sample_spec, created_at, name, pool_version, study) "
+                     "SELECT ?, foundations, samples_json, sample_spec, ?, ?, pool_version, ? FROM a "
+                     "RETURNING assigned_foundations, samples_json, sample_spec")
+
+
+def pop_prepared(study: studies.Study, pool: SamplePool) -> Optional[Tuple]:
+    """ASSIGNMENT_MODE=memory: the next queued (pair, spec, samples_json, version) of `pool`'s version, or None if
+    the queue is empty (which wakes the producer). Assignments of older versions are dropped."""
+    while True:
+        try:
+            prepared = study.prepared.popleft()
+        except IndexError:
+            _PRODUCER_WAKE.set()
+            return None
+        if prepared[3] == pool.version:
+            return prepared
+        study.counts.release(prepared[0])
+
+
+def taken_assignment(study: studies.Study, pool: SamplePool, row) -> Optional[Tuple[Tuple[str, ...], List[int]]]:
+    """(foundation set, sample ids) of the (assigned_foundations, samples_json, sample_spec) row returned by
+    TAKE_PREPARED_SQL, or None if the queue was empty (which wakes the producer). The participant is counted in
+    `study.counts` here (the producer counted the assignment in pair_counts only)."""
+    if row is None:
+        _PRODUCER_WAKE.set()
+        return None
+    pair = tuple(json.loads(row[0]))
+    study.counts.record(pair)
+    return pair, (json.loads(row[1]) if row[1] else assigned_sample_ids(study, pool, pair, row[2]))
+
+
+def take_prepared_assignment(conn, study: studies.Study, pool: SamplePool, pid: str,
+                             name: Optional[str]) -> Optional[Tuple[Tuple[str, ...], List[int]]]:
+    """Register participant `pid` with a queued assignment; returns (foundation set, sample ids), or None if the
+    queue is empty (the caller then assigns synchronously).
+
+    With ASSIGNMENT_MODE=db, taking the assignment and inserting the participant is a single statement.
+    An empty queue wakes the producer.
+    """
+    now = datetime.utcnow().isoformat()
+    if ASSIGNMENT_MODE == "memory":
+        prepared = pop_prepared(study, pool)
+        if prepared is None:
+            return None
+        pair, spec, samples_json, version = prepared
+        try:
+            db_execute(conn, INSERT_PARTICIPANT_SQL,
+                       (pid, json.dumps(list(pair)), spec, samples_json, now, name, version, study.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            study.prepared.appendleft(prepared)
+            raise
+        return pair, (json.loads(samples_json) if samples_json else assigned_sample_ids(study, pool, pair, spec))
+    try:
+        cur = db_execute(conn, TAKE_PREPARED_SQL, (study.name, pool.version, pid, now, name, study.name))
+        row = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return taken_assignment(study, pool, row)
+
+
+async def take_prepared_assignment_async(study: studies.Study, pool: SamplePool, pid: str,
+                                         name: Optional[str]) -> Optional[Tuple[Tuple[str, ...], List[int]]]:
+    """take_prepared_assignment on the asyncio database layer."""
+    now = datetime.utcnow().isoformat()
+    if ASSIGNMENT_MODE == "memory":
+        prepared = pop_prepared(study, pool)
+        if prepared is None:
+            return None
+        pair, spec, samples_json, version = prepared
+        try:
+            async with async_connection() as conn:
+                await db_async.execute(conn, INSERT_PARTICIPANT_SQL,
+                                       (pid, json.dumps(list(pair)), spec, samples_json, now, name, version, study.name))
+        except Exception:
+            study.prepared.appendleft(prepared)
+            raise
+        return pair, (json.loads(samples_json) if samples_json else assigned_sample_ids(study, pool, pair, spec))
+    async with async_connection() as conn:
+        row = await db_async.fetchrow(conn, TAKE_PREPARED_SQL, (study.name, pool.version, pid, now, name, study.name))
+    return taken_assignment(study, pool, row)
+
+
+# Largest number of assignments generated in one producer transaction
+PRODUCER_BATCH = 100
+
+
+# Advisory lock key (with the study name's hash) held by the worker filling a study's shared queue
+PRODUCER_LOCK_ID = 461301
+
+
+def fill_assignment_queue(conn, study: studies.Study, target: int) -> int:
+    """Top the study's queue up to `target` assignments (current pool version). Returns the number generated.
+
+    With ASSIGNMENT_MODE=db only one worker fills a study's queue at a time; the others skip it.
+    """
+    pool = study.pool()
+    if ASSIGNMENT_MODE != "memory":
+        cur = db_execute(conn, "SELECT pg_try_advisory_lock(?, hashtext(?))", (PRODUCER_LOCK_ID, study.name))
+        locked = cur.fetchone()[0]
+        conn.commit()
+        if not locked:
+            return 0
+    try:
+        drop_stale_assignments(conn, study, pool)
+        missing = target - queued_assignments(conn, study, pool)
+        made = 0
+        while made < missing:
+            made += produce_assignments(conn, study, pool, min(PRODUCER_BATCH, missing - made))
+        return made
+    finally:
+        if ASSIGNMENT_MODE != "memory":
+            db_execute(conn, "SELECT pg_advisory_unlock(?, hashtext(?))", (PRODUCER_LOCK_ID, study.name))
+            conn.commit()
+
+
+def run_assignment_producer():
+    """Background producer: keeps every loaded study with a queue_size at least half full.
+
+    Checks every second, and right away when a registration finds the queue empty. Checks a pooled
+    connection out for each study it tops up.
+    """
+    while not _POOL_WATCH_STOP.is_set():
+        _PRODUCER_WAKE.wait(1.0)
+        _PRODUCER_WAKE.clear()
+        for study in STUDIES:
+            if study.queue_size <= 0 or not study.loaded or _POOL_WATCH_STOP.is_set():
+                continue
+            try:
+                with DB_POOL.connection() as conn:
+                    pool = study.pool()
+                    if queued_assignments(conn, study, pool) <= study.queue_size // 2:
+                        fill_assignment_queue(conn, study, study.queue_size)
+            except Exception as e:
+                print(f"WARNING: study {study.name}: assignment producer failed:", e)
+                _POOL_WATCH_STOP.wait(5.0)
+
+
+async def read_name(request: Request) -> Optional[str]:
+    """The optional `name` from a JSON body like { "name": "Attendee Name" }."""
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    return body.get("name") if isinstance(body, dict) else None
+
+
+async def register_participant(study: studies.Study, name: Optional[str]) -> RawJSONResponse:
+    """Create a participant in `study` and assign them two foundations + the study's quota of samples."""
+    # use one pool version for the whole registration, even if a reload swaps the pool meanwhile;
+    # a study that is not loaded yet is loaded off the event loop
+    pool = study.pool() if study.loaded else await run_in_threadpool(study.pool)
+    if ADB is None:
+        return await run_in_threadpool(with_connection, create_participant, study, pool, name)
+    if not study_state_seeded(study, pool):
+        await run_in_threadpool(with_connection, seed_study_state, study, pool)
+    return await create_participant_async(study, pool, name)
+
+
+def study_state_seeded(study: studies.Study, pool: SamplePool) -> bool:
+    """Whether registrations in `study` have everything they read from the database once (see seed_study_state)."""
+    if study.targets.enabled and not study.targets.seeded:
+        return False
+    if study.exposure_balanced and not study.exposure(pool).seeded:
+        return False
+    if ASSIGNMENT_MODE == "memory":
+        return study.counts.seeded
+    return pair_keys_key(study, pool) in study.pair_keys
+
+
+def seed_study_state(conn, study: studies.Study, pool: SamplePool):
+    """Seed the in-memory state registrations in `study` read from the database on first use (rating targets,
+    exposure, pair counts or pair_counts rows), so create_participant_async never needs a psycopg2 connection."""
+    if study.targets.enabled:
+        study.targets.seed(lambda: get_rating_counts(conn, study.name))
+    if study.exposure_balanced:
+        seeded_exposure(conn, study, pool)
+    if ASSIGNMENT_MODE == "memory":
+        study.counts.seed(lambda: assigned_set_counts(conn, study))
+    else:
+        ensure_pair_rows(conn, study, pool)
+
+
+async def create_participant_async(study: studies.Study, pool: SamplePool, name: Optional[str]) -> RawJSONResponse:
+    """create_participant on the asyncio database layer (the study's state is seeded, so the shared helpers get
+    no connection)."""
+    check_study_full(None, study, pool)
+    pid = str(uuid.uuid4())
+    prepared = await take_prepared_assignment_async(study, pool, pid, name) if study.queue_size > 0 else None
+    if prepared is not None:
+        return participant_response(pool, pid, prepared[1], name)
+
+    in_memory = ASSIGNMENT_MODE == "memory"
+    pair = None
+    sample_ids = None
+    try:
+        async with async_connection(transaction=True) as conn:
+            if in_memory:
+                pair = choose_balanced_pair(None, pool, study)
+            else:
+                pair = await reserve_balanced_pair_async(conn, pool, study)
+            if study.exposure_balanced or study.targets.item_target:
+                # weighted draws can fall back to scanning a block; keep them off the event loop
+                spec, samples_json, sample_ids = await run_in_threadpool(draw_samples, None, study, pool, pair)
             else:
-                chosen_gen_f.extend(others)
-
-        # combine and shuffle within this foundation block
-        block = chosen_orig_f + chosen_gen_f
-        random.shuffle(block)
-
-        # record chosen ids and append block to final list
-        for s in block:
-            already_chosen.add(s["id"])
-            chosen_samples.append(s)
-
-    # If still short, fill from remaining samples (preserve order by shuffling the remaining but appending as extra block)
-    if len(chosen_samples) < TOTAL_PER_PARTICIPANT:
-        needed = TOTAL_PER_PARTICIPANT - len(chosen_samples)
-        pool_remain = [s for s in SAMPLES if s["id"] not in already_chosen]
-        if len(pool_remain) >= needed:
-            extra = random.sample(pool_remain, needed)
+                spec, samples_json, sample_ids = draw_samples(None, study, pool, pair)
+            await db_async.execute(conn, INSERT_PARTICIPANT_SQL,
+                                   (pid, json.dumps(list(pair)), spec, samples_json, datetime.utcnow().isoformat(),
+                                    name, pool.version, study.name))
+    except Exception:
+        # the transaction was rolled back with the pair reservation
+        if in_memory and pair is not None:
+            study.counts.release(pair)
+        if study.exposure_balanced and sample_ids is not None:
+            study.exposure(pool).release(sample_ids)
+        raise
+    if not in_memory:
+        study.counts.record(pair)
+    return participant_response(pool, pid, sample_ids, name)
+
+
+def create_participant(conn, study: studies.Study, pool: SamplePool, name: Optional[str]) -> RawJSONResponse:
+    """The database part of register_participant, on a checked-out connection."""
+    in_memory = ASSIGNMENT_MODE == "memory"
+    if not in_memory:
+        ensure_pair_rows(conn, study, pool)
+    check_study_full(conn, study, pool)
+    pid = str(uuid.uuid4())
+    # an assignment prepared by the producer only needs the participant insert
+    prepared = take_prepared_assignment(conn, study, pool, pid, name) if study.queue_size > 0 else None
+    if prepared is not None:
+        return participant_response(pool, pid, prepared[1], name)
+
+    # choose and reserve a balanced pair (in memory, or in the registration's transaction)
+    pair = None
+    sample_ids = None
+    try:
+        if in_memory:
+            pair = choose_balanced_pair(conn, pool, study)
         else:
-            extra = pool_remain
-        # shuffle extra to avoid deterministic fallback ordering
-        random.shuffle(extra)
-        for s in extra:
-            chosen_samples.append(s)
+            pair = reserve_balanced_pair(conn, pool, study)
 
-    # Return ids preserving block order (no cross-foundation shuffling)
-    return [s["id"] for s in chosen_samples]
+        # uniform samples are drawn from a recorded seed, so they can be regenerated instead of stored
+        spec, samples_json, sample_ids = draw_samples(conn, study, pool, pair)
+
+        # include name when inserting (nullable)
+        db_execute(conn, INSERT_PARTICIPANT_SQL,
+                   (pid, json.dumps(list(pair)), spec, samples_json, datetime.utcnow().isoformat(), name, pool.version,
+                    study.name))
+        conn.commit()
+    except Exception:
+        # release the pair reservation together with the failed insert
+        conn.rollback()
+        if in_memory and pair is not None:
+            study.counts.release(pair)
+        if study.exposure_balanced and sample_ids is not None:
+            study.exposure(pool).release(sample_ids)
+        raise
+    if not in_memory:
+        study.counts.record(pair)
+
+    # return participant info and sample list (with scenario text), in assignment order
+    # Do NOT return assigned_foundations to participants (hide foundation names)
+    return participant_response(pool, pid, sample_ids, name)
 
 
 @app.post("/register")
 async def register(request: Request):
-    """Create a participant and assign them two foundations + 30 samples.
+    """Create a participant in the default study and assign them two foundations + 30 samples.
 
     Accepts optional JSON body: { "name": "Attendee Name" }
     """
-    if DB is None:
-        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
-    conn = DB
-    # parse optional name from request body (frontend may send {name})
+    return await register_participant(STUDIES.get(DEFAULT_STUDY), await read_name(request))
+
+
+@app.post("/studies/{study}/register")
+async def register_in_study(study: str, request: Request):
+    """Create a participant in `study` (same body and response as /register)."""
+    return await register_participant(get_study(study), await read_name(request))
+
+
+# Most participants one /register/batch call may create
+REGISTER_BATCH_MAX = int(os.environ.get("REGISTER_BATCH_MAX", "500"))
+
+
+def participant_link(study: studies.Study, pid: str) -> str:
+    """Frontend link that resumes participant `pid` (see static/app.js)."""
+    return f"/?pid={pid}" if study.name == DEFAULT_STUDY else f"/?study={study.name}&pid={pid}"
+
+
+async def read_batch(request: Request) -> List[Optional[str]]:
+    """The participant names of a batch body { "count": N, "names": ["Attendee", ...] } (None for unnamed ones).
+
+    `count` defaults to the number of names; names beyond `count` are ignored.
+    """
     try:
         body = await request.json()
     except Exception:
-        body = {}
-    name = body.get("name") if isinstance(body, dict) else None
+        body = None
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail='expected a JSON body like {"count": 30, "names": [...]}')
+    names = body.get("names") or []
+    if not isinstance(names, list):
+        raise HTTPException(status_code=400, detail="names must be a list")
+    try:
+        count = int(body.get("count", len(names)))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="count must be an integer")
+    if not 1 <= count <= REGISTER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {REGISTER_BATCH_MAX}")
+    names = [str(n) if n else None for n in names[:count]]
+    return names + [None] * (count - len(names))
 
-    # choose balanced pair
-    pair = choose_balanced_pair(conn)
-    pid = str(uuid.uuid4())
 
-    sample_ids = sample_for_pair(pair, SAMPLE_ORIGINAL_COUNT, SAMPLE_GENERATED_COUNT)
+async def register_batch_participants(study: studies.Study, names: List[Optional[str]]) -> Dict:
+    """Create one participant per entry of `names` in `study`, in one transaction.
 
-    # include name when inserting (nullable)
-    db_execute(conn, "INSERT INTO participants(id, assigned_foundations, samples_json, created_at, name) VALUES (?, ?, ?, ?, ?)",
-               (pid, json.dumps(list(pair)), json.dumps(sample_ids), datetime.utcnow().isoformat(), name))
-    conn.commit()
+    The batch's foundation sets are chosen together (balanced across the batch) and all participant rows go
+    in with a single INSERT, so a class of N costs a handful of statements instead of N registrations.
+    Participants get links to their tasks rather than their samples.
+    """
+    pool = study.pool() if study.loaded else await run_in_threadpool(study.pool)
+    return await run_in_threadpool(with_connection, create_participants, study, pool, names)
+
+
+def create_participants(conn, study: studies.Study, pool: SamplePool, names: List[Optional[str]]) -> Dict:
+    """The database part of register_batch_participants, on a checked-out connection."""
+    in_memory = ASSIGNMENT_MODE == "memory"
+    if not in_memory:
+        ensure_pair_rows(conn, study, pool)
+    check_study_full(conn, study, pool)
+    now = datetime.utcnow().isoformat()
+    pairs: List[Tuple[str, ...]] = []
+    drawn: List[List[int]] = []
+    participants = []
+    try:
+        if in_memory:
+            for _ in names:
+                pairs.append(choose_balanced_pair(conn, pool, study))
+        else:
+            pairs = reserve_balanced_sets(conn, pool, study, len(names))
+        params = []
+        for pair, name in zip(pairs, names):
+            pid = str(uuid.uuid4())
+            spec, samples_json, sample_ids = draw_samples(conn, study, pool, pair)
+            drawn.append(sample_ids)
+            params.extend((pid, json.dumps(list(pair)), spec, samples_json, now, name, pool.version, study.name))
+            participants.append({"participant_id": pid, "name": name, "link": participant_link(study, pid)})
+        db_execute(conn, insert_values_sql("participants(id, assigned_foundations, sample_spec, samples_json, created_at, name, pool_version, study)",
+                                           len(names), 8), params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if in_memory:
+            for pair in pairs:
+                study.counts.release(pair)
+        if study.exposure_balanced:
+            for sample_ids in drawn:
+                study.exposure(pool).release(sample_ids)
+        raise
+    if not in_memory:
+        for pair in pairs:
+            study.counts.record(pair)
+    return {"study": study.name, "pool_version": pool.version, "participants": participants}
+
+
+@app.post("/register/batch")
+async def register_batch(request: Request):
+    """Create several participants in the default study in one call (e.g. a classroom session).
+
+    Body: { "count": 30, "names": ["Attendee Name", ...] } (both optional, at least one of them).
+    Returns { "study", "pool_version", "participants": [{"participant_id", "name", "link"}, ...] }.
+    """
+    return await register_batch_participants(STUDIES.get(DEFAULT_STUDY), await read_batch(request))
 
-    # return participant info and sample list (with scenario text)
-    samples = [s for s in SAMPLES if s["id"] in sample_ids]
-    # maintain order of sample_ids and strip foundation before returning to participant
-    id_to_sample = {s["id"]: s for s in samples}
-    ordered = []
-    for sid in sample_ids:
-        s = id_to_sample[sid]
-        s_copy = {k: v for k, v in s.items() if k != "foundation"}
-        ordered.append(s_copy)
-    # Do NOT return assigned_foundations to participants (hide foundation names)
-    return {"participant_id": pid, "samples": ordered, "name": name}
+
+@app.post("/studies/{study}/register/batch")
+async def register_batch_in_study(study: str, request: Request):
+    """Create several participants in `study` (same body and response as /register/batch)."""
+    return await register_batch_participants(get_study(study), await read_batch(request))
 
 
 @app.get("/participant/{pid}/samples")
-def get_participant_samples(pid: str):
-    if DB is None:
-        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
-    cur = db_execute(DB, "SELECT samples_json, assigned_foundations, name FROM participants WHERE id = ?", (pid,))
-    row = cur.fetchone()
-    if not row:
-        raise HTTPException(status_code=404, detail="participant not found")
-    samples_json, assigned_foundations, name = row
-    sample_ids = json.loads(samples_json)
-    samples = [s for s in SAMPLES if s["id"] in sample_ids]
-    id_to_sample = {s["id"]: s for s in samples}
-    ordered = []
-    for sid in sample_ids:
-        s = id_to_sample[sid]
-        s_copy = {k: v for k, v in s.items() if k != "foundation"}
-        ordered.append(s_copy)
+async def get_participant_samples(pid: str):
+    if ADB is None:
+        study, row = await run_in_threadpool(with_connection, participant_assignment, pid)
+    else:
+        async with async_connection() as conn:
+            study, row = participant_row(await db_async.fetchrow(conn, PARTICIPANT_ROW_SQL, (pid,)))
+    samples_json, assigned_foundations, name, pool_version, sample_spec = row
+    args = (study, pool_version, assigned_foundations, samples_json, sample_spec)
+    if study.loaded and (not pool_version or study.has_version(pool_version)):
+        pool, sample_ids = participant_sample_ids(*args)
+    else:
+        # loading the study's pool or mapping an archived version is blocking file I/O: keep it off the event loop
+        pool, sample_ids = await run_in_threadpool(participant_sample_ids, *args)
     # Do NOT return assigned_foundations to participants (hide foundation names)
-    return {"participant_id": pid, "samples": ordered, "name": name}
+    return participant_response(pool, pid, sample_ids, name)
 
 
-@app.post("/submit")
-def submit(resp: Dict):
-    """Submit a single rating. Expected JSON: {participant_id, sample_id, rating (0-4), note (optional)}"""
-    pid = resp.get("participant_id")
-    sample_id = resp.get("sample_id")
-    rating = resp.get("rating")
-    note = resp.get("note", "")
-    if pid is None or sample_id is None or rating is None:
-        raise HTTPException(status_code=400, detail="participant_id, sample_id, rating required")
+PARTICIPANT_ROW_SQL = "SELECT samples_json, assigned_foundations, name, pool_version, sample_spec, study FROM participants WHERE id = ?"
+
+
+def participant_assignment(conn, pid: str) -> Tuple[studies.Study, tuple]:
+    """Return (study, (samples_json, assigned_foundations, name, pool_version, sample_spec)) of a participant."""
+    return participant_row(db_execute(conn, PARTICIPANT_ROW_SQL, (pid,)).fetchone())
+
+
+def participant_row(row) -> Tuple[studies.Study, tuple]:
+    """participant_assignment's result from a PARTICIPANT_ROW_SQL row (404 if there is none)."""
+    if not row:
+        raise HTTPException(status_code=404, detail="participant not found")
+    study_name = row[5]
+    study = STUDIES.get(study_name or DEFAULT_STUDY)
+    if study is None:
+        raise HTTPException(status_code=404, detail=f"study {study_name!r} is not served here")
+    return study, tuple(row[:5])
+
+
+PARTICIPANTS_STUDY_SQL = "SELECT id, assigned_foundations, study, pool_version FROM participants WHERE id = ANY(?)"
+# The ratings of one or more submissions in one statement (the arrays are zipped row by row), and their counts towards
+# the rating targets in another (one row per study and set / sample, in key order so concurrent writes lock them in the
+# same order)
+INSERT_RESPONSES_SQL = ("INSERT INTO responses(participant_id, sample_id, rating, ts) "
+                        "SELECT unnest(?::text[]), unnest(?::int[]), unnest(?::int[]), ?")
+COUNT_RATINGS_SQL = ("INSERT INTO rating_counts (study, kind, key, n) "
+                     "SELECT * FROM unnest(?::text[], ?::text[], ?::text[], ?::int[]) ORDER BY 1, 2, 3 "
+                     "ON CONFLICT (study, kind, key) DO UPDATE SET n = rating_counts.n + EXCLUDED.n")
+# With the submission spool on, a rating may reach the database twice (a write abandoned after SUBMIT_SPOOL_AFTER that
+# commits after all, a replayed batch, the same participant's ratings in two workers' spool files), so ratings are
+# only stored for (participant, sample) pairs without a response yet, keeping the time they were submitted. The
+# writing transaction first takes an advisory lock per participant (in id order, so writers never deadlock): without
+# it two concurrent transactions could both find the pair missing.
+RESPONSES_LOCK_ID = 461302
+LOCK_PARTICIPANTS_SQL = "SELECT pg_advisory_xact_lock(?, hashtext(p)) FROM unnest(?::text[]) AS p"
+INSERT_NEW_RESPONSES_SQL = ("INSERT INTO responses(participant_id, sample_id, rating, ts) "
+                            "SELECT s.* FROM unnest(?::text[], ?::int[], ?::int[], ?::text[]) "
+                            "AS s(participant_id, sample_id, rating, ts) "
+                            "WHERE NOT EXISTS (SELECT 1 FROM responses r "
+                            "WHERE r.participant_id = s.participant_id AND r.sample_id = s.sample_id) "
+                            "RETURNING participant_id, sample_id, rating")
+# Most ratings one /submit/batch call may carry
+SUBMIT_BATCH_MAX = int(os.environ.get("SUBMIT_BATCH_MAX", "500"))
+# Group commit for /submit and /submit/batch: with SUBMIT_COALESCE_MS > 0, submissions arriving within that many
+# milliseconds (or until SUBMIT_COALESCE_ROWS ratings are pending) are written with one multi-row insert and one commit,
+# and each is acknowledged once that commit is done. Batch sizes are reported by GET /admin/db/coalescer.
+SUBMIT_COALESCE_MS = float(os.environ.get("SUBMIT_COALESCE_MS", "0"))
+SUBMIT_COALESCE_ROWS = int(os.environ.get("SUBMIT_COALESCE_ROWS", "200"))
+# Submission spool (spool.py): with SUBMIT_SPOOL_DIR set, ratings the database cannot take (unavailable, or no commit
+# within SUBMIT_SPOOL_AFTER seconds; 0 waits as long as the write takes) are appended to an fsync'd file in that directory
+# and acknowledged ({"spooled": true}) instead of failing; every SUBMIT_SPOOL_REPLAY_SECONDS a background replayer
+# writes them to the database in batches of SUBMIT_SPOOL_BATCH, skipping (participant, sample) pairs already stored
+# (as /submit itself then does, see INSERT_NEW_RESPONSES_SQL).
+# Off by default (no local files are written).
+SUBMIT_SPOOL_DIR = os.environ.get("SUBMIT_SPOOL_DIR")
+SUBMIT_SPOOL_AFTER = float(os.environ.get("SUBMIT_SPOOL_AFTER", "5"))
+SUBMIT_SPOOL_BATCH = int(os.environ.get("SUBMIT_SPOOL_BATCH", "500"))
+SUBMIT_SPOOL_REPLAY_SECONDS = float(os.environ.get("SUBMIT_SPOOL_REPLAY_SECONDS", "1"))
+
+
+def parse_rating(sample_id, rating) -> Tuple[int, int]:
+    """(sample_id, rating) as integers (400 if invalid)."""
     try:
         rating = int(rating)
     except Exception:
         raise HTTPException(status_code=400, detail="rating must be integer")
+    try:
+        sample_id = int(sample_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="sample_id must be integer")
+    # responses.sample_id is an INTEGER column: anything outside it would fail the whole (coalesced) insert
+    if not (0 <= sample_id < 2 ** 31):
+        raise HTTPException(status_code=400, detail="sample_id out of range")
     # Ratings now use a 1-5 scale (previously 0-4). Validate accordingly.
     if not (1 <= rating <= 5):
         raise HTTPException(status_code=400, detail="rating must be 1..5")
+    return sample_id, rating
 
-    if DB is None:
-        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
-    cur = db_execute(DB, "SELECT samples_json FROM participants WHERE id = ?", (pid,))
-    # Optionally: check participant and that sample belongs to their assigned samples
-    row = cur.fetchone()
-    if not row:
-        raise HTTPException(status_code=404, detail="participant not found")
-    samples_json = row[0]
-    sample_ids = json.loads(samples_json)
-    if sample_id not in sample_ids:
-        # allow submission but warn
-        pass
 
-    # store response without optional note (notes are no longer collected)
-    db_execute(DB, "INSERT INTO responses(participant_id, sample_id, rating, ts) VALUES (?, ?, ?, ?)",
-               (pid, sample_id, rating, datetime.utcnow().isoformat()))
-    DB.commit()
-    return {"ok": True}
+def read_rating(resp: Dict) -> Tuple[str, List[Tuple[int, int]]]:
+    """(participant_id, [(sample_id, rating)]) of a /submit body (400 if invalid)."""
+    pid = resp.get("participant_id")
+    sample_id = resp.get("sample_id")
+    rating = resp.get("rating")
+    if pid is None or sample_id is None or rating is None:
+        raise HTTPException(status_code=400, detail="participant_id, sample_id, rating required")
+    return str(pid), [parse_rating(sample_id, rating)]
 
 
-@app.get("/admin/assignments")
-def admin_assignments():
-    """Return counts of how many participants have each foundation pair, and counts of each single foundation assignment."""
-    if DB is None:
-        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
-    cur = db_execute(DB, "SELECT assigned_foundations FROM participants")
-    rows = cur.fetchall()
-    pair_counts = Counter()
-    single_counts = Counter()
-    for (af,) in rows:
-        if not af:
+def read_ratings(resp: Dict) -> Tuple[str, List[Tuple[int, int]]]:
+    """(participant_id, [(sample_id, rating)]) of a /submit/batch body
+    { "participant_id": ..., "ratings": [{"sample_id": ..., "rating": ...}, ...] } (400 if invalid)."""
+    pid = resp.get("participant_id")
+    ratings = resp.get("ratings")
+    if pid is None or not isinstance(ratings, list) or not ratings:
+        raise HTTPException(status_code=400, detail="participant_id and a non-empty ratings list required")
+    if len(ratings) > SUBMIT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {SUBMIT_BATCH_MAX} ratings per batch")
+    parsed = []
+    for item in ratings:
+        if not isinstance(item, dict) or item.get("sample_id") is None or item.get("rating") is None:
+            raise HTTPException(status_code=400, detail="every rating needs sample_id and rating")
+        parsed.append(parse_rating(item["sample_id"], item["rating"]))
+    return str(pid), parsed
+
+
+# A participant's ratings: (participant_id, [(sample_id, rating), ...])
+Submission = Tuple[str, List[Tuple[int, int]]]
+
+
+def ratings_params(submissions: List[Submission], rows: Dict[str, tuple]) -> Tuple[tuple, tuple]:
+    """Parameters of INSERT_RESPONSES_SQL and COUNT_RATINGS_SQL for the submissions whose participant has a row in
+    `rows` (participant id -> (assigned_foundations, study, pool_version))."""
+    pids, sample_ids, ratings = [], [], []
+    counts = Counter()
+    for pid, submitted in submissions:
+        if pid not in rows:
             continue
+        assigned_foundations, study_name, pool_version = rows[pid]
+        for sample_id, rating in submitted:
+            pids.append(pid)
+            sample_ids.append(sample_id)
+            ratings.append(rating)
+            counts[study_name, "item", rating_item_key(pool_version, sample_id)] += 1
+        counts[study_name, "set", assigned_foundations] += len(submitted)
+    keys = list(counts)
+    return ((pids, sample_ids, ratings, datetime.utcnow().isoformat()),
+            ([k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys], [counts[k] for k in keys]))
+
+
+def new_responses_params(records: List[Tuple[str, int, int, str]]) -> Tuple[tuple, tuple]:
+    """Parameters of LOCK_PARTICIPANTS_SQL and INSERT_NEW_RESPONSES_SQL for (participant_id, sample_id, rating, ts)
+    records; the first record of a (participant, sample) pair wins."""
+    first = {}
+    for record in records:
+        first.setdefault(record[:2], record)
+    pids, sample_ids, ratings, ts = (list(column) for column in zip(*first.values()))
+    return (RESPONSES_LOCK_ID, sorted(set(pids))), (pids, sample_ids, ratings, ts)
+
+
+def stored_ratings(returned) -> Dict[str, List[Tuple[int, int]]]:
+    """participant id -> [(sample_id, rating)] of the rows INSERT_NEW_RESPONSES_SQL returned."""
+    stored = defaultdict(list)
+    for pid, sample_id, rating in returned:
+        stored[pid].append((sample_id, rating))
+    return stored
+
+
+def found_ratings(submissions: List[Submission], rows: Dict[str, tuple]) -> List[Tuple[str, int, int, str]]:
+    """(participant_id, sample_id, rating, ts) records of the submissions whose participant has a row in `rows`."""
+    ts = datetime.utcnow().isoformat()
+    return [(pid, sample_id, rating, ts) for pid, submitted in submissions if pid in rows
+            for sample_id, rating in submitted]
+
+
+def store_submissions(conn, submissions: List[Submission]) -> Tuple[Dict[str, tuple], Dict[str, list]]:
+    """Insert the ratings of one or more submissions and count them towards the rating targets in one transaction
+    (three statements however many ratings; with the spool on, only ratings of pairs without a response, see
+    INSERT_NEW_RESPONSES_SQL). Returns (participant id -> (assigned_foundations, study, pool_version) of the
+    participants found, participant id -> [(sample_id, rating)] stored). Submissions of unknown participants are
+    skipped."""
+    # check the participants exist (samples outside their assignment are accepted, so the ids are not loaded)
+    cur = db_execute(conn, PARTICIPANTS_STUDY_SQL, (list({pid for pid, _ in submissions}),))
+    rows = {pid: (foundations, study_name, version) for pid, foundations, study_name, version in cur.fetchall()}
+    stored = {}
+    if rows:
+        if SPOOL is None:
+            responses, counts = ratings_params(submissions, rows)
+            # store responses without optional note (notes are no longer collected)
+            db_execute(conn, INSERT_RESPONSES_SQL, responses)
+            stored = stored_ratings(zip(*responses[:3]))
+        else:
+            lock, responses = new_responses_params(found_ratings(submissions, rows))
+            db_execute(conn, LOCK_PARTICIPANTS_SQL, lock)
+            stored = stored_ratings(db_execute(conn, INSERT_NEW_RESPONSES_SQL, responses).fetchall())
+            _, counts = ratings_params(list(stored.items()), rows)
+        if stored:
+            db_execute(conn, COUNT_RATINGS_SQL, counts)
+    conn.commit()
+    return rows, stored
+
+
+async def store_submissions_async(submissions: List[Submission]) -> Tuple[Dict[str, tuple], Dict[str, list]]:
+    """store_submissions on the asyncio database layer."""
+    async with async_connection(transaction=True) as conn:
+        found = await conn.fetch(db_async.dollar_params(PARTICIPANTS_STUDY_SQL), list({pid for pid, _ in submissions}))
+        rows = {pid: (foundations, study_name, version) for pid, foundations, study_name, version in found}
+        stored = {}
+        if rows:
+            if SPOOL is None:
+                responses, counts = ratings_params(submissions, rows)
+                await db_async.execute(conn, INSERT_RESPONSES_SQL, responses)
+                stored = stored_ratings(zip(*responses[:3]))
+            else:
+                lock, responses = new_responses_params(found_ratings(submissions, rows))
+                await db_async.execute(conn, LOCK_PARTICIPANTS_SQL, lock)
+                stored = stored_ratings(await db_async.fetch(conn, INSERT_NEW_RESPONSES_SQL, responses))
+                _, counts = ratings_params(list(stored.items()), rows)
+            if stored:
+                await db_async.execute(conn, COUNT_RATINGS_SQL, counts)
+    return rows, stored
+
+
+async def write_submissions(submissions: List[Submission]) -> List:
+    """Store submissions (on the asyncio layer, or the threaded pool off the event loop) and count the stored ratings
+    in memory; returns per submission the number of its ratings stored (fewer than submitted when the spool's
+    deduplication skipped some), or the 404 error of an unknown participant. The coalescer's write function."""
+    if ADB is None:
+        rows, stored = await run_in_threadpool(with_connection, store_submissions, submissions)
+    else:
+        rows, stored = await store_submissions_async(submissions)
+    for pid, ratings in stored.items():
+        count_ratings(*rows[pid], ratings)
+    # hand each stored rating to the first submission of the batch that carries it
+    left = {pid: Counter(ratings) for pid, ratings in stored.items()}
+    results = []
+    for pid, ratings in submissions:
+        if pid not in rows:
+            results.append(HTTPException(status_code=404, detail="participant not found"))
+            continue
+        n = 0
+        for rating in ratings:
+            if left.get(pid, {}).get(rating, 0) > 0:
+                left[pid][rating] -= 1
+                n += 1
+        results.append(n)
+    return results
+
+
+def count_ratings(assigned_foundations: str, study_name: str, pool_version: Optional[str],
+                  ratings: List[Tuple[int, int]]):
+    """Count stored ratings in their study's in-memory rating targets."""
+    study = STUDIES.get(study_name)
+    if study is not None and study.targets.seeded:
+        foundations = json.loads(assigned_foundations)
+        for sample_id, _ in ratings:
+            study.targets.record(foundations, pool_version, sample_id)
+
+
+# a batch that fails for another reason than the database being unavailable is retried submission by submission,
+# so one bad submission does not fail the others coalesced with it
+SUBMIT_COALESCER = (write_coalescer.WriteCoalescer(write_submissions, SUBMIT_COALESCE_MS / 1e3, SUBMIT_COALESCE_ROWS,
+                                                   rows=lambda submission: len(submission[1]),
+                                                   split_on=lambda exc: not database_unavailable(exc))
+                    if SUBMIT_COALESCE_MS > 0 else None)
+
+
+async def store_ratings(pid: str, ratings: List[Tuple[int, int]]) -> int:
+    """Store a participant's ratings, in the coalescer's next batch if group commit is on; returns how many were
+    stored."""
+    if SUBMIT_COALESCER is not None:
+        return await SUBMIT_COALESCER.submit((pid, ratings))
+    result = (await write_submissions([(pid, ratings)]))[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+SPOOL = spool.SubmissionSpool(Path(SUBMIT_SPOOL_DIR)) if SUBMIT_SPOOL_DIR else None
+
+
+def database_unavailable(exc: BaseException) -> bool:
+    """Whether a failed write means the database is unavailable or too slow (so the ratings are spooled)."""
+    if isinstance(exc, HTTPException):
+        return exc.status_code == 503
+    return isinstance(exc, asyncio.TimeoutError) or db_pool.is_connection_error(exc)
+
+
+async def submit_ratings(pid: str, ratings: List[Tuple[int, int]]) -> Dict:
+    """Store a participant's ratings; with the spool on, ratings the database cannot take are spooled instead
+    (see SUBMIT_SPOOL_DIR). Returns the response body: {"ok": true, "stored": ratings stored} (with the spool on,
+    ratings of samples the participant already rated are not stored again), or {"ok": true, "spooled": true}
+    when spooled (whether they are stored is only known once replayed)."""
+    if SPOOL is None:
+        return {"ok": True, "stored": await store_ratings(pid, ratings)}
+    if DB_POOL is not None:
         try:
-            pair = tuple(json.loads(af))
-            if len(pair) == 2:
-                pair_counts[pair] += 1
-                single_counts[pair[0]] += 1
-                single_counts[pair[1]] += 1
-        except Exception:
+            # a write cut short here may still commit; the replay then skips its ratings
+            return {"ok": True, "stored": await asyncio.wait_for(store_ratings(pid, ratings), SUBMIT_SPOOL_AFTER or None)}
+        except Exception as e:
+            if not database_unavailable(e):
+                raise
+    ts = datetime.utcnow().isoformat()
+    await run_in_threadpool(SPOOL.append, [{"participant_id": pid, "sample_id": sample_id, "rating": rating, "ts": ts}
+                                           for sample_id, rating in ratings])
+    return {"ok": True, "spooled": True}
+
+
+@app.post("/submit")
+async def submit(resp: Dict):
+    """Submit a single rating. Expected JSON: {participant_id, sample_id, rating (1-5), note (optional, ignored)}"""
+    return await submit_ratings(*read_rating(resp))
+
+
+@app.post("/submit/batch")
+async def submit_batch(resp: Dict):
+    """Submit all of a participant's ratings at once (one participant lookup, one multi-row insert, one commit).
+    Expected JSON: {participant_id, ratings: [{sample_id, rating (1-5)}, ...]} (at most SUBMIT_BATCH_MAX ratings)."""
+    return await submit_ratings(*read_ratings(resp))
+
+
+def replay_spooled(conn, records: List[Dict]) -> int:
+    """Store a batch of spooled ratings (spool records) and count them towards the rating targets in one transaction;
+    records of unknown participants and (participant, sample) pairs already stored are skipped (the first record of a
+    pair in the batch wins). Returns the number of ratings stored. The spool replayer's write function."""
+    cur = db_execute(conn, PARTICIPANTS_STUDY_SQL, (list({r["participant_id"] for r in records}),))
+    rows = {pid: (foundations, study_name, version) for pid, foundations, study_name, version in cur.fetchall()}
+    replayed = [(r["participant_id"], r["sample_id"], r["rating"], r["ts"]) for r in records
+                if r["participant_id"] in rows]
+    if not replayed:
+        conn.commit()
+        return 0
+    lock, responses = new_responses_params(replayed)
+    db_execute(conn, LOCK_PARTICIPANTS_SQL, lock)
+    stored = stored_ratings(db_execute(conn, INSERT_NEW_RESPONSES_SQL, responses).fetchall())
+    if stored:
+        _, counts = ratings_params(list(stored.items()), rows)
+        db_execute(conn, COUNT_RATINGS_SQL, counts)
+    conn.commit()
+    for pid, ratings in stored.items():
+        count_ratings(*rows[pid], ratings)
+    return sum(len(ratings) for ratings in stored.values())
+
+
+def connect_database() -> bool:
+    """Open the database (connection pool, schema, assignment producer, asyncio layer) if it was unavailable at
+    startup; returns whether it is open."""
+    global DB_POOL
+    if DB_POOL is not None:
+        return True
+    try:
+        pool = init_db()
+    except Exception:
+        return False
+    DB_POOL = pool
+    print("Database available again")
+    threading.Thread(target=run_assignment_producer, name="assignment-producer", daemon=True).start()
+    if _LOOP is not None:
+        asyncio.run_coroutine_threadsafe(open_async_db(), _LOOP)
+    return True
+
+
+def run_spool_replayer():
+    """Background replayer: every SUBMIT_SPOOL_REPLAY_SECONDS, writes the spooled ratings to the database (connecting
+    first if it was unavailable at startup). A failed replay keeps the rest spooled for the next round."""
+    failing = False
+    while not _POOL_WATCH_STOP.wait(SUBMIT_SPOOL_REPLAY_SECONDS):
+        if not connect_database():
             continue
-    return {"pair_counts": dict(pair_counts), "single_counts": dict(single_counts)}
+        try:
+            replayed = SPOOL.replay(lambda records: with_connection(replay_spooled, records), SUBMIT_SPOOL_BATCH)
+        except Exception as e:
+            if not failing:
+                print("WARNING: replaying spooled submissions failed (retrying):", getattr(e, "detail", e))
+            failing = True
+            continue
+        failing = False
+        if replayed:
+            print(f"Replayed {replayed} spooled ratings")
+
+
+@app.get("/admin/assignments")
+def admin_assignments(study: str = DEFAULT_STUDY):
+    """Return counts of how many participants of `study` have each foundation pair, and counts of each single foundation assignment."""
+    with db_connection() as conn:
+        pair_counts = get_foundation_pair_counts(conn, study)
+    single_counts = Counter()
+    for pair, n in pair_counts.items():
+        for foundation in pair:
+            single_counts[foundation] += n
+    # JSON object keys must be strings: "A + B"
+    return {"pair_counts": {" + ".join(pair): n for pair, n in pair_counts.items()}, "single_counts": dict(single_counts)}
+
+
+@app.get("/admin/participant/{pid}/assignment")
+def admin_participant_assignment(pid: str):
+    """Audit one participant's assignment: foundations, pool version, sample spec and the (regenerated) sample ids."""
+    with db_connection() as conn:
+        study, (samples_json, assigned_foundations, name, pool_version, sample_spec) = participant_assignment(conn, pid)
+    pool, sample_ids = participant_sample_ids(study, pool_version, assigned_foundations, samples_json, sample_spec)
+    return {"participant_id": pid, "study": study.name, "name": name, "foundations": json.loads(assigned_foundations),
+            "pool_version": pool_version, "sample_spec": sample_spec, "reproducible": bool(sample_spec and not samples_json),
+            "sample_ids": sample_ids}
 
 
 @app.get("/admin/responses")
-def admin_responses():
-    """Return basic aggregated response info: counts per foundation and per label, and raw responses (limited)."""
-    if DB is None:
-        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
-    cur = db_execute(DB, "SELECT participant_id, sample_id, rating, ts FROM responses ORDER BY ts DESC LIMIT 2000")
-    rows = cur.fetchall()
+def admin_responses(study: str = DEFAULT_STUDY):
+    """Return basic aggregated response info for `study`: counts per foundation and per label, and raw responses (limited)."""
+    pool = get_study(study).pool()
+    with db_connection() as conn:
+        cur = db_execute(conn, "SELECT r.participant_id, r.sample_id, r.rating, r.ts FROM responses r "
+                               "JOIN participants p ON p.id = r.participant_id WHERE p.study = ? ORDER BY r.ts DESC LIMIT 2000",
+                         (study,))
+        rows = cur.fetchall()
     # aggregate counts per foundation by looking up sample foundation
     agg = defaultdict(lambda: {"original": 0, "generated": 0, "total": 0})
     raw = []
     for (pid, sample_id, rating, ts) in rows:
-        sample = next((s for s in SAMPLES if s["id"] == sample_id), None)
-        if sample:
-            f = sample["foundation"]
-            lab = sample["label"]
+        if sample_id in pool:
+            f = pool.foundation(sample_id)
+            lab = pool.label(sample_id)
             agg[f][lab] += 1
             agg[f]["total"] += 1
         raw.append({"participant_id": pid, "sample_id": sample_id, "rating": rating, "ts": ts})
@@ -432,7 +1757,91 @@ def admin_responses():
 # A simple health endpoint
 @app.get("/healthz")
 def health():
-    return {"ok": True, "samples_loaded": len(SAMPLES), "foundations": FOUNDATIONS}
+    """Health of the default study's pool, plus the load state of every study (other studies are not loaded by this check)."""
+    study = STUDIES.get(DEFAULT_STUDY)
+    pool = study.pool()
+    return {"ok": True, "samples_loaded": len(pool), "foundations": pool.foundations, "pool_version": pool.version,
+            "pool_shared": pool.mapping is not None, "pool_validation": study.validation(pool),
+            "db_pool": DB_POOL.metrics() if DB_POOL is not None else None,
+            "db_async_pool": ADB.metrics() if ADB is not None else None,
+            "studies": [s.status() for s in STUDIES]}
+
+
+@app.get("/studies/{study}/healthz")
+def study_health(study: str):
+    """Health of one study's pool (loads it if needed)."""
+    study = get_study(study)
+    pool = study.pool()
+    return dict(study.status(), ok=True, foundations=pool.foundations, pool_shared=pool.mapping is not None,
+                pool_validation=study.validation(pool))
+
+
+@app.get("/admin/db/pool")
+def admin_db_pool():
+    """Database connection pool metrics of this worker: size, in use, idle, waiting, checkouts, wait time (under
+    `async_pool`, the same for the asyncio database layer's pool, or null if it is not used)."""
+    if DB_POOL is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
+    return dict(DB_POOL.metrics(), async_pool=ADB.metrics() if ADB is not None else None)
+
+
+@app.get("/admin/db/coalescer")
+def admin_db_coalescer():
+    """Group commit metrics of this worker's /submit writes (flushes, ratings per flush: mean, percentiles, histogram),
+    or {"enabled": false} when SUBMIT_COALESCE_MS is 0."""
+    if SUBMIT_COALESCER is None:
+        return {"enabled": False}
+    return dict(SUBMIT_COALESCER.metrics(), enabled=True)
+
+
+@app.get("/admin/db/spool")
+def admin_db_spool():
+    """Submission spool metrics of this worker: ratings spooled, replayed, skipped as already stored, still pending,
+    files of other workers (or left by exited processes), the last replay error; or {"enabled": false} when
+    SUBMIT_SPOOL_DIR is not set."""
+    if SPOOL is None:
+        return {"enabled": False}
+    return dict(SPOOL.metrics(), enabled=True)
+
+
+@app.get("/admin/pool/memory")
+def admin_pool_memory(study: str = DEFAULT_STUDY):
+    """Report the live sample pool's memory footprint against the previous dict-per-row representation (for a
+    synthetic pool of a given size, run others/bench_pool_memory.py offline instead)."""
+    pool = get_study(study).pool()
+    return dict(pool.memory_report(), pool_version=pool.version)
+
+
+@app.post("/admin/prefill-assignments")
+def admin_prefill_assignments(background_tasks: BackgroundTasks, count: int = 300, study: str = DEFAULT_STUDY):
+    """Generate assignments ahead of a session (e.g. ?count=300 before a class) in the background.
+
+    The queue is topped up to max(count, queue_size); the producer keeps it from then on. Only studies with
+    a queue (queue_size > 0) take assignments from it.
+    """
+    if DB_POOL is None:
+        raise HTTPException(status_code=503, detail="Database unavailable. Configure DATABASE_URL and ensure network/DNS is reachable.")
+    if not (1 <= count <= 10000):
+        raise HTTPException(status_code=400, detail="count must be 1..10000")
+    target = get_study(study)
+    if target.queue_size <= 0:
+        raise HTTPException(status_code=400, detail="study has no assignment queue (set ASSIGNMENT_QUEUE_SIZE / queue_size)")
+
+    def prefill():
+        with DB_POOL.connection() as conn:
+            made = fill_assignment_queue(conn, target, max(count, target.queue_size))
+        print(f"Study {target.name}: prefilled {made} assignments")
+
+    background_tasks.add_task(prefill)
+    return {"scheduled": True, "study": target.name, "count": count}
+
+
+@app.post("/admin/reload-pool")
+def admin_reload_pool(background_tasks: BackgroundTasks, study: str = DEFAULT_STUDY):
+    """Reload the study's sample pool from its source in the background and swap it in once parsed."""
+    target = get_study(study)
+    background_tasks.add_task(target.reload)
+    return {"scheduled": True, "study": target.name, "current_version": target.status().get("pool_version")}
 
 
 # If static front-end not present, provide a minimal message
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+db_async.py
+
+asyncio database layer for the backend's async endpoints (/register, /submit, /participant/{pid}/samples),
+on an asyncpg connection pool of its own. A query awaits the database instead of blocking the event loop
+(or a threadpool thread), so one worker keeps as many requests' queries in flight as the pool has
+connections, and requests beyond that wait for a connection without holding a thread.
+
+- Statements use the backend's `?` placeholders (see backend.db_execute); they are translated to
+  asyncpg's `$1, $2, ...` once per statement.
+- `transaction()` checks a connection out and runs a transaction on it (committed when the block
+  ends, rolled back if it raises); `connection()` checks one out in autocommit. `fetchrow(conn, sql,
+  params)` and `execute(conn, sql, params)` run a statement, like backend.db_execute.
+- Checkout waits up to `timeout` seconds for a connection, then raises `db_pool.PoolTimeout`, like the
+  threaded pool. asyncpg resets connections when they are returned and replaces ones that were lost.
+- `metrics()` reports size, in use, idle, waiting, checkouts and wait time (the same keys as
+  db_pool.ConnectionPool.metrics).
+
+asyncpg is optional: `available()` is False without it, and the backend then runs the same endpoints
+on the threaded pool (db_pool.py) off the event loop.
+"""
+
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Optional
+
+from db_pool import PoolTimeout
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency
+    asyncpg = None
+
+
+def available() -> bool:
+    return asyncpg is not None
+
+
+@lru_cache(maxsize=256)
+def dollar_params(sql: str) -> str:
+    """`?` placeholders -> `$1, $2, ...` (the backend's statements have no literal `?`)."""
+    counter = iter(range(1, sql.count("?") + 1))
+    return re.sub(r"\?", lambda _: f"${next(counter)}", sql)
+
+
+class AsyncDatabase:
+    """An asyncpg pool with checkout timeouts and metrics (see the module docstring). Create with `connect`."""
+
+    def __init__(self, pool, min_size: int, max_size: int, timeout: float):
+        self._pool = pool
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._waiting = 0
+        # metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @classmethod
+    async def connect(cls, dsn: str, min_size: int = 1, max_size: int = 20, timeout: float = 10.0) -> "AsyncDatabase":
+        """Open the pool (`min_size` connections now, up to `max_size` on demand). SSL is required, as for the
+        threaded pool (managed Postgres services need it); unix-socket connections do not use it."""
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is required for the asyncio database layer but not installed")
+        pool = await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, ssl="require")
+        return cls(pool, min_size, max_size, timeout)
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None):
+        """`async with db.connection() as conn:` checks an asyncpg connection out and back in."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"no database connection available within {timeout:g}s ({self.max_size} in use)")
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - start
+        self.checkouts += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """`async with db.transaction() as conn:` one transaction on a checked-out connection."""
+        async with self.connection() as conn:
+            async with conn.transaction():
+                yield conn
+
+    def metrics(self) -> Dict:
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiting": self._waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(self.wait_seconds / self.checkouts * 1e3, 3) if self.checkouts else 0.0,
+            "wait_ms_max": round(self.max_wait_seconds * 1e3, 3),
+        }
+
+    async def close(self):
+        await self._pool.close()
+
+
+async def fetchrow(conn, sql: str, params=()):
+    return await conn.fetchrow(dollar_params(sql), *params)
+
+
+async def fetch(conn, sql: str, params=()):
+    return await conn.fetch(dollar_params(sql), *params)
+
+
+async def execute(conn, sql: str, params=()):
+    return await conn.execute(dollar_params(sql), *params)
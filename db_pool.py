@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+db_pool.py
+
+Bounded, thread-safe database connection pool used by the labeling backend.
+
+Request handlers check a connection out for the duration of one request (`connection()`)
+instead of sharing one global connection, so queries from FastAPI's threadpool run in parallel
+on up to `max_size` connections and a broken connection only fails the request that used it.
+
+- `min_size` connections are opened up front; more are opened on demand up to `max_size`.
+  When all are in use, `get` waits (up to `timeout` seconds, then raises `PoolTimeout`).
+- Checkout health check: closed connections are replaced, and a connection idle for more
+  than `check_idle` seconds is pinged (`SELECT 1`) first; one that fails is replaced.
+- Check-in rolls back whatever the request left open, so a connection never goes back to
+  the pool "idle in transaction"; connections marked broken (or closed) are discarded.
+- `metrics()` reports size, in use, idle, waiting, checkouts, wait time and replacements.
+
+Works with any DB-API connection that has `closed`, `rollback()` and `cursor()` (psycopg2's do).
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the timeout."""
+
+
+class ConnectionPool:
+    """Bounded pool of connections created by `connect()` (see the module docstring)."""
+
+    def __init__(self, connect: Callable, min_size: int = 1, max_size: int = 10, timeout: float = 10.0,
+                 check_idle: float = 30.0):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f"invalid pool size: min {min_size}, max {max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._cond = threading.Condition()
+        self._idle: deque = deque()  # (connection, time returned)
+        self._size = 0  # open connections, idle or in use (including ones being opened)
+        self._waiting = 0
+        self._closed = False
+        # metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        """Open a connection for a slot already counted in `_size` (given back if opening fails)."""
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.check_idle:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def get(self, timeout: Optional[float] = None):
+        """Check out a healthy connection, waiting up to `timeout` seconds (default: the pool's timeout; 0 = do
+        not wait) when all `max_size` are in use. Raises PoolTimeout."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if timeout > 0:
+                            self.timeouts += 1
+                        raise PoolTimeout(f"no database connection available within {timeout:g}s "
+                                          f"({self.max_size} in use)")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    item = self._idle.pop()
+                else:
+                    item = None
+                    self._size += 1  # reserve the slot before connecting outside the lock
+            if item is None:
+                conn = self._open()
+            else:
+                conn, returned_at = item
+                if not self._healthy(conn, time.monotonic() - returned_at):
+                    self._discard(conn)
+                    with self._cond:
+                        self.replaced += 1
+                    continue
+            waited = time.monotonic() - start
+            with self._cond:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            return conn
+
+    def put(self, conn, broken: bool = False):
+        """Return a checked-out connection; an open transaction is rolled back. Broken/closed ones are discarded."""
+        if not broken and not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """`with pool.connection() as conn:` checks a connection out and back in; a connection that raised a
+        database connection error (see `is_connection_error`) is discarded."""
+        conn = self.get(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self.put(conn, broken=broken)
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._size - idle,
+                "idle": idle,
+                "waiting": self._waiting,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "replaced": self.replaced,
+                "wait_ms_avg": round(self.wait_seconds / self.checkouts * 1e3, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.max_wait_seconds * 1e3, 3),
+            }
+
+    def close(self):
+        """Close the idle connections; connections still in use are closed when they are returned."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+
+# Exception class names (matched exactly: psycopg2's statement errors such as deadlocks subclass OperationalError) of
+# psycopg2 and asyncpg errors meaning the connection or the server is gone
+CONNECTION_ERRORS = frozenset((
+    "OperationalError", "InterfaceError", "AdminShutdown", "CrashShutdown", "CannotConnectNow",  # psycopg2
+    "PostgresConnectionError", "ConnectionDoesNotExistError", "ConnectionFailureError", "ClientCannotConnectError",
+    "AdminShutdownError", "CrashShutdownError", "CannotConnectNowError",  # asyncpg
+))
+
+
+def is_connection_error(exc: Exception) -> bool:
+    """Whether `exc` means the connection itself is unusable (see CONNECTION_ERRORS; socket errors too), rather
+    than a failed statement."""
+    if isinstance(exc, OSError) or type(exc).__name__ in CONNECTION_ERRORS:
+        return True
+    # psycopg2 raises a bare DatabaseError without SQLSTATE on the first use of a connection the server closed
+    return type(exc).__name__ == "DatabaseError" and getattr(exc, "pgcode", "") is None
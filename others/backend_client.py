@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+backend_client.py
+
+Helpers shared by the scripts in this directory that drive a running backend over HTTP
+(check_concurrent_register.py, load_submit.py, bench_submit.py, check_spool.py): a JSON
+request helper and the percentile used in their latency reports. Standard library only.
+
+Usage examples (from another script in others/, which has this directory on sys.path):
+  from backend_client import percentile, request_json
+  request_json("http://localhost:8000/register", {"name": "load-0"})
+"""
+
+import json
+import urllib.request
+from typing import Dict
+
+
+def request_json(url: str, body: Dict = None) -> Dict:
+    """GET `url` (or POST `body` as JSON) and return the decoded JSON response; raises urllib.error.HTTPError
+    on error statuses."""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read())
+
+
+def percentile(values, q: float) -> float:
+    """The q-quantile (0..1) of `values` (nearest rank)."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
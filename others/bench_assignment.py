@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+bench_assignment.py
+
+Benchmark choosing the least-used foundation set for a registration: the previous approach
+(enumerate all C = F choose k sets and take a minimum, O(C) per registration) against the
+priority-queue `AssignmentEngine` (O(log C)), for several numbers of foundations F and set
+sizes k. Also reports the spread (max - min count) after the run, which should be 0 or 1 for both.
+
+Usage examples:
+  python3 others/bench_assignment.py
+  python3 others/bench_assignment.py --foundations 9 16 24 --set-sizes 2 3 4 --registrations 20000
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+from itertools import combinations
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from assignment import AssignmentEngine  # noqa: E402
+
+
+def scan_choice(foundations, set_size, counts: Counter):
+    """The previous choose_balanced_pair: every set, minimum count, random tie-break."""
+    min_count = None
+    candidates = []
+    for s in combinations(foundations, set_size):
+        c = counts.get(s, 0)
+        if min_count is None or c < min_count:
+            min_count = c
+            candidates = [s]
+        elif c == min_count:
+            candidates.append(s)
+    chosen = random.choice(candidates)
+    counts[chosen] += 1
+    return chosen
+
+
+def spread(counts, foundations, set_size) -> int:
+    values = [counts.get(s, 0) for s in combinations(foundations, set_size)]
+    return max(values) - min(values)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark least-used foundation set selection")
+    p.add_argument("--foundations", type=int, nargs="+", default=[9, 12, 16], help="Numbers of foundations F (default: 9 12 16)")
+    p.add_argument("--set-sizes", type=int, nargs="+", default=[2, 3, 4], help="Set sizes k (default: 2 3 4)")
+    p.add_argument("--registrations", type=int, default=5000, help="Registrations per configuration (default: 5000)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = p.parse_args(argv)
+
+    random.seed(args.seed)
+    print(f"{'F':>3} {'k':>2} {'sets':>6}  {'scan us/reg':>12}  {'heap us/reg':>12}  {'speedup':>8}  {'spread scan/heap':>16}")
+    for f in args.foundations:
+        foundations = [f"F{i:02d}" for i in range(f)]
+        for k in args.set_sizes:
+            if k > f:
+                continue
+            counts = Counter()
+            start = time.perf_counter()
+            for _ in range(args.registrations):
+                scan_choice(foundations, k, counts)
+            scan = (time.perf_counter() - start) / args.registrations * 1e6
+
+            engine = AssignmentEngine(foundations, k, rng=random.Random(args.seed))
+            start = time.perf_counter()
+            for _ in range(args.registrations):
+                engine.pick()
+            heap = (time.perf_counter() - start) / args.registrations * 1e6
+            heap_spread = max(engine.count(s) for s in combinations(foundations, k)) - \
+                min(engine.count(s) for s in combinations(foundations, k))
+            print(f"{f:>3} {k:>2} {math.comb(f, k):>6}  {scan:>12.1f}  {heap:>12.1f}  {scan / heap:>7.0f}x  "
+                  f"{spread(counts, foundations, k):>7}/{heap_spread}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+bench_pool_memory.py
+
+Compare the memory used by the sample pool in its compact column form (`SamplePool`)
+against the previous representation (one dict per row with a nested `meta` dict of
+strings and a private copy of the shared title/description text).
+
+Both representations are built from the same synthetic pool (MFV130Gen.csv's
+foundation/label mix scaled to `--rows`) and measured with tracemalloc. `--report` also
+prints the pool's `memory_report()` per column, as GET /admin/pool/memory does for the
+live pool (the backend no longer builds synthetic pools in the serving process).
+
+Usage examples:
+  python3 others/bench_pool_memory.py
+  python3 others/bench_pool_memory.py --rows 100000
+  python3 others/bench_pool_memory.py --rows 5000000 --report
+"""
+
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sample_pool import synthetic_pool  # noqa: E402
+
+
+def measure(build):
+    """Return (object, bytes allocated and still held after `build()`)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, after - before
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Compare compact vs dict-per-row sample pool memory")
+    p.add_argument("--rows", type=int, default=1_000_000, help="Synthetic pool size (default: 1000000)")
+    p.add_argument("--report", action="store_true", help="Also print the pool's memory_report() as JSON")
+    args = p.parse_args(argv)
+
+    pool, compact_bytes = measure(lambda: synthetic_pool(args.rows))
+    _, legacy_bytes = measure(lambda: [pool._legacy_row(sid) for sid in pool.all_ids])
+
+    report = pool.memory_report()
+    print(f"rows:                 {len(pool)}")
+    print(f"compact pool:         {compact_bytes / 2**20:10.1f} MiB (memory_report: {report['total_bytes'] / 2**20:.1f} MiB)")
+    print(f"dict-per-row pool:    {legacy_bytes / 2**20:10.1f} MiB (memory_report estimate: {report['legacy_estimate_bytes'] / 2**20:.1f} MiB)")
+    print(f"reduction:            {legacy_bytes / compact_bytes:10.1f}x")
+    if args.report:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+bench_register.py
+
+Benchmark the pool-dependent part of /register (choosing 10 original + 20 generated
+samples for a foundation pair and assembling the participant's sample list) as the
+sample pool grows.
+
+Synthetic pools keep the foundation/label proportions of MFV130Gen.csv (9 foundations,
+~8.5% originals) and are scaled to the requested sizes. With the indexed `SamplePool`
+the per-registration cost should stay flat from 1.5k to 1M rows; `--legacy` also times
+the previous linear-scan implementation for comparison (only for pools up to
+`--legacy-max` rows, since it is O(N) per registration).
+
+Usage examples:
+  python3 others/bench_register.py
+  python3 others/bench_register.py --sizes 1542 100000 1000000 --iterations 2000 --legacy
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sample_pool import MFV130_SHAPE, SamplePool, sample_for_foundations, synthetic_pool  # noqa: E402
+
+
+def legacy_register(samples: List[Dict], pair: Tuple[str, str], desired_original: int, desired_generated: int) -> List[Dict]:
+    """The pre-index implementation: one scan per foundation/label plus a scan per returned id."""
+    chosen: List[Dict] = []
+    already_chosen = set()
+    for foundation, need_orig, need_gen in [(pair[0], desired_original // 2, desired_generated // 2),
+                                            (pair[1], desired_original - desired_original // 2,
+                                             desired_generated - desired_generated // 2)]:
+        pool_f = [s for s in samples if s["foundation"] == foundation]
+        originals_f = [s for s in pool_f if s["label"] == "original" and s["id"] not in already_chosen]
+        generated_f = [s for s in pool_f if s["label"] == "generated" and s["id"] not in already_chosen]
+        block = random.sample(originals_f, min(need_orig, len(originals_f)))
+        block += random.sample(generated_f, min(need_gen, len(generated_f)))
+        random.shuffle(block)
+        for s in block:
+            already_chosen.add(s["id"])
+            chosen.append(s)
+    sample_ids = [s["id"] for s in chosen]
+    id_to_sample = {s["id"]: s for s in samples if s["id"] in sample_ids}
+    return [{k: v for k, v in id_to_sample[sid].items() if k != "foundation"} for sid in sample_ids]
+
+
+def indexed_register(pool: SamplePool, pair: Tuple[str, str], desired_original: int, desired_generated: int) -> List[Dict]:
+    sample_ids = sample_for_foundations(pool, pair, desired_original, desired_generated)
+    return [{k: v for k, v in pool.get(sid).items() if k != "foundation"} for sid in sample_ids]
+
+
+def time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark /register sampling cost vs pool size")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1542, 10_000, 100_000, 1_000_000],
+                   help="Pool sizes to benchmark (default: 1542 10000 100000 1000000)")
+    p.add_argument("--iterations", type=int, default=1000, help="Registrations timed per pool size (default: 1000)")
+    p.add_argument("--legacy", action="store_true", help="Also time the previous linear-scan implementation")
+    p.add_argument("--legacy-max", type=int, default=100_000,
+                   help="Largest pool size to run the legacy implementation on (default: 100000)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = p.parse_args(argv)
+
+    random.seed(args.seed)
+    foundations = [f for f, _, _ in MFV130_SHAPE]
+    pairs = [(a, b) for i, a in enumerate(foundations) for b in foundations[i + 1:]]
+
+    print(f"{'pool size':>10}  {'indexed us/reg':>15}  {'legacy us/reg':>14}")
+    for size in args.sizes:
+        pool = synthetic_pool(size, seed=args.seed)
+        indexed = time_per_call(lambda: indexed_register(pool, random.choice(pairs), 10, 20), args.iterations)
+        legacy = "-"
+        if args.legacy and len(pool) <= args.legacy_max:
+            samples = [pool.get(sid) for sid in pool.all_ids]
+            legacy_iters = max(1, min(args.iterations, 2_000_000 // len(samples)))
+            legacy = f"{time_per_call(lambda: legacy_register(samples, random.choice(pairs), 10, 20), legacy_iters):.1f}"
+        print(f"{len(pool):>10}  {indexed:>15.1f}  {legacy:>14}")
+
+
+if __name__ == "__main__":
+    main()
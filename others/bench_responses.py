@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+bench_responses.py
+
+Before/after latency of building the /register and /participant/{pid}/samples response
+bodies (the part of both endpoints that does not touch the database).
+
+- before: copy every sample dict without its foundation and let FastAPI's generic
+  encoder (`jsonable_encoder` + `JSONResponse`) serialize the response,
+- after: concatenate the pool's 30 pre-encoded JSON fragments (`encode_participant`),
+  as the endpoints now do.
+
+/register additionally picks the 30 samples for a foundation pair; /participant/{pid}/samples
+starts from the stored id list.
+
+Usage examples:
+  python3 others/bench_responses.py
+  python3 others/bench_responses.py --csv MFV130Gen.csv --iterations 5000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import sample_pool  # noqa: E402
+
+
+def body_before(pool, pid, sample_ids, name) -> bytes:
+    ordered = []
+    for sid in sample_ids:
+        s = pool.get(sid)
+        ordered.append({k: v for k, v in s.items() if k != "foundation"})
+    return JSONResponse(jsonable_encoder({"participant_id": pid, "samples": ordered, "name": name})).body
+
+
+def body_after(pool, pid, sample_ids, name) -> bytes:
+    return sample_pool.encode_participant(pool, pid, sample_ids, name)
+
+
+def time_per_call(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Before/after latency of /register and /participant response building")
+    p.add_argument("--csv", default=str(Path(__file__).resolve().parent.parent / "MFV130Gen.csv"),
+                   help="Sample CSV (default: MFV130Gen.csv); its snapshot is built/used as the backend does")
+    p.add_argument("--iterations", type=int, default=2000, help="Calls timed per case (default: 2000)")
+    args = p.parse_args(argv)
+
+    pool = sample_pool.load_samples(Path(args.csv))
+    foundations = pool.foundations
+    pairs = [(a, b) for i, a in enumerate(foundations) for b in foundations[i + 1:]]
+    pid = str(uuid.uuid4())
+    fixed_ids = sample_pool.sample_for_foundations(pool, pairs[0], 10, 20)
+
+    if json.loads(body_before(pool, pid, fixed_ids, "x")) != json.loads(body_after(pool, pid, fixed_ids, "x")):
+        raise SystemExit("before/after response bodies differ")
+
+    def register(body):
+        return lambda: body(pool, pid, sample_pool.sample_for_foundations(pool, random.choice(pairs), 10, 20), None)
+
+    def participant(body):
+        return lambda: body(pool, pid, fixed_ids, None)
+
+    print(f"{'endpoint':<30}  {'before us':>10}  {'after us':>10}  {'speedup':>8}")
+    for endpoint, case in (("/register", register), ("/participant/{pid}/samples", participant)):
+        before = time_per_call(case(body_before), args.iterations)
+        after = time_per_call(case(body_after), args.iterations)
+        print(f"{endpoint:<30}  {before:>10.1f}  {after:>10.1f}  {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+bench_submit.py
+
+Benchmark a participant's end-of-task submission against a running backend: one POST /submit
+per rating, sent one after the other (what static/app.js did before /submit/batch), against one
+POST /submit/batch with all the participant's ratings. Registers --participants participants
+for each mode, rates every assigned sample and reports per-participant submission time
+(p50/p90/max) and the speedup. --parallel participants submit at the same time.
+
+Note: this creates real participants and responses in the target database; point it at a test database/study.
+
+Usage examples:
+  python3 others/bench_submit.py
+  python3 others/bench_submit.py --base http://localhost:8000 --participants 50 --parallel 10
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from backend_client import percentile, request_json
+
+
+def submit_one_by_one(base: str, pid: str, ratings: List[Dict]) -> float:
+    start = time.perf_counter()
+    for r in ratings:
+        request_json(f"{base}/submit", dict(r, participant_id=pid))
+    return time.perf_counter() - start
+
+
+def submit_batch(base: str, pid: str, ratings: List[Dict]) -> float:
+    start = time.perf_counter()
+    request_json(f"{base}/submit/batch", {"participant_id": pid, "ratings": ratings})
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Per-participant submission time: sequential /submit calls vs /submit/batch")
+    p.add_argument("--base", default="http://localhost:8000", help="Backend base URL (default: http://localhost:8000)")
+    p.add_argument("--participants", type=int, default=20, help="Participants per mode (default: 20)")
+    p.add_argument("--parallel", type=int, default=1, help="Participants submitting at the same time (default: 1)")
+    p.add_argument("--study", default="default", help="Study to register the participants in (default: default)")
+    args = p.parse_args(argv)
+
+    base = args.base.rstrip("/")
+    results = {}
+    for mode, fn in (("one by one", submit_one_by_one), ("batch", submit_batch)):
+        names = [f"bench-submit-{i}" for i in range(args.participants)]
+        created = request_json(f"{base}/studies/{args.study}/register/batch", {"names": names})["participants"]
+        tasks = []
+        for c in created:
+            samples = request_json(f"{base}/participant/{c['participant_id']}/samples")["samples"]
+            tasks.append((c["participant_id"], [{"sample_id": s["id"], "rating": 1 + i % 5} for i, s in enumerate(samples)]))
+        with ThreadPoolExecutor(max_workers=args.parallel) as ex:
+            times = list(ex.map(lambda t: fn(base, *t), tasks))
+        results[mode] = times
+        print(f"{mode:>10}: {len(tasks[0][1])} ratings per participant, ms p50 {percentile(times, 0.5) * 1e3:.1f}, "
+              f"p90 {percentile(times, 0.9) * 1e3:.1f}, max {max(times) * 1e3:.1f}")
+    speedup = percentile(results["one by one"], 0.5) / percentile(results["batch"], 0.5)
+    print(f"batch is {speedup:.1f}x faster per participant (p50)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+check_concurrent_register.py
+
+Concurrency check for foundation pair balancing: fire N registrations at a running backend at the
+same time and check that the pair counts in /admin/assignments are still balanced afterwards
+(max - min pair count no larger than before, or 1 if they were even). Run it against a backend with
+several workers (e.g. `uvicorn backend:app --workers 4`) to exercise the cross-process path.
+Per-registration latency percentiles are reported too (e.g. a 300-registration burst with and
+without an assignment queue, see ASSIGNMENT_QUEUE_SIZE and POST /admin/prefill-assignments).
+With --batch the same number of participants is created by one POST /studies/{study}/register/batch
+call instead, for comparing a classroom session's bulk registration against N single ones.
+
+Note: this creates real participants in the target database; point it at a test database/study.
+
+Usage examples:
+  python3 others/check_concurrent_register.py
+  python3 others/check_concurrent_register.py --base http://localhost:8000 --parallel 50 --study pilot
+  python3 others/check_concurrent_register.py --parallel 300 --prefill
+  python3 others/check_concurrent_register.py --parallel 300 --batch
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from backend_client import percentile, request_json
+
+
+def pair_counts(base: str, study: str) -> Dict[str, int]:
+    counts = request_json(f"{base}/admin/assignments?study={study}")["pair_counts"]
+    # pairs that were never assigned are missing from the report; excluded ones (skip_infeasible) never are
+    health = request_json(f"{base}/studies/{study}/healthz")
+    foundations = health["foundations"]
+    excluded = set(health.get("excluded_sets", []))
+    pairs = [f"{a} + {b}" for i, a in enumerate(foundations) for b in foundations[i + 1:] if f"{a} + {b}" not in excluded]
+    return {pair: counts.get(pair, 0) for pair in pairs}
+
+
+def timed_register(url: str, i: int) -> float:
+    start = time.perf_counter()
+    request_json(url, {"name": f"concurrency-check-{i}"})
+    return time.perf_counter() - start
+
+
+def spread(counts: Dict[str, int]) -> int:
+    return max(counts.values()) - min(counts.values()) if counts else 0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Check pair balance under N simultaneous registrations")
+    p.add_argument("--base", default="http://localhost:8000", help="Backend base URL (default: http://localhost:8000)")
+    p.add_argument("--parallel", type=int, default=50, help="Number of simultaneous registrations (default: 50)")
+    p.add_argument("--study", default="default", help="Study to register in (default: default)")
+    p.add_argument("--prefill", action="store_true",
+                   help="Prefill the study's assignment queue with --parallel assignments first (needs a queue_size)")
+    p.add_argument("--batch", action="store_true", help="Create the --parallel participants with one /register/batch call")
+    args = p.parse_args(argv)
+
+    base = args.base.rstrip("/")
+    if args.prefill:
+        request_json(f"{base}/admin/prefill-assignments?study={args.study}&count={args.parallel}", {})
+        time.sleep(2)
+    before = pair_counts(base, args.study)
+    start = time.perf_counter()
+    if args.batch:
+        names = [f"concurrency-check-{i}" for i in range(args.parallel)]
+        created = request_json(f"{base}/studies/{args.study}/register/batch", {"names": names})["participants"]
+        results = [None] * len(created)
+    else:
+        url = f"{base}/studies/{args.study}/register"
+        with ThreadPoolExecutor(max_workers=args.parallel) as ex:
+            results = list(ex.map(lambda i: timed_register(url, i), range(args.parallel)))
+    elapsed = time.perf_counter() - start
+    after = pair_counts(base, args.study)
+
+    added = sum(after.values()) - sum(before.values())
+    allowed = max(spread(before), 1)
+    print(f"{len(results)} registrations in {elapsed:.2f}s ({elapsed / len(results) * 1e3:.2f} ms each); "
+          f"{added} new pair assignments")
+    if not args.batch:
+        print(f"latency ms: p50 {percentile(results, 0.5) * 1e3:.1f}, p90 {percentile(results, 0.9) * 1e3:.1f}, "
+              f"p99 {percentile(results, 0.99) * 1e3:.1f}, max {max(results) * 1e3:.1f}")
+    print(f"pair count spread: before {spread(before)}, after {spread(after)} (allowed {allowed})")
+    for pair in sorted(after, key=after.get):
+        print(f"  {after[pair]:>6}  (+{after[pair] - before[pair]})  {pair}")
+    if added != len(results) or spread(after) > allowed:
+        print("FAIL: pair counts are not balanced")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+check_spool.py
+
+End-to-end check of the submission spool (SUBMIT_SPOOL_DIR) against a running backend: registers
+--participants participants and submits all their ratings with POST /submit in three phases: with the
+database up, after running --stop-db (the database is down: every call must still succeed, spooled),
+and after running --start-db. Then it waits for the backend to replay the spool and reads the responses
+table: every (participant, sample) must have exactly one response with the submitted rating. Reports
+lost, duplicated and wrong ratings; exits 1 if there are any.
+
+Note: this stops the database and creates real participants and responses in it; point it at a test database/study.
+
+Usage examples:
+  SUBMIT_SPOOL_DIR=/tmp/spool uvicorn backend:app --port 8000   # then:
+  python3 others/check_spool.py --stop-db "pg_ctl -D /tmp/pgdata stop -m immediate" \
+      --start-db "pg_ctl -D /tmp/pgdata start -w -l /tmp/pg.log"
+  python3 others/check_spool.py --base http://localhost:8000 --participants 20 --stop-db "docker stop db" --start-db "docker start db"
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_client import request_json
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Check that no rating is lost when the database goes down mid-session")
+    p.add_argument("--base", default="http://localhost:8000", help="Backend base URL (default: http://localhost:8000)")
+    p.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                   help="Database the backend writes to, to verify the responses (default: $DATABASE_URL)")
+    p.add_argument("--stop-db", required=True, help="Shell command that stops the database")
+    p.add_argument("--start-db", required=True, help="Shell command that starts it again")
+    p.add_argument("--participants", type=int, default=10, help="Participants to register (default: 10)")
+    p.add_argument("--parallel", type=int, default=8, help="Concurrent /submit calls (default: 8)")
+    p.add_argument("--study", default="default", help="Study to register the participants in (default: default)")
+    p.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the spool to be replayed (default: 120)")
+    args = p.parse_args(argv)
+    if not args.database_url:
+        p.error("--database-url (or DATABASE_URL) is required")
+    import psycopg2
+
+    base = args.base.rstrip("/")
+    names = [f"check-spool-{i}" for i in range(args.participants)]
+    created = request_json(f"{base}/studies/{args.study}/register/batch", {"names": names})["participants"]
+    expected = {}
+    for c in created:
+        pid = c["participant_id"]
+        for i, s in enumerate(request_json(f"{base}/participant/{pid}/samples")["samples"]):
+            expected[pid, s["id"]] = 1 + i % 5
+    ratings = list(expected.items())
+    third = len(ratings) // 3
+    phases = [("database up", ratings[:third], None), ("database down", ratings[third:2 * third], args.stop_db),
+              ("database restarted", ratings[2 * third:], args.start_db)]
+
+    def submit(item):
+        (pid, sample_id), rating = item
+        try:
+            return request_json(f"{base}/submit", {"participant_id": pid, "sample_id": sample_id, "rating": rating})
+        except urllib.error.HTTPError as e:
+            return {"error": e.code}
+
+    failed = 0
+    for label, items, command in phases:
+        if command:
+            print(f"$ {command}")
+            subprocess.run(command, shell=True, check=True)
+        with ThreadPoolExecutor(max_workers=args.parallel) as ex:
+            results = list(ex.map(submit, items))
+        errors = [r["error"] for r in results if "error" in r]
+        failed += len(errors)
+        print(f"{label}: {len(items)} ratings submitted, {sum(1 for r in results if r.get('spooled'))} spooled, "
+              f"{len(errors)} errors {sorted(set(errors)) if errors else ''}")
+
+    pids = sorted({pid for pid, _ in expected})
+    deadline = time.monotonic() + args.timeout
+    while True:
+        try:
+            conn = psycopg2.connect(args.database_url, sslmode="require")
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT participant_id, sample_id, rating FROM responses WHERE participant_id = ANY(%s)", (pids,))
+                stored = cur.fetchall()
+            finally:
+                conn.close()
+        except psycopg2.OperationalError:
+            stored = []
+        found = {}
+        for pid, sample_id, rating in stored:
+            found.setdefault((pid, sample_id), []).append(rating)
+        lost = [key for key in expected if key not in found]
+        if not lost or time.monotonic() > deadline:
+            break
+        time.sleep(1)
+    duplicated = [key for key, found_ratings in found.items() if len(found_ratings) > 1]
+    wrong = [key for key, found_ratings in found.items() if key in expected and expected[key] not in found_ratings]
+    print(f"{len(expected)} ratings submitted, {len(stored)} stored: {len(lost)} lost, {len(duplicated)} duplicated, "
+          f"{len(wrong)} wrong, {failed} failed submissions")
+    print("spool:", json.dumps(request_json(f"{base}/admin/db/spool")))
+    if lost or duplicated or wrong or failed:
+        print("FAIL: ratings were lost or stored wrongly")
+        sys.exit(1)
+    print("OK: every rating stored exactly once")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+load_submit.py
+
+Load test for concurrent rating submissions: register --participants participants at a running
+backend, then fire N POST /submit calls for their samples (spread over the participants, so the
+rating counters of one foundation set are not the only rows written) from --parallel threads and
+report throughput and
+latency percentiles, plus the backend's database connection pool metrics (GET /admin/db/pool)
+afterwards. Run it against backends started with different DB_POOL_MAX values (one worker each)
+to see /submit throughput scale with the pool size.
+
+Note: this creates real participants and responses in the target database; point it at a test database/study.
+
+Usage examples:
+  python3 others/load_submit.py
+  python3 others/load_submit.py --base http://localhost:8000 --requests 2000 --parallel 32
+  DB_POOL_MAX=1 uvicorn backend:app --port 8000   # then: python3 others/load_submit.py --parallel 16
+"""
+
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_client import percentile, request_json
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Measure concurrent /submit throughput against a running backend")
+    p.add_argument("--base", default="http://localhost:8000", help="Backend base URL (default: http://localhost:8000)")
+    p.add_argument("--requests", type=int, default=1000, help="Number of /submit calls (default: 1000)")
+    p.add_argument("--parallel", type=int, default=16, help="Concurrent clients (default: 16)")
+    p.add_argument("--participants", type=int, default=20, help="Participants the submissions are spread over (default: 20)")
+    p.add_argument("--study", default="default", help="Study to register the participants in (default: default)")
+    args = p.parse_args(argv)
+
+    base = args.base.rstrip("/")
+    names = [f"load-submit-{i}" for i in range(args.participants)]
+    created = request_json(f"{base}/studies/{args.study}/register/batch", {"names": names})["participants"]
+    tasks = [(pid, request_json(f"{base}/participant/{pid}/samples")["samples"])
+             for pid in (c["participant_id"] for c in created)]
+
+    def submit(i: int):
+        pid, samples = tasks[i % len(tasks)]
+        body = {"participant_id": pid, "sample_id": samples[(i // len(tasks)) % len(samples)]["id"], "rating": 1 + i % 5}
+        start = time.perf_counter()
+        try:
+            request_json(f"{base}/submit", body)
+        except urllib.error.HTTPError as e:
+            return None, e.code
+        return time.perf_counter() - start, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.parallel) as ex:
+        results = list(ex.map(submit, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [r for r, _ in results if r is not None]
+    errors = [code for _, code in results if code is not None]
+    print(f"{len(latencies)} submissions in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s) "
+          f"from {args.parallel} clients; {len(errors)} errors {sorted(set(errors)) if errors else ''}")
+    if latencies:
+        print(f"latency ms: p50 {percentile(latencies, 0.5) * 1e3:.1f}, p90 {percentile(latencies, 0.9) * 1e3:.1f}, "
+              f"p99 {percentile(latencies, 0.99) * 1e3:.1f}, max {max(latencies) * 1e3:.1f}")
+    print("db pool:", json.dumps(request_json(f"{base}/admin/db/pool")))
+
+
+if __name__ == "__main__":
+    main()
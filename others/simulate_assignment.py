@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+simulate_assignment.py
+
+Offline simulator for participant assignment: runs the backend's own assignment code
+(`choose_balanced_pair` + `draw_samples`, i.e. ASSIGNMENT_MODE=memory with the study's
+in-memory counts) for 10k-1M simulated registrations, without a database or a server.
+
+Reports, at regular checkpoints:
+- throughput of the assignment code (registrations/s, excluding the simulator's bookkeeping),
+- foundation set balance (spread = max - min participants per assignable set, over all workers),
+- per-sample exposure (times assigned: min/p10/p50/p90/max, samples never assigned, and the
+  registration at which every sample had been assigned at least once),
+- how often the cross-foundation fallback fires (assignments with samples from outside their
+  foundation set, or with fewer originals/generated than the quota).
+
+The pool is MFV130Gen.csv's shape scaled to `--rows` by default; `--shape` describes another
+dataset as "Foundation:originals:generated,..." and `--pool` loads a real CSV/JSON/JSON Lines file.
+`--workers` simulates several worker processes with their own counts (registrations spread
+over them at random), whose set counts and (with --exposure) sample exposure are reconciled with
+the true totals every `--reconcile-every` registrations, like PAIR_COUNTS_RECONCILE_SECONDS does.
+
+Usage examples:
+  python3 others/simulate_assignment.py
+  python3 others/simulate_assignment.py --registrations 1000000 --rows 100000 --set-size 3
+  python3 others/simulate_assignment.py --pool MFV130Gen.csv --registrations 2000 --exposure
+  python3 others/simulate_assignment.py --shape "A:5:40,B:5:40,C:2:10" --original 4 --generated 8
+  python3 others/simulate_assignment.py --workers 4 --reconcile-every 500
+  python3 others/simulate_assignment.py --original 16 --skip-infeasible
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# the backend connects to DATABASE_URL on import; the simulator never uses a database
+os.environ.pop("DATABASE_URL", None)
+with contextlib.redirect_stdout(io.StringIO()):
+    import backend  # noqa: E402
+import sample_pool  # noqa: E402
+import studies  # noqa: E402
+from assignment import set_key  # noqa: E402
+
+
+def parse_shape(spec: str) -> List[Tuple[str, int, int]]:
+    """Parse "Foundation:originals:generated,..." into a synthetic pool shape."""
+    shape = []
+    for part in spec.split(","):
+        foundation, o, g = part.rsplit(":", 2)
+        shape.append((foundation.strip(), int(o), int(g)))
+    return shape
+
+
+def percentile(values, q: float) -> int:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Simulate participant assignment offline and report balance and exposure")
+    p.add_argument("--registrations", type=int, default=10000, help="Simulated registrations (default: 10000)")
+    p.add_argument("--pool", help="Pool source (CSV/JSON/JSON Lines) instead of a synthetic pool")
+    p.add_argument("--rows", type=int, default=1542, help="Rows of the synthetic pool (default: 1542, MFV130Gen.csv's size)")
+    p.add_argument("--shape", help='Synthetic pool shape "Foundation:originals:generated,..." (default: MFV130Gen.csv\'s)')
+    p.add_argument("--original", type=int, default=10, help="Originals per participant (default: 10)")
+    p.add_argument("--generated", type=int, default=20, help="Generated samples per participant (default: 20)")
+    p.add_argument("--set-size", type=int, default=2, help="Foundations per participant (default: 2)")
+    p.add_argument("--exposure", action="store_true", help="Exposure-balanced sampling (EXPOSURE_BALANCING)")
+    p.add_argument("--exposure-power", type=float, default=backend.EXPOSURE_POWER,
+                   help=f"EXPOSURE_POWER (default: {backend.EXPOSURE_POWER:g})")
+    p.add_argument("--skip-infeasible", action="store_true",
+                   help="Never assign foundation sets that need the fallback (ASSIGNMENT_SKIP_INFEASIBLE)")
+    p.add_argument("--workers", type=int, default=1, help="Simulated worker processes with their own counts (default: 1)")
+    p.add_argument("--reconcile-every", type=int, default=0,
+                   help="Reconcile the workers' counts with the totals every N registrations (default: 0 = never)")
+    p.add_argument("--report-every", type=int, default=0, help="Checkpoint interval (default: registrations / 10)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = p.parse_args(argv)
+
+    random.seed(args.seed)
+    if args.pool:
+        pool = sample_pool.load_samples(Path(args.pool), use_snapshot=False)
+    else:
+        shape = parse_shape(args.shape) if args.shape else None
+        pool = sample_pool.synthetic_pool(args.rows, shape, seed=args.seed)
+    backend.EXPOSURE_POWER = args.exposure_power
+    workers = [studies.Study(f"sim{w}", Path(args.pool or "synthetic"), args.original, args.generated,
+                             set_size=args.set_size, exposure_balanced=args.exposure,
+                             skip_infeasible=args.skip_infeasible) for w in range(args.workers)]
+    for study in workers:
+        # the simulated database starts empty: nothing to seed from, so the connection is never used
+        study.counts.seed(dict)
+        study.exposure(pool).seed(dict)
+    report = pool.validation(args.original, args.generated, args.set_size)
+    print(f"pool {pool.version}: {len(pool)} samples, {len(pool.foundations)} foundations, "
+          f"{report['foundation_sets']} foundation sets of {args.set_size} "
+          f"({len(report['fallback_sets'])} need the fallback by validation)")
+
+    set_totals: Counter = Counter()
+    exposure: Counter = Counter()
+    fallback_assignments = fallback_samples = 0
+    covered_at = None
+    assign_seconds = 0.0
+    report_every = args.report_every or max(1, args.registrations // 10)
+    start = time.perf_counter()
+    print(f"{'registrations':>13} {'reg/s':>9} {'spread':>6} {'unassigned':>10} "
+          f"{'exposure min/p10/p50/p90/max':>30} {'fallback':>9}")
+    for n in range(1, args.registrations + 1):
+        study = workers[random.randrange(len(workers))]
+        t0 = time.perf_counter()
+        pair = backend.choose_balanced_pair(None, pool, study)
+        _, _, sample_ids = backend.draw_samples(None, study, pool, pair)
+        assign_seconds += time.perf_counter() - t0
+
+        set_totals[set_key(pair)] += 1
+        exposure.update(sample_ids)
+        outside = sum(1 for sid in sample_ids if pool.foundation(sid) not in pair)
+        originals = sum(1 for sid in sample_ids if pool.label(sid) == "original")
+        if outside or originals != args.original or len(sample_ids) != args.original + args.generated:
+            fallback_assignments += 1
+            fallback_samples += outside
+        if covered_at is None and len(exposure) == len(pool):
+            covered_at = n
+        if args.workers > 1 and args.reconcile_every and n % args.reconcile_every == 0:
+            for worker in workers:
+                worker.counts.reconcile(lambda: dict(set_totals))
+                if args.exposure:
+                    worker.exposure(pool).reconcile(lambda: dict(exposure))
+
+        if n % report_every == 0 or n == args.registrations:
+            values = sorted(exposure.get(sid, 0) for sid in pool.all_ids)
+            excluded = workers[0].excluded_sets(pool)
+            sets = [set_totals.get(s, 0) for s in backend.foundation_sets(pool, args.set_size) if s not in excluded]
+            dist = "/".join(str(percentile(values, q)) for q in (0, 0.1, 0.5, 0.9, 1.0))
+            print(f"{n:>13} {n / assign_seconds:>9.0f} {max(sets) - min(sets):>6} {values.count(0):>10} "
+                  f"{dist:>30} {fallback_assignments / n:>8.1%}")
+
+    print(f"done in {time.perf_counter() - start:.1f}s ({assign_seconds / args.registrations * 1e6:.1f} us per "
+          f"registration in the assignment code)")
+    print(f"every sample assigned at least once after: "
+          f"{f'{covered_at} registrations' if covered_at else 'never (within this run)'}")
+    print(f"fallback: {fallback_assignments} assignments ({fallback_samples} samples from outside the foundation set)")
+
+
+if __name__ == "__main__":
+    main()
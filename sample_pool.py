@@ -0,0 +1,1377 @@
+#!/usr/bin/env python3
+"""
+sample_pool.py
+
+In-memory sample pool used by the labeling backend.
+
+The pool is loaded once from `MFV130Gen.csv` and indexed so that the hot paths in
+`backend.py` (/register, /participant/{pid}/samples, /admin/responses) never scan the
+whole pool:
+- samples are addressed by id (a sample's id is its CSV row index) and stored as columns,
+- `by_key` maps (foundation, label) -> array of sample ids,
+- `by_label` maps label -> array of sample ids,
+- `donors(foundations, label)` is the cross-foundation fallback's pool: the label's ids outside
+  a foundation set, built once per set and pool,
+- a sample's foundation is its `foundation_codes` entry, so membership checks are O(1).
+
+A pool is never mutated after construction; `version` identifies it (a prefix of the
+source CSV's sha256), so the backend can swap in a reloaded pool atomically while
+in-flight requests keep the one they started with.
+
+Picking k samples from the pool is O(k) in the number of samples picked, independent of
+the pool size. Weighted picks (`sample_weighted`) are too when the caller knows an upper bound of
+the weights, as exposure balancing does; without one they scan the foundation's block. With a
+seeded generator the pick is reproducible: `sample_from_spec` regenerates
+an assignment's ids from a short spec (sampler, seed, quotas) and the pool version.
+
+`validate_pool` checks a pool against the per-participant quotas (per-foundation/label counts,
+load-time coercions, empty/duplicate scenario text, foundation pairs that would need the
+cross-foundation fallback); `SamplePool.validation` caches the result on the pool, and the
+text statistics are stored in the snapshot so mapped pools do not recompute them.
+
+Parsing the CSV is the slow part of process start, so `load_samples` keeps a compiled
+snapshot next to the CSV (`MFV130Gen.csv.pool`). The snapshot records the CSV's size,
+mtime and sha256; it is used when it matches the CSV and rebuilt automatically when it
+does not. The snapshot is a flat image of the pool's columns that is memory-mapped
+read-only, so every worker process serving the same CSV shares one copy of the pool
+(zero-copy) and sample text is only decoded when a sample is served. Prebuild it (e.g.
+in the Docker image) with:
+
+    python3 sample_pool.py MFV130Gen.csv
+
+Seeded assignments need the exact pool version they were drawn from, so every version a
+process serves is also kept as `<source>.<version>.pool` (`archive_snapshot`, written once per
+version and never replaced) and mapped again on demand (`load_version`) by workers that never
+loaded it, after a restart or after the source changed.
+"""
+
+import argparse
+import csv
+import functools
+import hashlib
+import heapq
+import io
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from collections import Counter
+from itertools import combinations
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+LABELS = ("original", "generated")
+
+# Snapshot file layout: MAGIC, uint32 header length, JSON header, then 8-byte aligned sections
+# (raw native-endian arrays) whose offsets/lengths/formats are listed in the header.
+# Bump SNAPSHOT_VERSION whenever the layout changes.
+SNAPSHOT_MAGIC = b"MFVPOOL\0"
+SNAPSHOT_VERSION = 5
+SNAPSHOT_SUFFIX = ".pool"
+# Characters read per chunk when streaming a JSON source
+JSON_CHUNK_SIZE = 1 << 16
+# Number of sha256 hex digits used as the pool version
+VERSION_DIGITS = 12
+# Name of the seeded sampling procedure recorded in sample specs (see make_sample_spec); change it whenever
+# sample_for_foundations would draw different ids for the same seed. "u1" drew fallback samples from every sample
+# of the label; "u2" only from the donor pool of foundations outside the set. Specs of both are still regenerated.
+SAMPLER = "u2"
+SAMPLERS = ("u1", "u2")
+
+
+def normalize_row(row: Dict[str, str], issues: Optional[Counter] = None) -> Tuple[str, str]:
+    """Return the normalized (foundation, label) of a CSV row.
+
+    Coercions are counted in `issues` when given: "missing_foundation" (blank foundation ->
+    `<missing>`) and "unknown_label" (label other than original/generated -> generated).
+    """
+    foundation = (row.get("foundation") or "").strip()
+    if foundation == "":
+        foundation = "<missing>"
+        if issues is not None:
+            issues["missing_foundation"] += 1
+    label = (row.get("label") or "generated").strip().lower()
+    if label not in LABELS:
+        label = "generated"
+        if issues is not None:
+            issues["unknown_label"] += 1
+    return foundation, label
+
+
+class SamplePool:
+    """Indexed, read-only sample pool stored as columns.
+
+    Sample i is described by position i of each column:
+    - `foundation_codes[i]` / `label_codes[i]` index into `foundation_names` / LABELS,
+    - `title_refs[i]`, `description_refs[i]`, `scenario_refs[i]` index into `strings`, a table
+      of distinct strings (the title/description shared by every row is stored once),
+    - `meta_columns` maps each remaining CSV column to an array of floats (NaN = blank) when
+      all of its values are numeric, or to an array of string refs otherwise.
+
+    `get(sid)` materializes the familiar sample dict
+    {"id", "foundation", "label", "title", "description", "scenario", "meta"} on demand.
+    Build pools with `PoolBuilder`, or map one from a snapshot with `map_snapshot` (columns are
+    then memoryviews over the mapping, `strings` is a `MappedStrings`, and `indexes` are passed
+    in rather than rebuilt).
+
+    `fragment(sid)` returns the sample as pre-encoded JSON bytes without its foundation, ready to
+    be concatenated into a participant response. Mapped pools serve fragments straight from the
+    snapshot (`fragments`); other pools encode them on demand.
+    """
+
+    def __init__(self, foundation_names: List[str], foundation_codes: Sequence[int], label_codes: Sequence[int],
+                 strings: Sequence[str], title_refs: Sequence[int], description_refs: Sequence[int],
+                 scenario_refs: Sequence[int], meta_columns: Dict[str, Sequence], version: str = "",
+                 indexes: Optional[Tuple[Dict, Dict]] = None, fragments: Optional[Sequence] = None):
+        self.version = version
+        self.mapping: Optional[mmap.mmap] = None  # set when the columns live in a mapped snapshot
+        self.foundation_names = foundation_names
+        self.foundation_codes = foundation_codes
+        self.label_codes = label_codes
+        self.strings = strings
+        self.title_refs = title_refs
+        self.description_refs = description_refs
+        self.scenario_refs = scenario_refs
+        self.meta_columns = meta_columns
+        self._float_meta = {name: _kind(column) == "d" for name, column in meta_columns.items()}
+        self.fragments = fragments
+        # coercions applied while parsing the source (see normalize_row), and cached validation results
+        self.load_issues: Dict[str, int] = {}
+        self._text_stats: Optional[Dict] = None
+        self._validation: Dict[Tuple[int, int, int], Dict] = {}
+        self._donors: Dict[Tuple[Tuple[str, ...], str], Sequence[int]] = {}
+
+        if indexes is None:
+            indexes = _build_indexes(foundation_names, foundation_codes, label_codes)
+        self.by_key: Dict[Tuple[str, str], Sequence[int]] = indexes[0]
+        self.by_label: Dict[str, Sequence[int]] = indexes[1]
+        self.foundations: List[str] = sorted({foundation for foundation, _ in self.by_key})
+        self.all_ids = range(len(foundation_codes))
+
+    def __len__(self) -> int:
+        return len(self.foundation_codes)
+
+    def __contains__(self, sid) -> bool:
+        return isinstance(sid, int) and 0 <= sid < len(self.foundation_codes)
+
+    def foundation(self, sid: int) -> str:
+        return self.foundation_names[self.foundation_codes[sid]]
+
+    def label(self, sid: int) -> str:
+        return LABELS[self.label_codes[sid]]
+
+    def scenario(self, sid: int) -> str:
+        return self.strings[self.scenario_refs[sid]]
+
+    def get(self, sid) -> Optional[Dict]:
+        """Return the sample with id `sid` as a fresh dict, or None if there is no such sample."""
+        if sid not in self:
+            return None
+        strings = self.strings
+        meta = {}
+        for name, column in self.meta_columns.items():
+            value = column[sid]
+            if self._float_meta[name]:
+                meta[name] = _number(value)
+            else:
+                meta[name] = strings[value]
+        return {
+            "id": sid,
+            "foundation": self.foundation(sid),
+            "label": self.label(sid),
+            "title": strings[self.title_refs[sid]],
+            "description": strings[self.description_refs[sid]],
+            "scenario": strings[self.scenario_refs[sid]],
+            "meta": meta,
+        }
+
+    def fragment(self, sid: int):
+        """Return sample `sid` (foundation stripped) as a bytes-like JSON object."""
+        if self.fragments is not None:
+            return self.fragments[sid]
+        return encode_fragment(self.get(sid))
+
+    def ids(self, foundation: str, label: str) -> Sequence[int]:
+        """Return the ids of all samples with this foundation and label."""
+        return self.by_key.get((foundation, label), ())
+
+    def donors(self, foundations: Sequence[str], label: str) -> Sequence[int]:
+        """Ids with this label whose foundation is not in `foundations`: where a set's registrations top up a
+        foundation that is short of the label. Built on first use for each set (O(samples of the label))."""
+        key = (tuple(sorted(foundations)), label)
+        donors = self._donors.get(key)
+        if donors is None:
+            excluded = {i for i, name in enumerate(self.foundation_names) if name in key[0]}
+            codes = self.foundation_codes
+            donors = self._donors[key] = array("I", (i for i in self.by_label.get(label, ()) if codes[i] not in excluded))
+        return donors
+
+    def infeasible_sets(self, desired_original: int, desired_generated: int, set_size: int = 2) -> frozenset:
+        """Foundation sets (sorted tuples) whose registrations need the cross-foundation fallback for these quotas
+        (the `fallback_sets` of the cached validation report)."""
+        report = self.validation(desired_original, desired_generated, set_size)
+        return frozenset(tuple(entry["foundations"]) for entry in report["fallback_sets"])
+
+    def text_stats(self) -> Dict:
+        """Empty and duplicate scenario text, computed once per pool (see `scenario_text_stats`)."""
+        if self._text_stats is None:
+            counts = Counter(self.scenario_refs)
+            empty = {ref for ref in counts if not self.strings[ref].strip()}
+            self._text_stats = scenario_text_stats(self.scenario_refs, counts, empty)
+        return self._text_stats
+
+    def validation(self, desired_original: int, desired_generated: int, set_size: int = 2) -> Dict:
+        """`validate_pool` for these quotas, cached on the pool (a pool never changes after construction)."""
+        key = (desired_original, desired_generated, set_size)
+        if key not in self._validation:
+            self._validation[key] = validate_pool(self, desired_original, desired_generated, set_size)
+        return self._validation[key]
+
+    def memory_report(self, legacy_sample_rows: int = 1000) -> Dict:
+        """Return the pool's memory footprint in bytes, per component.
+
+        `legacy_estimate_bytes` extrapolates the footprint of the previous one-dict-per-row
+        representation from up to `legacy_sample_rows` materialized rows.
+        """
+        seen: Set[int] = set()
+        components = {name: sum(deep_sizeof(obj, seen) for obj in objs) for name, objs in self._memory_groups().items()}
+        n = len(self)
+        sample_ids = range(0, n, max(1, n // legacy_sample_rows)) if n else range(0)
+        # keep the sampled rows alive while sizing them so object ids are not reused
+        legacy_rows = [self._legacy_row(sid) for sid in sample_ids]
+        legacy_sample = deep_sizeof(legacy_rows) - sys.getsizeof(legacy_rows)
+        legacy_estimate = int(legacy_sample * n / len(sample_ids)) if len(sample_ids) else 0
+        total = sum(components.values())
+        mapped = len(self.mapping) if self.mapping is not None else 0
+        return {
+            "rows": n,
+            "distinct_strings": len(self.strings),
+            "components": components,
+            "total_bytes": total,
+            # column data of a mapped pool lives in the (shared, read-only) mapping, not in the heap
+            "mapped_bytes": mapped,
+            "legacy_estimate_bytes": legacy_estimate,
+            "reduction_factor": round(legacy_estimate / (total + mapped), 2) if total + mapped else None,
+        }
+
+    def _memory_groups(self) -> Dict[str, tuple]:
+        return {
+            "codes": (self.foundation_names, self.foundation_codes, self.label_codes),
+            "strings": (self.strings,),
+            "text_refs": (self.title_refs, self.description_refs, self.scenario_refs),
+            "meta_columns": (self.meta_columns,),
+            "indexes": (self.by_key, self.by_label, self.foundations),
+            "fragments": (self.fragments,),
+        }
+
+    def _legacy_row(self, sid: int) -> Dict:
+        """The previous per-row representation: a dict with fresh (non-shared) strings and string meta."""
+        sample = self.get(sid)
+        copy = {k: (v + ".")[:-1] if isinstance(v, str) else v for k, v in sample.items()}
+        copy["meta"] = {k: "" if v is None else str(v) for k, v in sample["meta"].items()}
+        return copy
+
+
+def _number(value: float):
+    """A numeric meta value as served: None for blank (NaN), int when integral, else float."""
+    return None if math.isnan(value) else (int(value) if value.is_integer() else value)
+
+
+def _kind(column) -> str:
+    """Element format of an array or memoryview column ("d" = float, "I" = string ref, ...)."""
+    return column.typecode if isinstance(column, array) else column.format
+
+
+def _build_indexes(foundation_names: List[str], foundation_codes: Sequence[int],
+                   label_codes: Sequence[int]) -> Tuple[Dict, Dict]:
+    """Return (by_key, by_label) id arrays for the given code columns."""
+    by_key: Dict[Tuple[str, str], array] = {}
+    by_label: Dict[str, array] = {label: array("I") for label in LABELS}
+    keys = [[array("I") for _ in LABELS] for _ in foundation_names]
+    for sid, (fc, lc) in enumerate(zip(foundation_codes, label_codes)):
+        keys[fc][lc].append(sid)
+        by_label[LABELS[lc]].append(sid)
+    for fc, foundation in enumerate(foundation_names):
+        for lc, label in enumerate(LABELS):
+            if keys[fc][lc]:
+                by_key[(foundation, label)] = keys[fc][lc]
+    return by_key, by_label
+
+
+def scenario_text_stats(keys: Sequence, counts: Counter, empty_keys: Set, examples: int = 5) -> Dict:
+    """Summarize empty and duplicate scenario text from one key per sample (equal text <=> equal key).
+
+    `counts` is `Counter(keys)`; the ids of up to `examples` duplicated texts are listed.
+    """
+    repeated = [key for key, n in counts.items() if n > 1 and key not in empty_keys]
+    groups: Dict = {key: [] for key in repeated[:examples]}
+    if groups:
+        for sid, key in enumerate(keys):
+            if key in groups and len(groups[key]) < examples:
+                groups[key].append(sid)
+    return {
+        "empty_scenarios": sum(counts[key] for key in empty_keys),
+        "duplicate_scenarios": sum(counts[key] - 1 for key in repeated),
+        "duplicated_texts": len(repeated),
+        "duplicate_examples": list(groups.values()),
+    }
+
+
+def validate_pool(pool: "SamplePool", desired_original: int, desired_generated: int, set_size: int = 2) -> Dict:
+    """Check the pool against the per-participant quotas.
+
+    Reports the per-foundation/label counts, the coercions applied at load time, empty and
+    duplicate scenario text, and every foundation set of `set_size` foundations that cannot be
+    served from its own foundations alone, i.e. whose registrations would need the
+    cross-foundation fallback of `sample_for_foundations`. Each foundation in a set is checked
+    against the larger share of the split quota, so the result does not depend on set order.
+    """
+    counts = {foundation: {label: len(pool.ids(foundation, label)) for label in LABELS}
+              for foundation in pool.foundations}
+    share = {"original": -(-desired_original // set_size), "generated": -(-desired_generated // set_size)}
+    short = {}
+    for foundation, by_label in counts.items():
+        gaps = {label: share[label] - n for label, n in by_label.items() if n < share[label]}
+        if gaps:
+            short[foundation] = gaps
+    fallback_sets = []
+    for foundations in combinations(pool.foundations, set_size):
+        if any(f in short for f in foundations):
+            fallback_sets.append({"foundations": list(foundations),
+                                  "shortfall": {f: short[f] for f in foundations if f in short}})
+    label_totals = {label: len(pool.by_label[label]) for label in LABELS}
+    text = pool.text_stats()
+    return {
+        "pool_version": pool.version,
+        "quotas": {"original": desired_original, "generated": desired_generated, "foundations": set_size},
+        "counts": counts,
+        "label_totals": label_totals,
+        "load_issues": dict(pool.load_issues),
+        "text": text,
+        "foundation_sets": math.comb(len(pool.foundations), set_size),
+        "fallback_sets": fallback_sets,
+        # too few samples of a label overall: registrations top up with the other label
+        "label_shortfall": {label: need - label_totals[label]
+                            for label, need in (("original", desired_original), ("generated", desired_generated))
+                            if label_totals[label] < need},
+        "ok": not fallback_sets and not text["empty_scenarios"] and len(pool) >= desired_original + desired_generated,
+    }
+
+
+def encode_fragment(sample: Dict) -> bytes:
+    """Encode a sample for participants: compact JSON (as FastAPI renders it) without the foundation."""
+    return json.dumps({k: v for k, v in sample.items() if k != "foundation"},
+                      ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_participant(pool: "SamplePool", pid: str, sample_ids: Iterable[int], name) -> bytes:
+    """Encode {"participant_id", "samples", "name"} by concatenating the samples' pre-encoded fragments."""
+    fragments = b",".join(pool.fragment(sid) for sid in sample_ids if sid in pool)
+    return b"".join((b'{"participant_id":', json.dumps(pid).encode("utf-8"), b',"samples":[', fragments,
+                     b'],"name":', json.dumps(name, ensure_ascii=False).encode("utf-8"), b"}"))
+
+
+class MappedBytes:
+    """Read-only sequence of byte strings packed in a (mapped) buffer; items are zero-copy memoryviews."""
+
+    def __init__(self, offsets: Sequence[int], blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class MappedStrings(MappedBytes):
+    """Read-only sequence of strings stored as UTF-8 in a (mapped) buffer; decoded on access."""
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def deep_sizeof(obj, seen: Optional[Set[int]] = None) -> int:
+    """Approximate deep size in bytes of pool data (containers, arrays, str, numbers); shared objects count once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+class PoolBuilder:
+    """Accumulates rows and builds a compact `SamplePool`.
+
+    Strings are interned through one table, so repeated titles/descriptions/meta values are
+    stored once. Meta columns whose non-blank values all parse as numbers become float arrays.
+    """
+
+    def __init__(self):
+        self._foundation_index: Dict[str, int] = {}
+        self._string_index: Dict[str, int] = {}
+        self.foundation_codes = array("H")
+        self.label_codes = array("B")
+        self.title_refs = array("I")
+        self.description_refs = array("I")
+        self.scenario_refs = array("I")
+        self._meta: Dict[str, array] = {}
+        self.issues: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.foundation_codes)
+
+    def intern(self, value: str) -> int:
+        ref = self._string_index.get(value)
+        if ref is None:
+            ref = self._string_index[value] = len(self._string_index)
+        return ref
+
+    def add(self, foundation: str, label: str, title: str, description: str, scenario: str,
+            meta: Optional[Dict[str, str]] = None):
+        code = self._foundation_index.get(foundation)
+        if code is None:
+            code = self._foundation_index[foundation] = len(self._foundation_index)
+        n = len(self.foundation_codes)
+        self.foundation_codes.append(code)
+        self.label_codes.append(LABELS.index(label))
+        self.title_refs.append(self.intern(title or ""))
+        self.description_refs.append(self.intern(description or ""))
+        self.scenario_refs.append(self.intern(scenario or ""))
+        meta = meta or {}
+        for name in meta:
+            if name not in self._meta:
+                # a column first seen on this row is blank for all earlier rows
+                self._meta[name] = array("I", [self.intern("")]) * n
+        for name, column in self._meta.items():
+            value = meta.get(name)
+            column.append(self.intern("" if value is None else str(value)))
+
+    def fill_blank_text(self, fields: Dict[str, str]):
+        """Set `title`/`description` in `fields` on every row added so far whose value is blank."""
+        blank = self.intern("")
+        for name, refs in (("title", self.title_refs), ("description", self.description_refs)):
+            if fields.get(name):
+                ref = self.intern(fields[name])
+                for i, value in enumerate(refs):
+                    if value == blank:
+                        refs[i] = ref
+
+    def build(self, version: str = "") -> SamplePool:
+        strings = list(self._string_index)
+        meta_columns: Dict[str, array] = {}
+        for name, refs in self._meta.items():
+            meta_columns[name] = _numeric_column(refs, strings) or refs
+        pool = SamplePool(list(self._foundation_index), self.foundation_codes, self.label_codes, strings,
+                          self.title_refs, self.description_refs, self.scenario_refs, meta_columns, version=version)
+        pool.load_issues = dict(self.issues)
+        return pool
+
+
+def _numeric_column(refs: array, strings: List[str]) -> Optional[array]:
+    """Return `refs` as a float array (blank -> NaN) if every distinct value is numeric, else None."""
+    values: Dict[int, float] = {}
+    for ref in set(refs):
+        text = strings[ref].strip()
+        if text == "":
+            values[ref] = math.nan
+            continue
+        try:
+            values[ref] = float(text)
+        except ValueError:
+            return None
+    return array("d", (values[ref] for ref in refs))
+
+
+def meta_fields(row: Dict) -> Dict:
+    """The fields of a row kept as sample meta (everything but the text, foundation and label)."""
+    return {k: v for k, v in row.items() if k not in ("title", "description", "scenario", "foundation", "label")}
+
+
+def add_csv_rows(builder: PoolBuilder, f):
+    """Add every row of a sample CSV text stream to `builder` (id = row index)."""
+    for row in csv.DictReader(f):
+        foundation, label = normalize_row(row, builder.issues)
+        # keep other fields in case needed
+        builder.add(foundation, label, row.get("title", ""), row.get("description", ""), row.get("scenario", ""),
+                    meta_fields(row))
+
+
+def flatten_record(obj, parent_key: str = "", sep: str = ".", list_primitive_sep: str = "|") -> Dict:
+    """Flatten a JSON record like `others/expand_json_to_csv.py` does: nested dicts become dot-separated
+    keys, lists of primitives are joined with `list_primitive_sep`, lists of dicts are expanded by index.
+    Unlike the CSV export, primitive values keep their JSON types.
+    """
+    items: Dict = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            items.update(flatten_record(v, f"{parent_key}{sep}{k}" if parent_key else k, sep, list_primitive_sep))
+    elif isinstance(obj, list):
+        if all(not isinstance(x, (dict, list)) for x in obj):
+            items[parent_key] = list_primitive_sep.join(str(x) for x in obj)
+        else:
+            for idx, val in enumerate(obj):
+                items.update(flatten_record(val, f"{parent_key}{sep}{idx}" if parent_key else str(idx), sep, list_primitive_sep))
+    else:
+        items[parent_key] = obj
+    return items
+
+
+def json_foundation_label(flat: Dict, issues: Optional[Counter] = None) -> Tuple[str, str]:
+    """Return the normalized (foundation, label) of a flattened JSON record (label rule: see add_json_record)."""
+    has_classification = any(
+        k.startswith("classifications.") and v not in (None, "") and str(v).strip() != ""
+        for k, v in flat.items()
+    )
+    foundation = str(flat.get("foundation") or "").strip()
+    if foundation == "":
+        foundation = "<missing>"
+        if issues is not None:
+            issues["missing_foundation"] += 1
+    return foundation, "original" if has_classification else "generated"
+
+
+def add_json_record(builder: PoolBuilder, record: Dict):
+    """Add one scenario record (parent metadata already merged in) to `builder`.
+
+    The label follows `write_csv` in others/expand_json_to_csv.py: a record is 'original' when any
+    `classifications.*` field is non-empty, otherwise 'generated'.
+    """
+    flat = flatten_record(record)
+    foundation, label = json_foundation_label(flat, builder.issues)
+    builder.add(foundation, label,
+                str(flat.get("title") or ""), str(flat.get("description") or ""), str(flat.get("scenario") or ""),
+                meta_fields(flat))
+
+
+def _explode(obj) -> List:
+    """Split a parsed JSON value into rows the way `explode_rows` in others/expand_json_to_csv.py does."""
+    if isinstance(obj, list):
+        return obj
+    if not isinstance(obj, dict):
+        return [obj]
+    list_keys = [k for k, v in obj.items() if isinstance(v, list) and v and all(isinstance(x, dict) for x in v)]
+    if "scenarios" in list_keys:
+        chosen_key = "scenarios"
+    elif list_keys:
+        chosen_key = max(list_keys, key=lambda k: len(obj[k]))
+    else:
+        return [obj]
+    parent = {k: v for k, v in obj.items() if k != chosen_key}
+    return [dict(parent, **item) for item in obj[chosen_key]]
+
+
+class _JSONStream:
+    """Reads consecutive JSON values and structural characters from a text stream.
+
+    Only the unconsumed tail of the input is buffered, so memory is bounded by the largest
+    single value (one scenario) plus one read chunk.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(JSON_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        ch = self.peek()
+        if ch == "" or ch not in chars:
+            raise ValueError(f"invalid sample JSON: expected one of {chars!r}, found {ch or 'end of input'!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a value ending exactly at the buffer end may be a truncated number; read on to be sure
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_json_rows(f, lines: bool = False, trailing: Optional[Dict] = None) -> Iterator:
+    """Yield scenario rows from a JSON (or, with `lines`, JSON Lines) text stream, one at a time.
+
+    A top-level object's `scenarios` list is streamed element by element, each merged with the
+    object's top-level fields seen so far (child keys take precedence); top-level fields that
+    come after `scenarios` are stored in `trailing` once the stream ends. Objects without a
+    `scenarios` list, JSON Lines values and top-level array elements are split like
+    `explode_rows` does.
+    """
+    if lines:
+        for line in f:
+            if line.strip():
+                yield from _explode(json.loads(line))
+        return
+    stream = _JSONStream(f)
+    if stream.peek() == "[":
+        stream.expect("[")
+        if stream.peek() == "]":
+            return
+        while True:
+            yield from _explode(stream.value())
+            if stream.expect(",]") == "]":
+                return
+    stream.expect("{")
+    parent: Dict = {}
+    streamed = False
+    if stream.peek() != "}":
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "scenarios" and stream.peek() == "[":
+                streamed = True
+                stream.expect("[")
+                if stream.peek() != "]":
+                    while True:
+                        item = stream.value()
+                        yield dict(parent, **item) if isinstance(item, dict) else dict(parent, scenarios=item)
+                        if stream.expect(",]") == "]":
+                            break
+                else:
+                    stream.expect("]")
+            else:
+                parent[key] = stream.value()
+            if stream.expect(",}") == "}":
+                break
+    if not streamed:
+        yield from _explode(parent)
+    elif trailing is not None:
+        trailing.update(parent)
+
+
+def add_json_rows(builder: PoolBuilder, f, lines: bool = False):
+    """Add every scenario of a JSON / JSON Lines text stream to `builder`."""
+    trailing: Dict = {}
+    for row in iter_json_rows(f, lines=lines, trailing=trailing):
+        if isinstance(row, dict):
+            add_json_record(builder, row)
+    # a title/description given after `scenarios` applies to rows that had none
+    builder.fill_blank_text({k: str(trailing[k]) for k in ("title", "description") if trailing.get(k) is not None})
+
+
+def source_format(path: Path) -> str:
+    """'csv', 'json' or 'jsonl', from the file suffix."""
+    suffix = path.suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix == ".json":
+        return "json"
+    return "csv"
+
+
+class _HashingReader(io.RawIOBase):
+    """Raw reader that feeds everything read from `f` into a sha256."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self.f.readinto(b)
+        if n:
+            self.sha.update(memoryview(b)[:n])
+        return n
+
+
+def file_sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_source(path: Path) -> Tuple[SamplePool, str]:
+    """Stream a pool source (CSV, JSON or JSON Lines) into a `SamplePool` in one pass.
+
+    Returns (pool, sha256 of the file); the pool's version is a prefix of the hash.
+    """
+    with open(path, "rb", buffering=0) as raw:
+        reader = _HashingReader(raw)
+        text = io.TextIOWrapper(io.BufferedReader(reader), encoding="utf-8", newline="")
+        builder = PoolBuilder()
+        fmt = source_format(path)
+        if fmt == "csv":
+            add_csv_rows(builder, text)
+        else:
+            add_json_rows(builder, text, lines=fmt == "jsonl")
+        # anything after the last parsed value (e.g. trailing whitespace) still counts towards the hash
+        text.read()
+        digest = reader.sha.hexdigest()
+    return builder.build(version=digest[:VERSION_DIGITS]), digest
+
+
+class LazySamplePool(SamplePool):
+    """Sample pool that keeps only ids, foundation and label codes in memory.
+
+    Sample text and meta stay in the source file (a CSV or JSON Lines file); `record_offsets[i]`
+    and `record_offsets[i + 1]` delimit sample i's record in the file, which is mapped read-only
+    and parsed when the sample is served. The most recently served samples are kept in an LRU
+    cache of `cache_size` entries. Memory scales with the number of samples, not the corpus size.
+
+    Replace the source file by renaming a new file over it (as the snapshot does), never by
+    rewriting it in place: a mapped file that shrinks under a reader is undefined behaviour.
+    """
+
+    def __init__(self, path: Path, fmt: str, foundation_names: List[str], foundation_codes: array,
+                 label_codes: array, record_offsets: array, fieldnames: List[str], meta_names: List[str],
+                 numeric_columns: Set[str], version: str = "", cache_size: int = 4096):
+        super().__init__(foundation_names, foundation_codes, label_codes, [], array("I"), array("I"), array("I"),
+                         {}, version=version)
+        self.path = path
+        self.format = fmt
+        self.record_offsets = record_offsets
+        self.fieldnames = fieldnames
+        self.meta_names = meta_names
+        self.numeric_columns = numeric_columns
+        if len(record_offsets) > 1 and record_offsets[-1] > 0:
+            with open(path, "rb") as f:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load = functools.lru_cache(maxsize=cache_size)(self._read_record)
+
+    def _read_record(self, sid: int) -> Tuple[Dict, bytes]:
+        """Parse sample `sid` from the mapped source; returns (sample dict, encoded fragment)."""
+        text = str(self.mapping[self.record_offsets[sid]:self.record_offsets[sid + 1]], "utf-8")
+        if self.format == "csv":
+            row = dict(zip(self.fieldnames, next(csv.reader(io.StringIO(text, newline="")))))
+            title, description, scenario = row.get("title", ""), row.get("description", ""), row.get("scenario", "")
+        else:
+            row = flatten_record(json.loads(text))
+            title, description, scenario = (str(row.get(k) or "") for k in ("title", "description", "scenario"))
+        # every meta column seen in the source, blank where this record has none (as in a built pool)
+        meta = {}
+        for k in self.meta_names:
+            v = row.get(k)
+            if k in self.numeric_columns:
+                meta[k] = _number(float(v) if v is not None and str(v).strip() else math.nan)
+            else:
+                meta[k] = "" if v is None else str(v)
+        sample = {
+            "id": sid,
+            "foundation": self.foundation(sid),
+            "label": self.label(sid),
+            "title": title,
+            "description": description,
+            "scenario": scenario,
+            "meta": meta,
+        }
+        return sample, encode_fragment(sample)
+
+    def get(self, sid) -> Optional[Dict]:
+        if sid not in self:
+            return None
+        sample = self._load(sid)[0]
+        return dict(sample, meta=dict(sample["meta"]))
+
+    def scenario(self, sid: int) -> str:
+        # parsed without the cache: callers scan the whole pool
+        return self._read_record(sid)[0]["scenario"]
+
+    def fragment(self, sid: int):
+        return self._load(sid)[1]
+
+    def _memory_groups(self) -> Dict[str, tuple]:
+        groups = super()._memory_groups()
+        groups["record_offsets"] = (self.record_offsets, self.fieldnames, self.meta_names, self.numeric_columns)
+        return groups
+
+
+def index_source(path: Path, cache_size: int = 4096) -> LazySamplePool:
+    """Scan a CSV or JSON Lines pool source once and return a `LazySamplePool` over it.
+
+    Each record is parsed during the scan to find its foundation/label (and which meta columns
+    are numeric), but only those codes and the record's byte offset are kept.
+    """
+    fmt = source_format(path)
+    if fmt == "json":
+        raise ValueError("lazy pools need a CSV or JSON Lines source (one record per line); convert the JSON first")
+    foundation_index: Dict[str, int] = {}
+    foundation_codes = array("H")
+    label_codes = array("B")
+    offsets = array("Q")
+    fieldnames: List[str] = []
+    non_numeric: Set[str] = set()
+    seen_columns: Dict[str, None] = {}
+    issues: Counter = Counter()
+    # hash of each record's scenario text, for the duplicate/empty text stats (dropped after the scan)
+    text_keys = array("q")
+    empty_key = hash("")
+    sha = hashlib.sha256()
+
+    def add(foundation: str, label: str, scenario, meta: Dict, offset: int):
+        code = foundation_index.setdefault(foundation, len(foundation_index))
+        foundation_codes.append(code)
+        label_codes.append(LABELS.index(label))
+        offsets.append(offset)
+        scenario = str(scenario or "")
+        text_keys.append(hash(scenario) if scenario.strip() else empty_key)
+        for k, v in meta.items():
+            seen_columns.setdefault(k)
+            if k in non_numeric or v is None or str(v).strip() == "":
+                continue
+            try:
+                float(v)
+            except (TypeError, ValueError):
+                non_numeric.add(k)
+
+    with open(path, "rb") as f:
+        offset = 0
+        record_start = 0
+        pending = b""
+        for line in f:
+            sha.update(line)
+            offset += len(line)
+            if fmt == "jsonl":
+                if line.strip():
+                    flat = flatten_record(json.loads(line))
+                    add(*json_foundation_label(flat, issues), flat.get("scenario"), meta_fields(flat),
+                        offset - len(line))
+                continue
+            # CSV: a record may span lines inside quotes; it ends at a newline with balanced quotes
+            pending += line
+            if pending.count(b'"') % 2:
+                continue
+            record, pending = pending, b""
+            start, record_start = record_start, offset
+            if not record.strip():
+                continue
+            values = next(csv.reader(io.StringIO(record.decode("utf-8"), newline="")))
+            if not fieldnames:
+                fieldnames = values
+                continue
+            row = dict(zip(fieldnames, values))
+            add(*normalize_row(row, issues), row.get("scenario"), meta_fields(row), start)
+        if fmt == "csv" and pending.strip():
+            raise ValueError(f"{path}: unterminated quoted field at end of file")
+    # end offsets: each record ends where the next begins (JSON Lines records end at their newline)
+    offsets.append(offset)
+    numeric = {k for k in seen_columns if k not in non_numeric}
+    pool = LazySamplePool(path, fmt, list(foundation_index), foundation_codes, label_codes, offsets, fieldnames,
+                          list(seen_columns), numeric, version=sha.hexdigest()[:VERSION_DIGITS], cache_size=cache_size)
+    pool.load_issues = dict(issues)
+    counts = Counter(text_keys)
+    pool._text_stats = scenario_text_stats(text_keys, counts, {empty_key} & counts.keys())
+    return pool
+
+
+# (foundation, originals, generated) counts in MFV130Gen.csv; the default shape of synthetic pools
+MFV130_SHAPE = [
+    ("Authority", 17, 200),
+    ("Care (e)", 16, 70),
+    ("Care (p, a)", 9, 70),
+    ("Care (p, h)", 7, 70),
+    ("Fairness", 17, 200),
+    ("Liberty", 17, 200),
+    ("Loyalty", 16, 200),
+    ("Sanctity", 17, 200),
+    ("Social Norms", 16, 200),
+]
+CLASSIFICATION_COLUMNS = ["care", "fairness", "loyalty", "authority", "sanctity", "liberty", "not_wrong"]
+
+
+def synthetic_pool(rows: int, shape: Optional[List[Tuple[str, int, int]]] = None, seed: int = 0) -> SamplePool:
+    """Build a pool of about `rows` samples with the foundation/label mix of `shape` (default: MFV130_SHAPE).
+
+    Rows look like MFV130Gen.csv rows: one shared title/description, a distinct scenario per row,
+    classification percentages on originals and a wrongness rating on every row.
+    """
+    shape = shape or MFV130_SHAPE
+    rng = random.Random(seed)
+    base_total = sum(o + g for _, o, g in shape)
+    builder = PoolBuilder()
+    title = "Respondent ratings of moral scenarios"
+    description = "Synthetic pool scaled from the MFV130Gen foundation/label mix."
+    for foundation, o, g in shape:
+        for label, count in (("original", o), ("generated", g)):
+            for _ in range(max(1, round(count * rows / base_total)) if count else 0):
+                meta = {f"classifications.{c}": (str(rng.randint(0, 100)) if label == "original" else "")
+                        for c in CLASSIFICATION_COLUMNS}
+                meta["wrongness_rating"] = f"{rng.uniform(0, 4):.1f}"
+                builder.add(foundation, label, title, description,
+                            f"You see synthetic scenario {len(builder)} ({foundation}).", meta)
+    return builder.build(version=f"synthetic-{rows}-{seed}")
+
+
+def snapshot_path(source_path: Path) -> Path:
+    return source_path.with_name(source_path.name + SNAPSHOT_SUFFIX)
+
+
+def version_snapshot_path(source_path: Path, version: str, directory: Optional[Path] = None) -> Path:
+    """Where the snapshot of pool version `version` of `source_path` is archived (next to the source by default)."""
+    return (directory or source_path.parent) / f"{source_path.name}.{version}{SNAPSHOT_SUFFIX}"
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _pool_sections(pool: SamplePool) -> Tuple[Dict, List[Tuple[str, str, bytes]]]:
+    """Return (layout header, [(section name, format, raw bytes)]) describing `pool` as flat arrays."""
+    blob, offsets = _pack(value.encode("utf-8") for value in pool.strings)
+    fragment_blob, fragment_offsets = _pack(pool.fragment(sid) for sid in pool.all_ids)
+    sections = [
+        ("foundation_codes", "H", pool.foundation_codes),
+        ("label_codes", "B", pool.label_codes),
+        ("title_refs", "I", pool.title_refs),
+        ("description_refs", "I", pool.description_refs),
+        ("scenario_refs", "I", pool.scenario_refs),
+        ("string_offsets", "Q", offsets),
+        ("string_blob", "B", blob),
+        ("fragment_offsets", "Q", fragment_offsets),
+        ("fragment_blob", "B", fragment_blob),
+    ]
+    meta = []
+    for i, (name, column) in enumerate(pool.meta_columns.items()):
+        meta.append([name, f"meta{i}"])
+        sections.append((f"meta{i}", _kind(column), column))
+    by_key = []
+    for i, ((foundation, label), ids) in enumerate(pool.by_key.items()):
+        by_key.append([foundation, label, f"key{i}"])
+        sections.append((f"key{i}", "I", ids))
+    for label, ids in pool.by_label.items():
+        sections.append((f"label:{label}", "I", ids))
+    layout = {"foundation_names": pool.foundation_names, "meta_columns": meta, "by_key": by_key}
+    return layout, [(name, fmt, bytes(data)) for name, fmt, data in sections]
+
+
+def _pack(items: Iterable) -> Tuple[bytearray, array]:
+    """Concatenate bytes-like items into one blob; item i is blob[offsets[i]:offsets[i + 1]]."""
+    blob = bytearray()
+    offsets = array("Q", [0])
+    for item in items:
+        blob += item
+        offsets.append(len(blob))
+    return blob, offsets
+
+
+def write_snapshot(path: Path, header: Dict, pool: SamplePool):
+    """Atomically write `pool` as a snapshot image (write to a temp file, then rename over `path`).
+
+    Replacing the file never disturbs processes that still map the previous image.
+    """
+    layout, sections = _pool_sections(pool)
+    table = {}
+    offset = 0
+    for name, fmt, data in sections:
+        table[name] = [offset, len(data), fmt]
+        offset = _align(offset + len(data))
+    header = dict(header, **layout, version=SNAPSHOT_VERSION, byteorder=sys.byteorder, pool_version=pool.version,
+                  load_issues=pool.load_issues, text_stats=pool.text_stats(), sections=table)
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(SNAPSHOT_MAGIC) + 4 + len(header_bytes))
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, fmt, data in sections:
+            f.seek(data_start + table[name][0])
+            f.write(data)
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def read_snapshot_header(mm) -> Tuple[Dict, int]:
+    """Return (header, data start offset) of a mapped snapshot image.
+
+    Raises ValueError if the buffer is not a snapshot of the current SNAPSHOT_VERSION.
+    """
+    if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError("not a sample pool snapshot")
+    (header_len,) = struct.unpack_from("<I", mm, len(SNAPSHOT_MAGIC))
+    start = len(SNAPSHOT_MAGIC) + 4
+    header = json.loads(mm[start:start + header_len])
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"snapshot version {header.get('version')}, expected {SNAPSHOT_VERSION}")
+    if header.get("byteorder") != sys.byteorder:
+        raise ValueError(f"snapshot was written on a {header.get('byteorder')}-endian machine")
+    return header, _align(start + header_len)
+
+
+def map_snapshot(path: Path) -> Tuple[Dict, SamplePool]:
+    """Map a snapshot image read-only and return (header, pool) backed by the mapping.
+
+    No column is copied: the arrays are memoryviews over the mapping and strings are decoded
+    on access, so every process mapping the same file shares one copy in the page cache.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = read_snapshot_header(mm)
+    view = memoryview(mm)
+
+    def section(name):
+        offset, length, fmt = header["sections"][name]
+        return view[data_start + offset:data_start + offset + length].cast(fmt)
+
+    by_key = {(foundation, label): section(name) for foundation, label, name in header["by_key"]}
+    by_label = {label: section(f"label:{label}") for label in LABELS}
+    pool = SamplePool(
+        header["foundation_names"],
+        section("foundation_codes"),
+        section("label_codes"),
+        MappedStrings(section("string_offsets"), section("string_blob")),
+        section("title_refs"),
+        section("description_refs"),
+        section("scenario_refs"),
+        {name: section(sec) for name, sec in header["meta_columns"]},
+        version=header["pool_version"],
+        indexes=(by_key, by_label),
+        fragments=MappedBytes(section("fragment_offsets"), section("fragment_blob")),
+    )
+    pool.mapping = mm
+    pool.load_issues = header["load_issues"]
+    pool._text_stats = header["text_stats"]
+    return header, pool
+
+
+def build_snapshot(source_path: Path) -> SamplePool:
+    """Parse `source_path`, write its snapshot and return the pool mapped from the snapshot."""
+    st = source_path.stat()
+    pool, digest = read_source(source_path)
+    path = snapshot_path(source_path)
+    write_snapshot(path, {
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "source_sha256": digest,
+    }, pool)
+    return map_snapshot(path)[1]
+
+
+def archive_snapshot(source_path: Path, pool: SamplePool, directory: Optional[Path] = None) -> Path:
+    """Keep `pool` as the snapshot of its version (see version_snapshot_path) unless one exists already."""
+    path = version_snapshot_path(source_path, pool.version, directory)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    current = snapshot_path(source_path)
+    try:
+        # the source's own snapshot usually holds this version already: share its file instead of a copy
+        with open(current, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = read_snapshot_header(mm)[0]
+        if header.get("pool_version") == pool.version:
+            os.link(current, path)
+            return path
+    except (OSError, ValueError, KeyError, struct.error):
+        pass
+    write_snapshot(path, {"source_name": source_path.name}, pool)
+    return path
+
+
+def load_version(source_path: Path, version: str, directory: Optional[Path] = None) -> Optional[SamplePool]:
+    """The archived pool of `source_path` with this version (mapped from its snapshot), or None if there is none."""
+    path = version_snapshot_path(source_path, version, directory)
+    if not path.exists():
+        return None
+    try:
+        header, pool = map_snapshot(path)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"WARNING: ignoring unreadable archived sample pool snapshot {path}:", e)
+        return None
+    return pool if header.get("pool_version") == version else None
+
+
+def _load_from_snapshot(source_path: Path) -> Optional[SamplePool]:
+    """Return the pool mapped from the source's snapshot if the snapshot still matches the source, else None.
+
+    Size + mtime is the fast check; when only the mtime differs (e.g. the file was copied
+    into a container) the content hash decides, and the snapshot header is refreshed.
+    """
+    path = snapshot_path(source_path)
+    if not path.exists():
+        return None
+    try:
+        header, pool = map_snapshot(path)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print("WARNING: ignoring unreadable sample pool snapshot:", e)
+        return None
+    st = source_path.stat()
+    if header.get("source_size") != st.st_size:
+        return None
+    if header.get("source_mtime_ns") != st.st_mtime_ns:
+        if file_sha256(source_path) != header.get("source_sha256"):
+            return None
+        try:
+            source = {k: header[k] for k in ("source_size", "source_sha256")}
+            write_snapshot(path, dict(source, source_mtime_ns=st.st_mtime_ns), pool)
+            return map_snapshot(path)[1]
+        except OSError:
+            pass
+    return pool
+
+
+def load_samples(source_path: Path, use_snapshot: bool = True, lazy: bool = False,
+                 cache_size: int = 4096) -> SamplePool:
+    """Return an indexed `SamplePool` for a pool source: the sample CSV, or the source JSON
+    (an object with a `scenarios` list, e.g. MFV130Gen.json) / JSON Lines file it is exported from.
+
+    With `use_snapshot`, a matching snapshot is loaded instead of parsing the source, and a
+    stale or missing snapshot is rebuilt (failure to write it, e.g. on a read-only
+    filesystem, only costs the next start another parse).
+
+    With `lazy`, only the metadata and a byte-offset index are loaded and sample text is read
+    from the (CSV or JSON Lines) source on demand, see `LazySamplePool`.
+    """
+    if not source_path.exists():
+        raise FileNotFoundError(f"Sample source not found at {source_path}")
+    if lazy:
+        return index_source(source_path, cache_size=cache_size)
+    if use_snapshot:
+        pool = _load_from_snapshot(source_path)
+        if pool is not None:
+            return pool
+        try:
+            return build_snapshot(source_path)
+        except OSError as e:
+            print("WARNING: could not write sample pool snapshot:", e)
+    return read_source(source_path)[0]
+
+
+def sample_excluding(ids: Sequence[int], k: int, exclude: Set[int], rng: random.Random = None) -> List[int]:
+    """Pick up to k distinct ids from `ids` uniformly at random, skipping ids in `exclude`.
+
+    Draws k + len(exclude) candidates and drops the excluded ones, so the cost is
+    O(k + len(exclude)) rather than O(len(ids)). When fewer than k ids are available,
+    all of them are returned. Draws from `rng` (default: the `random` module).
+    """
+    rng = rng or random
+    if k <= 0 or not ids:
+        return []
+    m = k + len(exclude)
+    if m >= len(ids):
+        available = [i for i in ids if i not in exclude]
+        if len(available) > k:
+            return rng.sample(available, k)
+        return available
+    return [i for i in rng.sample(ids, m) if i not in exclude][:k]
+
+
+# Blocks up to this size are always scanned by sample_weighted (cheap enough, and exact without a bound)
+WEIGHTED_SCAN_MAX = 2048
+
+
+def sample_weighted(ids: Sequence[int], k: int, exclude: Set[int], weight: Callable[[int], float],
+                    rng: random.Random = None, bound: Optional[float] = None) -> List[int]:
+    """Pick up to k distinct ids from `ids` without replacement, each with probability proportional to
+    `weight(id)`, skipping ids in `exclude`.
+
+    Efraimidis-Spirakis: every id gets the key log(u) / weight (u uniform in (0, 1]) and the k largest
+    keys win, so one pass over `ids` suffices: O(len(ids) log k). Weights must be positive.
+
+    With `bound` (no weight in `ids` is larger) and more than WEIGHTED_SCAN_MAX ids, ids are drawn one
+    at a time by rejection instead: a uniform candidate is kept with probability weight / bound, which
+    costs O(k * bound / typical weight) independent of len(ids) and gives the same distribution. If
+    that takes more than len(ids) / 4 candidates (most weights far below the bound), the rest is
+    picked by the scan.
+    """
+    rng = rng or random
+    if k <= 0 or not ids:
+        return []
+    picked: List[int] = []
+    n = len(ids)
+    if bound is not None and n > WEIGHTED_SCAN_MAX:
+        taken: Set[int] = set()
+        for _ in range(n // 4):
+            i = ids[int(rng.random() * n)]
+            if i in exclude or i in taken or rng.random() * bound >= weight(i):
+                continue
+            picked.append(i)
+            taken.add(i)
+            if len(picked) == k:
+                return picked
+        exclude = exclude | taken
+    keyed = ((math.log(1.0 - rng.random()) / weight(i), i) for i in ids if i not in exclude)
+    return picked + [i for _, i in heapq.nlargest(k - len(picked), keyed)]
+
+
+def sample_for_foundations(pool: SamplePool, foundations: Iterable[str], desired_original: int,
+                           desired_generated: int, rng: random.Random = None,
+                           weight: Optional[Callable[[int], float]] = None, donors: bool = True,
+                           weight_bound: Optional[float] = None) -> List[int]:
+    """Pick `desired_original` + `desired_generated` sample ids split evenly across `foundations`.
+
+    Samples are randomized only within each foundation block; blocks are returned in the
+    order of `foundations`. When a foundation is short of originals/generated, the gap is
+    filled from the same label in the foundations outside the set (`SamplePool.donors`, so the
+    fallback never takes samples a later block of the set needs and costs the same as a normal
+    draw), and finally from any remaining sample. `donors=False` draws the gap from every sample
+    of the label instead (sampler "u1").
+    With a seeded `rng` the result depends only on the seed, the pool and the arguments
+    (see `sample_from_spec`). With `weight` (sample id -> positive weight) samples are drawn
+    with probability proportional to their weight instead of uniformly (see `sample_weighted`;
+    `weight_bound`, the largest weight of any sample, makes that independent of the block sizes).
+    """
+    rng = rng or random
+    if weight is None:
+        pick = sample_excluding
+    else:
+        def pick(ids, k, exclude, rng):
+            return sample_weighted(ids, k, exclude, weight, rng, weight_bound)
+    foundations = list(foundations)
+    n = len(foundations)
+    total = desired_original + desired_generated
+    chosen: List[int] = []
+    already_chosen: Set[int] = set()
+
+    for i, foundation in enumerate(foundations):
+        # allocate originals/generated evenly; earlier blocks take the floor, later ones the remainder
+        need_orig = desired_original * (i + 1) // n - desired_original * i // n
+        need_gen = desired_generated * (i + 1) // n - desired_generated * i // n
+
+        block: List[int] = []
+        for label, need in (("original", need_orig), ("generated", need_gen)):
+            picked = pick(pool.ids(foundation, label), need, already_chosen, rng)
+            if len(picked) < need:
+                # fallback: sample the same label from other foundations
+                fallback = pool.donors(foundations, label) if donors else pool.by_label[label]
+                picked.extend(pick(fallback, need - len(picked), already_chosen | set(picked), rng))
+            block.extend(picked)
+
+        # shuffle within this foundation block
+        rng.shuffle(block)
+        already_chosen.update(block)
+        chosen.extend(block)
+
+    # If still short, fill from remaining samples as an extra block
+    if len(chosen) < total:
+        extra = pick(pool.all_ids, total - len(chosen), already_chosen, rng)
+        rng.shuffle(extra)
+        chosen.extend(extra)
+
+    return chosen
+
+
+def make_sample_spec(seed: int, desired_original: int, desired_generated: int, sampler: str = SAMPLER) -> str:
+    """Encode what is needed to regenerate an assignment's sample ids: "<sampler>:<seed>:<original>:<generated>"."""
+    return f"{sampler}:{seed}:{desired_original}:{desired_generated}"
+
+
+def parse_sample_spec(spec: str) -> Tuple[str, int, int, int]:
+    """Return (sampler, seed, desired_original, desired_generated) of a spec from `make_sample_spec`."""
+    sampler, seed, desired_original, desired_generated = spec.split(":")
+    return sampler, int(seed), int(desired_original), int(desired_generated)
+
+
+def match_samples(old: SamplePool, new: SamplePool) -> Tuple[array, array]:
+    """Pair the samples of two versions of a pool that have the same foundation, label and scenario text (duplicates
+    pair up in id order). Returns (old id of each new id, new id of each old id), -1 where a sample has no match.
+    O(len(old) + len(new))."""
+    first: Dict[int, object] = {}  # content hash -> old id, or a list of old ids for duplicates
+    for j in old.all_ids:
+        key = hash((old.foundation(j), old.label(j), old.scenario(j)))
+        seen = first.get(key)
+        if seen is None:
+            first[key] = j
+        elif isinstance(seen, list):
+            seen.append(j)
+        else:
+            first[key] = [seen, j]
+    to_old = array("i", [-1]) * len(new)
+    to_new = array("i", [-1]) * len(old)
+    for i in new.all_ids:
+        key = hash((new.foundation(i), new.label(i), new.scenario(i)))
+        seen = first.get(key)
+        if seen is None:
+            continue
+        if isinstance(seen, list):
+            j = seen.pop(0)
+            if not seen:
+                del first[key]
+        else:
+            j = seen
+            del first[key]
+        # a hash collision between different samples is told apart here
+        if (old.foundation(j), old.label(j), old.scenario(j)) == (new.foundation(i), new.label(i), new.scenario(i)):
+            to_old[i] = j
+            to_new[j] = i
+    return to_old, to_new
+
+
+def sample_from_spec(pool: SamplePool, foundations: Sequence[str], spec: str) -> List[int]:
+    """Regenerate the sample ids of an assignment from its spec; the same pool version, foundations and
+    spec always give the same ids."""
+    sampler, seed, desired_original, desired_generated = parse_sample_spec(spec)
+    if sampler not in SAMPLERS:
+        raise ValueError(f"unknown sampler {sampler!r} in sample spec")
+    return sample_for_foundations(pool, foundations, desired_original, desired_generated, random.Random(seed),
+                                  donors=sampler != "u1")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Prebuild the sample pool snapshot for a sample CSV/JSON/JSON Lines file")
+    p.add_argument("input", nargs="?", default=str(Path(__file__).parent / "MFV130Gen.csv"),
+                   help="Path to the pool source (default: MFV130Gen.csv next to this script)")
+    p.add_argument("--original", type=int, default=10, help="Originals per participant to validate against (default: 10)")
+    p.add_argument("--generated", type=int, default=20,
+                   help="Generated samples per participant to validate against (default: 20)")
+    args = p.parse_args(argv)
+
+    source_path = Path(args.input)
+    if not source_path.exists():
+        raise SystemExit(f"Sample source not found at {source_path}")
+    pool = build_snapshot(source_path)
+    print(f"Wrote snapshot of {len(pool)} samples to: {snapshot_path(source_path)}")
+    report = pool.validation(args.original, args.generated)
+    text = report["text"]
+    print(f"Load-time coercions: {report['load_issues'] or 'none'}; empty scenarios: {text['empty_scenarios']}; "
+          f"duplicate scenarios: {text['duplicate_scenarios']}")
+    print(f"{len(report['fallback_sets'])} of {report['foundation_sets']} foundation pairs need the "
+          f"cross-foundation fallback for {args.original} original + {args.generated} generated samples")
+    for entry in report["fallback_sets"]:
+        print("  ", " + ".join(entry["foundations"]), "short:", entry["shortfall"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+spool.py
+
+Durable local spool for rating submissions the database cannot take right now (unreachable,
+failing or slower than the backend waits): each record is appended to a JSON Lines file and
+fsync'd before the submission is acknowledged, and a replayer drains the spool back into the
+database in batches once it is reachable again.
+
+- One spool file per process (`spool-<host>-<pid>.jsonl` in the spool directory), held under an
+  exclusive `flock` for the process's lifetime, so worker processes never write the same file.
+- `replay(write, batch_size)` drains this process's file and any file left behind by a process
+  that exited (its lock is gone), oldest first. `write(records)` stores a batch and returns how
+  many records were new; it must be idempotent (the backend skips (participant, sample) pairs that
+  already have a response, under a per-participant lock), because a batch written just before a
+  crash is replayed again.
+- A file that is fully replayed is truncated (this process's) or deleted (a left-behind one).
+  A torn last line (the process died mid-append, so it was never acknowledged) is ignored.
+- `metrics()` reports records spooled, replayed, skipped (already stored) and still pending.
+"""
+
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class SubmissionSpool:
+    """Append-only, fsync'd spool of submission records in `directory` (see the module docstring)."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"spool-{socket.gethostname()}-{os.getpid()}.jsonl"
+        self._file = open(self.path, "ab+")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._fsync_directory()
+        # a file left by an earlier process with the same pid (containers): keep its complete lines for replay
+        self._file.seek(0)
+        existing = self._file.read()
+        if existing and not existing.endswith(b"\n"):
+            self._file.truncate(existing.rfind(b"\n") + 1)
+        self._lock = threading.Lock()  # appends and truncation of this process's file
+        self._replay_lock = threading.Lock()
+        self._offset = 0  # bytes of this process's file already replayed
+        # metrics
+        self.spooled = 0
+        self.replayed = 0
+        self.skipped = 0  # replayed records that were already stored (or of unknown participants)
+        self.pending = existing.count(b"\n")  # records in this process's file not replayed yet
+        self.last_error: Optional[str] = None
+        self.last_replay_at = 0.0
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, records: List[Dict]):
+        """Append records and fsync them; returns once they are on disk."""
+        data = b"".join(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n" for record in records)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.spooled += len(records)
+            self.pending += len(records)
+
+    def replay(self, write: Callable[[List[Dict]], int], batch_size: int = 500) -> int:
+        """Drain the spool through `write` (see the module docstring); returns the number of records replayed.
+        An exception from `write` stops the replay (the rest stays spooled for the next call) and is raised."""
+        with self._replay_lock:
+            replayed = 0
+            for _, path in sorted(self._spool_files()):
+                if path == self.path:
+                    replayed += self._replay_own(write, batch_size)
+                else:
+                    replayed += self._replay_left_behind(path, write, batch_size)
+            self.last_replay_at = time.time()
+            return replayed
+
+    def _spool_files(self) -> List[Tuple[float, Path]]:
+        """(mtime, path) of the spool files in the directory; files deleted meanwhile (replayed by another process)
+        are left out."""
+        files = []
+        for path in self.directory.glob("spool-*.jsonl"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        return files
+
+    def _write(self, write: Callable[[List[Dict]], int], records: List[Dict]):
+        try:
+            new = write(records)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.last_error = None
+        self.replayed += len(records)
+        self.skipped += len(records) - new
+
+    def _replay_own(self, write: Callable[[List[Dict]], int], batch_size: int) -> int:
+        replayed = 0
+        while True:
+            with self._lock:
+                self._file.seek(self._offset)
+                lines = self._file.readlines()
+            if not lines:
+                break
+            for start in range(0, len(lines), batch_size):
+                chunk = lines[start:start + batch_size]
+                self._write(write, [json.loads(line) for line in chunk])
+                with self._lock:
+                    self._offset += sum(len(line) for line in chunk)
+                    self.pending -= len(chunk)
+                replayed += len(chunk)
+        with self._lock:
+            if self._offset and self._offset == self._file.seek(0, os.SEEK_END):
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+                self._offset = 0
+        return replayed
+
+    def _replay_left_behind(self, path: Path, write: Callable[[List[Dict]], int], batch_size: int) -> int:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0  # still owned by a live process (or being replayed by another one)
+            # complete lines only: a torn last line was never acknowledged
+            records = [json.loads(line) for line in f.read().split(b"\n")[:-1] if line]
+            for start in range(0, len(records), batch_size):
+                self._write(write, records[start:start + batch_size])
+            path.unlink()
+            self._fsync_directory()
+            return len(records)
+
+    def metrics(self) -> Dict:
+        others = [p for p in self.directory.glob("spool-*.jsonl") if p != self.path]
+        return {
+            "path": str(self.path),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "skipped": self.skipped,
+            "pending": self.pending,
+            "other_files": len(others),  # of other workers, or left behind by exited processes
+            "last_error": self.last_error,
+            "last_replay_at": self.last_replay_at,
+        }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -1,6 +1,7 @@
 // Minimal frontend app that interacts with the backend
 // - POST /register to get participant and shuffled samples
-// - POST /submit for each rating
+// - GET /participant/{pid}/samples to resume a participant from a link like /?pid=... (see /register/batch)
+// - POST /submit/batch with all ratings at the end
 
 let APP = {
   participant_id: null,
@@ -15,7 +16,11 @@ async function postJSON(url, body) {
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(body)
   });
-  if (!res.ok) throw new Error(await res.text());
+  if (!res.ok) {
+    const err = new Error(await res.text());
+    err.status = res.status;
+    throw err;
+  }
   return res.json();
 }
 
@@ -24,7 +29,35 @@ async function registerAndLoad() {
   const nameInput = document.getElementById('attendee-name');
   const name = nameInput ? nameInput.value.trim() : '';
   const payload = name ? { name } : {};
-  const res = await postJSON('/register', payload);
+  // a link like /?study=pilot registers the participant in that study
+  const study = new URLSearchParams(window.location.search).get('study');
+  let res;
+  try {
+    res = await postJSON(study ? `/studies/${encodeURIComponent(study)}/register` : '/register', payload);
+  } catch (err) {
+    // 409 {"detail": {"study_full": true, "message": ...}} once the study has all the ratings it needs
+    if (err.status === 409) {
+      const detail = JSON.parse(err.message).detail || {};
+      if (detail.study_full) {
+        const intro = document.getElementById('intro');
+        intro.textContent = '';
+        intro.appendChild(document.createElement('p')).textContent = detail.message;
+        return;
+      }
+    }
+    throw err;
+  }
+  startTask(res);
+}
+
+async function resumeParticipant(pid) {
+  // participants created in bulk (POST /register/batch) open their link and continue here
+  const res = await fetch(`/participant/${encodeURIComponent(pid)}/samples`);
+  if (!res.ok) throw new Error(await res.text());
+  startTask(await res.json());
+}
+
+function startTask(res) {
   APP.participant_id = res.participant_id;
   APP.samples = res.samples;
   APP.index = 0;
@@ -69,16 +102,20 @@ function saveCurrentToLocal() {
 }
 
 async function submitAll() {
-  // submit each response to backend
+  // submit all rated responses to backend in one request
   const pid = APP.participant_id;
+  const ratings = [];
   for (const s of APP.samples) {
     const resp = APP.responses[s.id];
     if (resp && typeof resp.rating === 'number') {
-      try {
-        await postJSON('/submit', { participant_id: pid, sample_id: s.id, rating: resp.rating });
-      } catch (err) {
-        console.error('submit error', err);
-      }
+      ratings.push({ sample_id: s.id, rating: resp.rating });
+    }
+  }
+  if (ratings.length) {
+    try {
+      await postJSON('/submit/batch', { participant_id: pid, ratings });
+    } catch (err) {
+      console.error('submit error', err);
     }
   }
   document.getElementById('task').style.display = 'none';
@@ -89,6 +126,8 @@ async function submitAll() {
 // Wire UI
 window.addEventListener('DOMContentLoaded', () => {
   document.getElementById('start').addEventListener('click', () => registerAndLoad());
+  const pid = new URLSearchParams(window.location.search).get('pid');
+  if (pid) resumeParticipant(pid).catch(err => console.error('resume error', err));
   document.getElementById('next').addEventListener('click', () => {
     saveCurrentToLocal();
     if (APP.index < APP.samples.length - 1) {
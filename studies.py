@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+studies.py
+
+Study registry used by the labeling backend to serve several studies from one process.
+
+A `Study` bundles what used to be process-wide state in `backend.py`: its pool source
+(CSV, JSON or JSON Lines, see sample_pool.py), its per-participant quotas and its loaded
+sample pool versions. Pools are loaded on first use and dropped again once a study has been
+idle for a while, so one fleet can host many studies without keeping every pool resident.
+
+Studies are declared in a JSON file (STUDIES_CONFIG in the backend):
+
+    {"studies": {
+        "mfv130": {"source": "MFV130Gen.csv", "original": 10, "generated": 20},
+        "pilot":  {"source": "pilot.jsonl", "original": 4, "generated": 8, "lazy": true, "set_size": 3}
+    }}
+
+Relative sources are resolved against the config file's directory. Optional keys: `set_size`
+(foundations assigned per participant, default 2), `queue_size` (assignments generated ahead of
+registrations, default 0 = off), `exposure` (prefer samples assigned least so far, default false), `skip_infeasible` (never assign foundation sets
+that need the cross-foundation fallback, default false), `pair_target` / `item_target` (ratings wanted per foundation
+set / per sample: saturated ones are avoided and registration stops once all are met, default 0 = none), `lazy` (POOL_MODE=lazy for this study), `snapshot` (default true)
+and `pinned` (never evicted).
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import sample_pool
+from assignment import ExposureCounts, RatingTargets, SetCounts
+from sample_pool import SamplePool
+
+# Study names appear in URLs and in the participants table
+NAME_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-.")
+
+
+class Study:
+    """One study: pool source, quotas, the pool versions loaded for it and its assignment counts.
+
+    `pool()` returns the current pool, loading it on first use. A pool is immutable and replaced
+    as a whole on reload; the last `history_size` versions stay in memory, and every version is
+    archived as a snapshot (sample_pool.archive_snapshot, in `archive_dir` or next to the source)
+    that `loaded_version` maps again on demand, so participants assigned before a reload, a
+    restart or on another worker still resolve their samples. Lazy pools are not archived.
+    """
+
+    def __init__(self, name: str, source: Path, desired_original: int = 10, desired_generated: int = 20,
+                 use_snapshot: bool = True, lazy: bool = False, cache_size: int = 4096, history_size: int = 4,
+                 pinned: bool = False, set_size: int = 2, queue_size: int = 0,
+                 exposure_balanced: bool = False, skip_infeasible: bool = False, pair_target: int = 0,
+                 item_target: int = 0, archive_dir: Optional[Path] = None):
+        if not name or not set(name) <= NAME_CHARS:
+            raise ValueError(f"invalid study name {name!r} (use letters, digits, '_', '-', '.')")
+        self.name = name
+        self.source = Path(source)
+        self.desired_original = desired_original
+        self.desired_generated = desired_generated
+        # number of foundations assigned to each participant
+        self.set_size = set_size
+        # assignments kept ready for /register by the background producer (0 = generate on each registration);
+        # `prepared` holds them in memory when the database does not (ASSIGNMENT_MODE=memory)
+        self.queue_size = queue_size
+        self.prepared: deque = deque()
+        self.use_snapshot = use_snapshot
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.history_size = history_size
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+        self.pinned = pinned
+        self.last_used = 0.0
+        self._pool: Optional[SamplePool] = None
+        self._last_version: Optional[str] = None  # of the last current pool (kept across evictions)
+        self._versions: "OrderedDict[str, SamplePool]" = OrderedDict()
+        self._source_key = None
+        self._lock = threading.Lock()  # serializes loads/reloads/eviction (readers never take it)
+        # foundation sets assigned so far in this study (seeded from the database on first use)
+        self.counts = SetCounts()
+        # pair_counts keys of the assignable foundation sets by (pool version, set size, skip_infeasible), once the
+        # backend created their rows (ASSIGNMENT_MODE=db)
+        self.pair_keys: Dict[Tuple[str, int, bool], List[str]] = {}
+        # draw samples weighted towards those assigned least so far (per pool version) instead of uniformly
+        self.exposure_balanced = exposure_balanced
+        self._exposures: "OrderedDict[str, ExposureCounts]" = OrderedDict()  # pool version -> counts
+        # leave out foundation sets the pool cannot serve from their own foundations
+        self.skip_infeasible = skip_infeasible
+        # ratings wanted per foundation set and per sample (seeded from the database on first use)
+        self.targets = RatingTargets(pair_target, item_target)
+        self._assignable: Optional[Tuple[str, Tuple[tuple, ...]]] = None  # (pool version, assignable_sets)
+
+    @property
+    def total_per_participant(self) -> int:
+        return self.desired_original + self.desired_generated
+
+    @property
+    def loaded(self) -> bool:
+        return self._pool is not None
+
+    @property
+    def current_pool(self) -> Optional[SamplePool]:
+        """The current pool if loaded, else None; unlike pool() it never loads and does not count as a use."""
+        return self._pool
+
+    def pool(self) -> SamplePool:
+        """Return the current pool, loading it first if the study is not loaded."""
+        self.last_used = time.monotonic()
+        pool = self._pool
+        if pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._source_key = self._stat_source()
+                    self._install(self._read())
+                pool = self._pool
+        return pool
+
+    def pool_for_version(self, version: Optional[str]) -> SamplePool:
+        """Return the pool a participant was assigned from if it can be loaded, else the current pool."""
+        return self.loaded_version(version) or self.pool()
+
+    def has_version(self, version: Optional[str]) -> bool:
+        """Whether the pool with this version is in memory (loaded_version returns it without any I/O)."""
+        return version in self._versions
+
+    def loaded_version(self, version: Optional[str]) -> Optional[SamplePool]:
+        """The pool with this version: in memory, current after loading, or mapped from its archived snapshot;
+        None if it is none of these (no fallback to the current pool)."""
+        pool = self._versions.get(version)
+        if pool is not None or not version:
+            return pool
+        pool = self.pool()
+        if pool.version == version:
+            return pool
+        with self._lock:
+            pool = self._versions.get(version)
+            if pool is None and not self.lazy:
+                pool = sample_pool.load_version(self.source, version, self.archive_dir)
+                if pool is not None:
+                    # an older version: kept in the history without becoming current
+                    self._versions[version] = pool
+                    if self._pool is not None:
+                        self._versions.move_to_end(self._pool.version)
+                    self._trim_versions()
+        return pool
+
+    def exposure(self, pool: SamplePool) -> ExposureCounts:
+        """The per-sample assignment counts for `pool`'s version (fresh, unseeded counts for a new version).
+
+        Kept per version like the pools, so requests still on the previous version around a reload do not reset
+        the current version's counts (or the other way round).
+        """
+        exposure = self._exposures.get(pool.version)
+        if exposure is None:
+            with self._lock:
+                exposure = self._exposures.get(pool.version)
+                if exposure is None:
+                    exposure = self._exposures[pool.version] = ExposureCounts(pool.version)
+        return exposure
+
+    def exposures(self) -> List[Tuple[SamplePool, ExposureCounts]]:
+        """The seeded exposure counts of the versions still in memory, with their pools."""
+        return [(self._versions[version], exposure) for version, exposure in list(self._exposures.items())
+                if exposure.seeded and version in self._versions]
+
+    def excluded_sets(self, pool: SamplePool) -> frozenset:
+        """Foundation sets not to assign from `pool`: with skip_infeasible, those whose registrations would need the
+        cross-foundation fallback (computed once per pool version); empty otherwise."""
+        if not self.skip_infeasible:
+            return frozenset()
+        return pool.infeasible_sets(self.desired_original, self.desired_generated, self.set_size)
+
+    def assignable_sets(self, pool: SamplePool) -> Tuple[tuple, ...]:
+        """The foundation sets registrations may get from `pool` (all sets without study.excluded_sets, unless that
+        excludes every set); computed once per pool version."""
+        cached = self._assignable
+        if cached is not None and cached[0] == pool.version:
+            return cached[1]
+        sets = tuple(combinations(pool.foundations, self.set_size))
+        excluded = self.excluded_sets(pool)
+        sets = tuple(s for s in sets if s not in excluded) or sets
+        self._assignable = (pool.version, sets)
+        return sets
+
+    def full(self, pool: SamplePool) -> bool:
+        """Whether every rating target is met (each assignable set has pair_target ratings, each of the pool's
+        samples item_target), i.e. registration should stop."""
+        targets = self.targets
+        return targets.enabled and targets.full(self.assignable_sets(pool), pool.version, len(pool))
+
+    def validation(self, pool: Optional[SamplePool] = None) -> Dict:
+        """The pool's validation report against this study's quotas (cached on the pool)."""
+        pool = pool or self.pool()
+        return pool.validation(self.desired_original, self.desired_generated, self.set_size)
+
+    def _read(self) -> SamplePool:
+        return sample_pool.load_samples(self.source, use_snapshot=self.use_snapshot, lazy=self.lazy,
+                                        cache_size=self.cache_size)
+
+    def _install(self, pool: SamplePool):
+        """Make `pool` the current pool and remember it by version; logs an unhealthy validation report."""
+        report = self.validation(pool)
+        if not report["ok"]:
+            print(f"WARNING: study {self.name}: sample pool {pool.version}: {len(report['fallback_sets'])} of "
+                  f"{report['foundation_sets']} foundation sets need the fallback, "
+                  f"{report['text']['empty_scenarios']} empty scenarios, "
+                  f"load-time coercions: {report['load_issues'] or 'none'}")
+        if not self.lazy:
+            try:
+                sample_pool.archive_snapshot(self.source, pool, self.archive_dir)
+            except OSError as e:
+                print(f"WARNING: study {self.name}: could not archive sample pool {pool.version}:", e)
+        if self.targets.item_target and self._last_version not in (None, pool.version):
+            # ratings of unchanged samples keep counting, so a reload does not reopen a full study (after an
+            # eviction the replaced version comes from its archive)
+            previous = self._pool
+            if previous is None and not self.lazy:
+                previous = sample_pool.load_version(self.source, self._last_version, self.archive_dir)
+            if previous is not None:
+                self.targets.carry(pool.version, previous.version, *sample_pool.match_samples(previous, pool))
+        self._last_version = pool.version
+        self._versions[pool.version] = pool
+        self._versions.move_to_end(pool.version)
+        self._pool = pool
+        self._trim_versions()
+
+    def _trim_versions(self):
+        while len(self._versions) > max(self.history_size, 1):
+            self._versions.popitem(last=False)
+        for version in [v for v in self._exposures if v not in self._versions]:
+            del self._exposures[version]
+        for key in [k for k in self.pair_keys if k[0] not in self._versions]:
+            del self.pair_keys[key]
+
+    def reload(self) -> bool:
+        """Parse the source into a new pool and swap it in. Returns True if the pool version changed.
+
+        A source that fails to load (or has no samples) leaves the current pool in place. An
+        unloaded study is loaded instead.
+        """
+        with self._lock:
+            key = self._stat_source()
+            try:
+                pool = self._read()
+            except Exception as e:
+                print(f"WARNING: study {self.name}: sample pool reload failed:", e)
+                return False
+            self._source_key = key
+            if self._pool is not None:
+                if pool.version == self._pool.version:
+                    return False
+                if not pool.foundations:
+                    print(f"WARNING: study {self.name}: sample pool reload skipped: new source has no samples")
+                    return False
+            self._install(pool)
+        print(f"Study {self.name}: sample pool version {pool.version}, {len(pool)} samples")
+        return True
+
+    def check_source(self) -> bool:
+        """Reload if the source's size/mtime changed since it was read. Returns True if the pool changed."""
+        if self._pool is None or self._stat_source() in (None, self._source_key):
+            return False
+        return self.reload()
+
+    def evict_if_idle(self, idle_seconds: float, now: Optional[float] = None) -> bool:
+        """Drop the loaded pools if the study was not used for `idle_seconds`. Returns True if evicted.
+
+        Requests that already hold a pool keep using it; the next request loads it again.
+        """
+        if self.pinned or self._pool is None or idle_seconds <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self.last_used < idle_seconds:
+                return False
+            self._pool = None
+            self._versions.clear()
+            # reseeded from the database on next use, which also catches up with other processes
+            self.counts = SetCounts()
+            self._exposures.clear()
+            self.pair_keys.clear()
+            self.prepared.clear()
+        print(f"Study {self.name}: evicted sample pool after {idle_seconds:.0f}s idle")
+        return True
+
+    def _stat_source(self):
+        try:
+            st = self.source.stat()
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def status(self) -> Dict:
+        """Summary for the admin/health endpoints; never loads the pool."""
+        pool = self._pool
+        info = {
+            "study": self.name,
+            "source": str(self.source),
+            "quotas": {"original": self.desired_original, "generated": self.desired_generated},
+            "set_size": self.set_size,
+            "queue_size": self.queue_size,
+            "exposure_balanced": self.exposure_balanced,
+            "skip_infeasible": self.skip_infeasible,
+            "loaded": pool is not None,
+            "pinned": self.pinned,
+        }
+        if pool is not None:
+            info.update(pool_version=pool.version, samples_loaded=len(pool), versions=list(self._versions),
+                        idle_seconds=round(time.monotonic() - self.last_used, 1))
+            if self.skip_infeasible:
+                info.update(excluded_sets=sorted(" + ".join(s) for s in self.excluded_sets(pool)))
+        if self.counts.seeded:
+            info.update(participants=sum(self.counts.counts().values()), count_drift=self.counts.drift)
+        if self.targets.enabled and self.targets.seeded:
+            info.update(targets=self.targets.status(pool.version if pool is not None else None))
+            if pool is not None:
+                info["targets"]["full"] = self.full(pool)
+        exposure = self._exposures.get(pool.version) if pool is not None else None
+        if exposure is not None and exposure.seeded:
+            info.update(exposure=exposure.coverage(len(pool)))
+        return info
+
+
+class StudyRegistry:
+    """The studies served by this process, by name."""
+
+    def __init__(self, studies: Optional[List[Study]] = None):
+        self.studies: Dict[str, Study] = {}
+        for study in studies or []:
+            self.add(study)
+
+    def add(self, study: Study):
+        if study.name in self.studies:
+            raise ValueError(f"duplicate study {study.name!r}")
+        self.studies[study.name] = study
+
+    def get(self, name: str) -> Optional[Study]:
+        return self.studies.get(name)
+
+    def __iter__(self):
+        return iter(list(self.studies.values()))
+
+    def sweep(self, idle_seconds: float):
+        """Reload loaded studies whose source changed and evict the idle ones (run periodically)."""
+        now = time.monotonic()
+        for study in self:
+            if not study.evict_if_idle(idle_seconds, now):
+                study.check_source()
+
+
+def load_config(path: Path, **defaults) -> List[Study]:
+    """Read study definitions from a JSON config file (format: see the module docstring).
+
+    `defaults` (e.g. cache_size, history_size, use_snapshot) apply to every study unless
+    the study's entry overrides them.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    studies = []
+    for name, entry in (config.get("studies") or {}).items():
+        if "source" not in entry:
+            raise ValueError(f"{path}: study {name!r} has no source")
+        options = dict(defaults)
+        for key, option in (("lazy", "lazy"), ("snapshot", "use_snapshot"), ("pinned", "pinned"),
+                            ("exposure", "exposure_balanced"), ("skip_infeasible", "skip_infeasible")):
+            if key in entry:
+                options[option] = bool(entry[key])
+        for key in ("set_size", "queue_size", "pair_target", "item_target"):
+            if key in entry:
+                options[key] = int(entry[key])
+        studies.append(Study(name, path.parent / entry["source"], int(entry.get("original", 10)),
+                             int(entry.get("generated", 20)), **options))
+    return studies
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+write_coalescer.py
+
+Group commit for the backend's rating writes: concurrent callers hand their items to a
+`WriteCoalescer`, which collects them for up to `max_delay` seconds (or until `max_rows` rows are
+pending), writes the whole batch with one call of `write` (one multi-row statement and one commit
+in the backend) and only then resolves each caller's `submit` with its own result.
+
+- `write(items)` gets the batch in arrival order and returns one result per item; a result that is
+  an exception is raised to that item's caller only (e.g. an unknown participant), while an
+  exception raised by `write` itself fails the whole batch, unless `split_on(exception)` is true:
+  then each item of the failed batch is written again on its own, so one bad item (e.g. one that
+  violates a constraint) fails only its own caller.
+- `rows(item)` is an item's weight against `max_rows` (e.g. the number of ratings it carries);
+  an item alone at or above `max_rows` is written right away.
+- Several batches may be written at once (each needs its own database connection).
+- `metrics()` reports flushes (failed and split ones too), items and rows written and the
+  distribution of rows per flush.
+
+Runs on the event loop of the callers (asyncio); `close()` writes what is pending.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class WriteCoalescer:
+    """Collects items from concurrent `submit` calls into batches for `write` (see the module docstring)."""
+
+    def __init__(self, write: Callable[[List[Any]], Awaitable[List[Any]]], max_delay: float, max_rows: int,
+                 rows: Callable[[Any], int] = lambda item: 1,
+                 split_on: Callable[[Exception], bool] = lambda exc: False):
+        self._write = write
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self._rows = rows
+        self._split_on = split_on
+        self._pending: List = []  # (item, future)
+        self._pending_rows = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writing: set = set()
+        # metrics
+        self.flushes = 0
+        self.items = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.split_flushes = 0  # failed flushes retried item by item
+        self.batch_rows: Counter = Counter()  # rows per flush -> flushes
+        self.write_seconds = 0.0
+
+    async def submit(self, item) -> Any:
+        """Queue `item` for the next batch; returns its result once the batch is written (and committed)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self._pending_rows += self._rows(item)
+        if self._pending_rows >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, rows = self._pending, self._pending_rows
+        self._pending, self._pending_rows = [], 0
+        if not batch:
+            return
+        self.flushes += 1
+        self.items += len(batch)
+        self.rows_written += rows
+        self.batch_rows[rows] += 1
+        task = asyncio.ensure_future(self._run(batch))
+        self._writing.add(task)
+        task.add_done_callback(self._writing.discard)
+
+    async def _run(self, batch: List):
+        start = time.monotonic()
+        items = [item for item, _ in batch]
+        try:
+            results = await self._write(items)
+        except Exception as e:
+            self.failed_flushes += 1
+            if len(items) > 1 and self._split_on(e):
+                self.split_flushes += 1
+                results = [await self._write_one(item) for item in items]
+            else:
+                results = [e] * len(batch)
+        finally:
+            self.write_seconds += time.monotonic() - start
+        for (_, future), result in zip(batch, results):
+            if future.done():  # the caller went away; its item was written anyway
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _write_one(self, item) -> Any:
+        try:
+            return (await self._write([item]))[0]
+        except Exception as e:
+            return e
+
+    def metrics(self) -> Dict:
+        histogram = sorted(self.batch_rows.items())
+
+        def percentile(q: float) -> int:
+            seen = 0
+            for rows, flushes in histogram:
+                seen += flushes
+                if seen > q * self.flushes:
+                    return rows
+            return histogram[-1][0] if histogram else 0
+
+        return {
+            "max_delay_ms": self.max_delay * 1e3,
+            "max_rows": self.max_rows,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "split_flushes": self.split_flushes,
+            "items": self.items,
+            "rows": self.rows_written,
+            "pending_rows": self._pending_rows,
+            "rows_per_flush": {
+                "mean": round(self.rows_written / self.flushes, 2) if self.flushes else 0.0,
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+                "max": percentile(1.0),
+                "histogram": {str(rows): flushes for rows, flushes in histogram},
+            },
+            "write_ms_avg": round(self.write_seconds / self.flushes * 1e3, 3) if self.flushes else 0.0,
+        }
+
+    async def close(self):
+        """Write the pending items and wait for the batches being written."""
+        self._flush()
+        if self._writing:
+            await asyncio.gather(*self._writing, return_exceptions=True)